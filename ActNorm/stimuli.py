@@ -84,6 +84,7 @@ class SizeResponseStim():
 
         self.session = session
         self.frequency = self.session.settings['stimuli'].get('frequency')
+        self.stim_duration = self.session.settings['design'].get('stim_duration')
 
         if stim_type == "activation":
             self.contrast_options = self.session.settings['stimuli'].get('contrast_stim')
@@ -194,7 +195,8 @@ class SizeResponseStim():
         
     def draw(self, contrast=None):
 
-        phase = np.fmod(self.session.settings['design'].get('stim_duration')+self.session.timer.getTime(), 1.0/self.frequency) * self.frequency
+        # contrast-reversal state (0 = first, 1 = second half of the cycle)
+        phase = self.session.flicker(self.stim_duration+self.session.timer.getTime())
         
         # contrast options contains 2 contrast types, low (0.6) and high (1)
         if isinstance(contrast, str):
@@ -204,14 +206,14 @@ class SizeResponseStim():
                 select_contrast = self.contrast_options[1]
             
             # update contrast
-            if phase < 0.5:
+            if phase == 0:
                 self.stimulus_1.setColor(select_contrast)
                 self.stimulus_1.draw()
             else:
                 self.stimulus_2.setColor(-select_contrast)        
                 self.stimulus_2.draw()
         else:
-            if phase < 0.5:
+            if phase == 0:
                 self.stimulus_1.draw()
             else:
                 self.stimulus_2.draw()
@@ -1,6 +1,5 @@
 import numpy as np
 from exptools2.core import Trial
-from psychopy.visual import TextStim
 
 class SizeResponseTrial(Trial):
 
@@ -74,7 +73,7 @@ class SizeResponseTrial(Trial):
             if self.session.fix_task != "fix":
                 # switch contrast mid-way
                 self.presentation_time = self.session.timer.getTime()
-                if (self.presentation_time > -self.session.settings['design'].get('stim_duration')/2):
+                if (self.presentation_time > -self.session.cfg.design.stim_duration/2):
                     if self.contrast == 'high':
                         contrast = 'low'
                     elif self.contrast == 'low':
@@ -116,7 +115,7 @@ class SizeResponseTrial(Trial):
 
                     # ignore responses before onset time
                     if hasattr(self, "onset_time"):
-                        if r > (self.onset_time + self.session.settings['design'].get('stim_duration')/2):
+                        if r > (self.onset_time + self.session.cfg.design.stim_duration/2):
                             # contrast high means it starts at low | LOW >> HIGH
                             if self.contrast == "high" and i == 'b':
                                 hits +=1
@@ -146,7 +145,7 @@ class InstructionTrial(Trial):
         if txt is None:
             txt = '''Press any button to continue.'''
 
-        self.text = TextStim(self.session.win, txt, height=txt_height, wrapWidth=txt_width, **kwargs)
+        self.text = self.session.text_pool.get(txt, height=txt_height, wrapWidth=txt_width, **kwargs)
         self.keys = keys
 
     def draw(self):
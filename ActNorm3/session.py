@@ -14,10 +14,29 @@ from trial import (
     ScreenDelimiterTrial,
     OutroTrial)
 from exptools2.core.session import _merge_settings
+from lineexps.fixation import FixationSchedule, switch_times
+from lineexps.flicker import FlickerSchedule
+from lineexps.frames import FrameRecorder
+from lineexps.itis import iterative_itis
+from lineexps.scoring import score_fixation_task
+from lineexps.settings import Default, compile_settings
+from lineexps.state import UpdateCounter
+from lineexps.text import TextPool
 import os
 import yaml
 opj = os.path.join
 
+
+# settings that are read while trials are running
+SETTINGS_SPEC = {
+    "design": {
+        "stim_duration": float},
+    "stimuli": {
+        "frequency": float,
+        "lock_flicker_to_frames": Default(bool, False)},
+    "Task_settings": {
+        "response_interval": float}}
+
 class SizeResponseSession(PylinkEyetrackerSession):
     def __init__(
         self, 
@@ -54,6 +73,21 @@ class SizeResponseSession(PylinkEyetrackerSession):
             output_dir=output_dir, 
             settings_file=settings_file, 
             eyetracker_on=eyetracker_on)  # initialize parent class!
+
+        # record flip times to detect dropped frames
+        self.frames = FrameRecorder(self)
+
+        # settings read during trials; validated here, so a missing/mistyped key fails before the run starts
+        self.cfg = compile_settings(self.settings, SETTINGS_SPEC)
+
+        # text stimuli of instruction/delimiter trials are created once and reused
+        self.text_pool = TextPool(self.win)
+
+        # contrast reversals of the flickering stimuli; optionally locked to frame boundaries
+        self.flicker = FlickerSchedule(
+            self.cfg.stimuli.frequency,
+            refresh_rate=getattr(self, 'actual_framerate', None),
+            lock_to_frames=self.cfg.stimuli.lock_flicker_to_frames)
         
         self.task = task
         self.demo = demo
@@ -92,6 +126,9 @@ class SizeResponseSession(PylinkEyetrackerSession):
         self.isi_file = opj(os.getcwd(), f"itis_task-{self.task}.txt")
         self.stim_ratios = self.settings['stimuli'].get('stim_ratio')
 
+        # keeps track of (suppressed) stimulus updates per trial
+        self.stim_updates = UpdateCounter()
+
         # make activation stimulus
         rad_cycles_per_degree = self.settings['stimuli'].get('rad_cycles_per_degree')
         ang_cycles_per_degree = self.settings['stimuli'].get('ang_cycles_per_degree')
@@ -297,29 +334,20 @@ class SizeResponseSession(PylinkEyetrackerSession):
         self.n_changes = int(self.button_freq*self.button_period)
         print(f"Fixation changes: {self.n_changes} in {self.total_experiment_time+self.dummy_duration}s (freq = {self.button_freq})")
 
-        # initial guess
-        self.dot_switch_color_times = _return_itis(
+        # nominal stimulus onsets (assuming the trigger arrives after the dummy scans); no switches close to these
+        stim_durations = np.full(self.n_trials, self.duration)
+        self.stim_onsets = self.dummy_duration+self.start_duration+np.r_[0, np.cumsum(stim_durations+itis)[:-1]]
+
+        # draw switch times in batches until they fit in the period; bounded, falls back to a fixed total
+        self.dot_switch_color_times = switch_times(
+            self.n_changes,
+            self.button_period,
             mean_duration=self.settings['design'].get('mean_button_duration'),
             minimal_duration=self.settings['design'].get('minimal_button_duration'),
             maximal_duration=self.settings['design'].get('maximal_button_duration'),
-            n_trials=self.n_changes,
-        )       
-        self.total_fix_time = self.dot_switch_color_times.sum()
-
-        # force ITIs to be within time span
-        while self.total_fix_time > self.button_period: 
-            self.dot_switch_color_times = _return_itis(
-                mean_duration=self.settings['design'].get('mean_button_duration'),
-                minimal_duration=self.settings['design'].get('minimal_button_duration'),
-                maximal_duration=self.settings['design'].get('maximal_button_duration'),
-                n_trials=self.n_changes,
-            )
-            
-            self.total_fix_time = self.dot_switch_color_times.sum()
-
-        # cumsum together
-        self.dot_switch_color_times = np.cumsum(self.dot_switch_color_times)
-        self.actual_dot_switch_color_times = []        
+            avoid=self.stim_onsets,
+            min_spacing=self.settings['design'].get('min_button_onset_spacing', 0),
+            verbose=True)
         
         # insert delimiter trial if requested
         if self.screen_delimit_trial:
@@ -345,13 +373,14 @@ class SizeResponseSession(PylinkEyetrackerSession):
                 timing='seconds',
                 verbose=True))
 
-        # needed to keep track of which dot to print
-        self.correct_responses = 0
-        self.total_responses = 0        
-        self.dot_count = 0
+        # times of button presses; scored against the colour switches after the run
+        self.response_times = []
 
-        self.current_dot_time = 0
-        self.next_dot_time = 1
+        # colour of the fixation dot at any time; disk_1 before the first switch, then alternating. The disks only
+        # exist for the fixation task
+        self.fixation_schedule = None
+        if self.fix_task == "fix":
+            self.fixation_schedule = FixationSchedule(self.dot_switch_color_times, states=[self.fixation_disk_1, self.fixation_disk_0])
 
         outro_trial = OutroTrial(
             session=self,
@@ -364,29 +393,8 @@ class SizeResponseSession(PylinkEyetrackerSession):
 
     def change_fixation(self):
         
-        if self.fix_task in ["fix","both"]:
-            present_time = self.clock.getTime()
-
-            #hacky way to draw the correct dot color. could be improved
-            if self.next_dot_time<len(self.dot_switch_color_times):
-                if present_time<self.dot_switch_color_times[self.current_dot_time]:                
-                    self.fixation_disk_1.draw()
-                else:
-                    if present_time<self.dot_switch_color_times[self.next_dot_time]:
-                        self.fixation_disk_0.draw()
-                    else:
-                        self.current_dot_time+=2
-                        self.next_dot_time+=2
-            else:
-                # deal with ending; final dot depends on whether number of presses is odd/even
-                if present_time>self.dot_switch_color_times[-1]:
-                    if (len(self.dot_switch_color_times) % 2) == 0:  
-                        self.fixation_disk_1.draw()
-                    else:
-                        self.fixation_disk_0.draw()
-                else:
-                    self.fixation_disk_1.draw()
-
+        if self.fixation_schedule is not None:
+            self.fixation_schedule(self.clock.getTime()).draw()
         else:
             self.fixation.draw()
 
@@ -420,9 +428,23 @@ class SizeResponseSession(PylinkEyetrackerSession):
         if self.eyetracker_on:
             self.start_recording_eyetracker()
         for trial in self.trials:
+            self.current_trial = trial
+            self.stim_updates.start_trial(trial.trial_nr)
             trial.run()
 
-        logging.warn(f"Performance FIXATION task:\t{round((self.correct_responses/self.n_changes)*100,2)}% ({self.correct_responses}/{self.n_changes} [resp interval = {self.settings['Task_settings']['response_interval']}s])")
+        # number of pushed/suppressed stimulus updates per trial
+        print(self.stim_updates.summary())
+        self.stim_updates.write(opj(self.output_dir, self.output_str+'_desc-stimupdates.tsv'))
+
+        # match all responses to all colour switches at once
+        if self.fixation_schedule is not None:
+            score = score_fixation_task(
+                self.fixation_schedule, 
+                self.response_times, 
+                self.cfg.task_settings.response_interval,
+                fname=opj(self.output_dir, self.output_str+'_desc-fixationtask.tsv'))
+
+            logging.warn(f"Performance FIXATION task:\t{round(score['hit_rate']*100,2)}% ({int(score['hits'])}/{int(score['n_switches'])} [resp interval = {self.cfg.task_settings.response_interval}s]) | false alarms = {int(score['false_alarms'])} | median RT = {round(score['rt_median'],3)}s")
 
         self.add_settings = {"screen_delim": self.cut_pixels}
 
@@ -430,9 +452,10 @@ class SizeResponseSession(PylinkEyetrackerSession):
         _merge_settings(self.settings, self.add_settings)
 
         # save logged switch times
-        if len(self.actual_dot_switch_color_times)>0:
-            np.save(opj(self.output_dir, self.output_str+'_DotSwitchColorTimes.npy'), np.array(self.
-            actual_dot_switch_color_times))
+        if self.fixation_schedule is not None:
+            shown_times = self.fixation_schedule.shown_times[~np.isnan(self.fixation_schedule.shown_times)]
+            if len(shown_times)>0:
+                np.save(opj(self.output_dir, self.output_str+'_DotSwitchColorTimes.npy'), shown_times)
 
         settings_out = opj(self.output_dir, self.output_str + '_expsettings.yml')
         with open(settings_out, 'w') as f_out:
@@ -440,6 +463,13 @@ class SizeResponseSession(PylinkEyetrackerSession):
 
         self.close()
 
+    def close(self):
+        """ Write the recorded flip times (and dropped frames per trial) and fixation switches before closing the session """
+        self.frames.save(opj(self.output_dir, self.output_str+'_frames.npz'))
+        if self.fixation_schedule is not None:
+            self.fixation_schedule.save(opj(self.output_dir, self.output_str+'_desc-fixationswitches.tsv'))
+        super().close()
+
 def string2float(string_array):
     """string2float
     This function converts a array in string representation to a regular float array. This can happen, for instance, when you've stored a numpy array in a pandas dataframe (such is the case with the 'normal' vector). It starts by splitting based on empty spaces, filter these, and convert any remaining elements to floats and returns these in an array.
@@ -468,35 +498,3 @@ def string2float(string_array):
     else:
         # array is already in non-string format
         return string_array
-
-# iti function based on negative exponential
-def _return_itis(mean_duration, minimal_duration, maximal_duration, n_trials):
-    itis = np.random.exponential(scale=mean_duration-minimal_duration, size=n_trials)
-    itis += minimal_duration
-    itis[itis>maximal_duration] = maximal_duration
-    return itis
-
-def iterative_itis(mean_duration=6, minimal_duration=3, maximal_duration=18, n_trials=None, leeway=0, verbose=False):
-    
-    nits = 0
-    itis = _return_itis(
-        mean_duration=mean_duration,
-        minimal_duration=minimal_duration,
-        maximal_duration=maximal_duration,
-        n_trials=n_trials)
-
-    total_iti_duration = n_trials * mean_duration
-    min_iti_duration = total_iti_duration - leeway
-    max_iti_duration = total_iti_duration + leeway
-    while (itis.sum() < min_iti_duration) | (itis.sum() > max_iti_duration):
-        itis = _return_itis(
-            mean_duration=mean_duration,
-            minimal_duration=minimal_duration,
-            maximal_duration=maximal_duration,
-            n_trials=n_trials)
-        nits += 1
-
-    if verbose:
-        print(f'ITIs created with total ITI duration of {round(itis.sum(),2)}s after {nits} iterations')    
-
-    return itis
@@ -1,4 +1,3 @@
-import numpy as np
 from psychopy.visual import (
     RadialStim, 
     Circle,
@@ -7,6 +6,7 @@ from psychopy.visual import (
     ShapeStim,
     filters)
 from psychopy import visual
+from lineexps.state import StimState
 
 class FixationCross(object):
 
@@ -97,7 +97,8 @@ class SizeResponseStim():
         **kwargs):
 
         self.session = session
-        self.frequency = self.session.settings['stimuli'].get('frequency')
+        self.frequency = self.session.cfg.stimuli.frequency
+        self.stim_duration = self.session.cfg.design.stim_duration
 
         # black and white stimulus
         self.stimulus_1 = RadialStim(
@@ -122,10 +123,15 @@ class SizeResponseStim():
             color=-1,
             *args,
             **kwargs)
+
+        # only push color changes when the contrast actually changes
+        self.stimulus_1 = StimState(self.stimulus_1, counter=self.session.stim_updates)
+        self.stimulus_2 = StimState(self.stimulus_2, counter=self.session.stim_updates)
         
     def draw(self, contrast=None):
 
-        phase = np.fmod(self.session.settings['design'].get('stim_duration')+self.session.timer.getTime(), 1.0/self.frequency) * self.frequency
+        # contrast-reversal state (0 = first, 1 = second half of the cycle)
+        phase = self.session.flicker(self.stim_duration+self.session.timer.getTime())
         
         # contrast options contains 2 contrast types, low (0.6) and high (1)
         if isinstance(contrast, str):
@@ -135,14 +141,14 @@ class SizeResponseStim():
                 select_contrast = self.contrast_options[1]
             
             # update contrast
-            if phase < 0.5:
+            if phase == 0:
                 self.stimulus_1.setColor(select_contrast)
                 self.stimulus_1.draw()
             else:
                 self.stimulus_2.setColor(-select_contrast)        
                 self.stimulus_2.draw()
         else:
-            if phase < 0.5:
+            if phase == 0:
                 self.stimulus_1.draw()
             else:
                 self.stimulus_2.draw()
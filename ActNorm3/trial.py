@@ -1,6 +1,5 @@
 import numpy as np
 from exptools2.core import Trial
-from psychopy.visual import TextStim
 import os
 from psychopy import tools
 p2d = tools.monitorunittools.pix2deg
@@ -80,7 +79,7 @@ class SizeResponseTrial(Trial):
             if self.session.fix_task != "fix":
                 # switch contrast mid-way
                 self.presentation_time = self.session.timer.getTime()
-                if (self.presentation_time > -self.session.settings['design'].get('stim_duration')/2):
+                if (self.presentation_time > -self.session.cfg.design.stim_duration/2):
                     if self.contrast == 'high':
                         contrast = 'low'
                     elif self.contrast == 'low':
@@ -116,23 +115,8 @@ class SizeResponseTrial(Trial):
 
                 if i != "t":
                     
-                    self.session.total_responses += 1
-                    #tracking percentage of correct responses per session
-                    if self.session.dot_count <= len(self.session.dot_switch_color_times): 
-                        print(f"\tResponse: {r}")
-                        if r > self.session.dot_switch_color_times[self.session.dot_count-1] and \
-                            r < self.session.dot_switch_color_times[self.session.dot_count-1] + float(self.session.settings['Task_settings']['response_interval']):
-                            self.session.correct_responses +=1 
-                            print(f'\tFIXATION TASK | #correct {self.session.correct_responses}') #testing
-
-        # update counter
-        if self.session.fix_task in ["fix","both"]:
-            if self.session.dot_count < len(self.session.dot_switch_color_times): 
-                switch_time = self.session.clock.getTime()
-                if switch_time > self.session.dot_switch_color_times[self.session.dot_count]:
-                    self.session.dot_count += 1   
-                    print(f'\tSWITCH COLOR: {switch_time}') #testing
-                    self.session.actual_dot_switch_color_times.append(switch_time)
+                    # responses are scored after the run
+                    self.session.response_times.append(r)
 
 class ScreenDelimiterTrial(Trial):
 
@@ -184,8 +168,7 @@ Tell the experimenter when you see a vertical line on the screen"""
             self.session.delim.line1.start = self.start_pos 
             self.session.delim.line1.end = (self.start_pos[0],self.session.win.size[1])     
 
-        self.text = TextStim(
-            self.session.win, 
+        self.text = self.session.text_pool.get(
             txt, 
             height=self.txt_height, 
             wrapWidth=self.txt_width, 
@@ -265,8 +248,7 @@ class InstructionTrial(Trial):
         if txt is None:
             txt = '''Press any button to continue.'''
 
-        self.text = TextStim(
-            self.session.win, 
+        self.text = self.session.text_pool.get(
             txt, 
             height=txt_height, 
             wrapWidth=txt_width
@@ -331,24 +313,8 @@ class DummyWaiterTrial(InstructionTrial):
                 else:
                     if key != "t":
                         
-                        self.session.total_responses += 1
-
-                        #tracking percentage of correct responses per session
-                        if self.session.dot_count <= len(self.session.dot_switch_color_times): 
-                            print(f"\tResponse: {r}")
-                            if r > self.session.dot_switch_color_times[self.session.dot_count-1] and \
-                                r < self.session.dot_switch_color_times[self.session.dot_count-1] + float(self.session.settings['Task_settings']['response_interval']):
-                                self.session.correct_responses +=1 
-                                print(f'\tFIXATION TASK | #correct {self.session.correct_responses}') #testing
-
-        # update counter
-        if self.session.fix_task in ["fix","both"]:
-            if self.session.dot_count < len(self.session.dot_switch_color_times): 
-                switch_time = self.session.clock.getTime()
-                if switch_time > self.session.dot_switch_color_times[self.session.dot_count]:
-                    self.session.dot_count += 1   
-                    print(f'\tSWITCH COLOR: {switch_time}') #testing
-                    self.session.actual_dot_switch_color_times.append(switch_time)
+                        # responses are scored after the run
+                        self.session.response_times.append(r)
 
 class OutroTrial(InstructionTrial):
     """ Simple trial with only fixation cross.  """
@@ -372,21 +338,5 @@ class OutroTrial(InstructionTrial):
                 else:
                     if key != "t":
                         
-                        self.session.total_responses += 1
-
-                        #tracking percentage of correct responses per session
-                        if self.session.dot_count <= len(self.session.dot_switch_color_times): 
-                            print(f"\tResponse: {r}")
-                            if r > self.session.dot_switch_color_times[self.session.dot_count-1] and \
-                                r < self.session.dot_switch_color_times[self.session.dot_count-1] + float(self.session.settings['Task_settings']['response_interval']):
-                                self.session.correct_responses +=1 
-                                print(f'\tFIXATION TASK | #correct {self.session.correct_responses}') #testing
-
-        # update counter
-        if self.session.fix_task in ["fix","both"]:
-            if self.session.dot_count < len(self.session.dot_switch_color_times): 
-                switch_time = self.session.clock.getTime()
-                if switch_time > self.session.dot_switch_color_times[self.session.dot_count]:
-                    self.session.dot_count += 1   
-                    print(f'\tSWITCH COLOR: {switch_time}') #testing
-                    self.session.actual_dot_switch_color_times.append(switch_time)
+                        # responses are scored after the run
+                        self.session.response_times.append(r)
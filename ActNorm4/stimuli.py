@@ -1,4 +1,3 @@
-import numpy as np
 from psychopy.visual import (
     RadialStim, 
     Circle,
@@ -7,6 +6,7 @@ from psychopy.visual import (
     ShapeStim,
     filters)
 from psychopy import visual
+from lineexps.state import StimState
 
 class FixationCross(object):
 
@@ -102,7 +102,7 @@ class SizeResponseStim():
 
         self.session = session
         self.duration = duration
-        self.frequency = self.session.settings['stimuli'].get('frequency')
+        self.frequency = self.session.cfg.stimuli.frequency
 
         # black and white stimulus
         self.stimulus_1 = RadialStim(
@@ -127,10 +127,15 @@ class SizeResponseStim():
             color=-1,
             *args,
             **kwargs)
+
+        # only push color changes when the contrast actually changes
+        self.stimulus_1 = StimState(self.stimulus_1, counter=self.session.stim_updates)
+        self.stimulus_2 = StimState(self.stimulus_2, counter=self.session.stim_updates)
         
     def draw(self, contrast=None):
 
-        phase = np.fmod(self.duration+self.session.timer.getTime(), 1.0/self.frequency) * self.frequency
+        # contrast-reversal state (0 = first, 1 = second half of the cycle)
+        phase = self.session.flicker(self.duration+self.session.timer.getTime())
         
         # contrast options contains 2 contrast types, low (0.6) and high (1)
         if isinstance(contrast, str):
@@ -140,14 +145,14 @@ class SizeResponseStim():
                 select_contrast = self.contrast_options[1]
             
             # update contrast
-            if phase < 0.5:
+            if phase == 0:
                 self.stimulus_1.setColor(select_contrast)
                 self.stimulus_1.draw()
             else:
                 self.stimulus_2.setColor(-select_contrast)        
                 self.stimulus_2.draw()
         else:
-            if phase < 0.5:
+            if phase == 0:
                 self.stimulus_1.draw()
             else:
                 self.stimulus_2.draw()
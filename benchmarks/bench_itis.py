@@ -0,0 +1,97 @@
+import getopt
+import numpy as np
+import os
+import sys
+import time
+opd = os.path.dirname
+sys.path.insert(0, opd(opd(os.path.abspath(__file__))))
+
+from lineexps.itis import iterative_itis, iti_report, return_itis
+
+def rejection_loop(mean_duration, minimal_duration, maximal_duration, n_trials, leeway, timeout):
+    """ The loop the sessions used before: redraw until the total is within `leeway`; gives up after `timeout` s """
+    total = n_trials*mean_duration
+    start = time.perf_counter()
+    nits = 0
+    itis = return_itis(mean_duration, minimal_duration, maximal_duration, n_trials)
+    while (itis.sum() < total-leeway) | (itis.sum() > total+leeway):
+        if time.perf_counter()-start > timeout:
+            return None, nits
+
+        itis = return_itis(mean_duration, minimal_duration, maximal_duration, n_trials)
+        nits += 1
+
+    return itis, nits
+
+def main(argv):
+
+    """bench_itis.py
+
+    Time of drawing ITIs with a total within `leeway` of `n_trials*mean`, over a grid of numbers of trials and leeways.
+    The original loop (redraw until the total fits, given up after `--timeout` seconds) is compared with
+    `lineexps.itis.iterative_itis` (batched rejection, or sampling conditional on the total). For the new sampler, the
+    ITIs of all repetitions are pooled and compared with the truncated exponential (KS test).
+
+    Parameters
+    ----------
+    -n|--trials <list>      numbers of trials [default = 16,32,64,128,256]
+    -l|--leeway <list>      leeways in s [default = 0,0.5,2,8]
+    -r|--reps <n>           repetitions per cell [default = 5]
+    -t|--timeout <s>        time after which the original loop is given up [default = 2]
+    -q|--help               bring up this help text
+
+    Example
+    ----------
+    >>> python benchmarks/bench_itis.py
+    >>> python benchmarks/bench_itis.py --trials 32,512 --leeway 0.1,2 --timeout 10
+    """
+
+    n_trials    = [16,32,64,128,256]
+    leeways     = [0,0.5,2,8]
+    n_reps      = 5
+    timeout     = 2
+    mean_duration, minimal_duration, maximal_duration = 6, 3, 18
+
+    try:
+        opts = getopt.getopt(argv,"qn:l:r:t:",["help", "trials=", "leeway=", "reps=", "timeout="])[0]
+    except getopt.GetoptError:
+        print("ERROR while handling arguments.. Did you specify an 'illegal' argument..?")
+        print(main.__doc__)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ('-q', '--help'):
+            print(main.__doc__)
+            sys.exit()
+        elif opt in ("-n", "--trials"):
+            n_trials = [int(i) for i in arg.split(",")]
+        elif opt in ("-l", "--leeway"):
+            leeways = [float(i) for i in arg.split(",")]
+        elif opt in ("-r", "--reps"):
+            n_reps = int(arg)
+        elif opt in ("-t", "--timeout"):
+            timeout = float(arg)
+
+    print(f"ITIs: mean = {mean_duration}s, min = {minimal_duration}s, max = {maximal_duration}s; {n_reps} repetitions per cell")
+    for n in n_trials:
+        for leeway in leeways:
+            loop_times, n_timeouts = [], 0
+            for _ in range(n_reps):
+                start = time.perf_counter()
+                itis, _ = rejection_loop(mean_duration, minimal_duration, maximal_duration, n, leeway, timeout)
+                loop_times.append(time.perf_counter()-start)
+                n_timeouts += itis is None
+
+            new_times, pooled = [], []
+            for _ in range(n_reps):
+                start = time.perf_counter()
+                itis = iterative_itis(mean_duration, minimal_duration, maximal_duration, n, leeway=leeway)
+                new_times.append(time.perf_counter()-start)
+                assert abs(itis.sum()-n*mean_duration) <= leeway+1e-6
+                pooled.append(itis)
+
+            loop = f"{np.mean(loop_times)*1000:9.2f}ms" + (f" ({n_timeouts}/{n_reps} > {timeout}s)" if n_timeouts else "")
+            print(f"n = {n:4d}, leeway = {leeway:5.2f}s | loop: {loop:<22} | sampler: {np.mean(new_times)*1000:7.2f}ms, {iti_report(np.concatenate(pooled), mean_duration, minimal_duration, maximal_duration)}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,142 @@
+import gc
+import getopt
+import numpy as np
+import os
+import sys
+import time
+import tracemalloc
+opd = os.path.dirname
+sys.path.insert(0, opd(opd(os.path.abspath(__file__))))
+
+from lineexps.designs import CONDITIONS, compile_bar_design
+from lineexps.trials import LazyTrials
+
+try:
+    from exptools2.core import Trial
+except ImportError:
+    Trial = None
+
+class PlainTrial(object):
+    """ The per-trial state of an exptools2 Trial (used if exptools2 is not installed) """
+    def __init__(self, session, trial_nr, phase_durations, phase_names=None, parameters=None, timing='seconds', load_next_during_phase=None, verbose=True):
+        self.session                = session
+        self.trial_nr               = trial_nr
+        self.phase_durations        = list(phase_durations)
+        self.phase_names            = ["stim_"+str(i) for i in range(len(phase_durations))] if phase_names is None else phase_names
+        self.parameters             = dict() if parameters is None else parameters
+        self.timing                 = timing
+        self.load_next_during_phase = load_next_during_phase
+        self.verbose                = verbose
+        self.start_trial            = None
+        self.exit_phase             = False
+        self.exit_trial             = False
+        self.n_phase                = len(phase_durations)
+        self.phase                  = 0
+        self.last_resp              = None
+        self.last_resp_onset        = None
+
+def make_factory(design, trial_class, first_trial_nr=3):
+    """ `pRFSession.make_trial` without a session: one trial per record of the design """
+    def make_trial(i):
+        rec = design[i]
+        trial = trial_class(
+            None,
+            first_trial_nr+i,
+            phase_durations=[0.25],
+            phase_names=['stim'],
+            parameters={'condition': CONDITIONS[rec["condition"]], 'fix_color_changetime': int(rec["fix_change"])},
+            timing='seconds',
+            load_next_during_phase=0,
+            verbose=False)
+
+        # attributes of pRFTrial; the bar is looked up in `prepare`, during the previous trial
+        trial.design_index = i
+        trial.position = None
+        trial.orientation = None
+        trial.stimulus = None
+        return trial
+
+    return make_trial
+
+def run_eager(make_trial, n_trials):
+    """ Create all trials, then go through them; returns the startup time and the peak memory """
+    tracemalloc.start()
+    start = time.perf_counter()
+    trials = [make_trial(i) for i in range(n_trials)]
+    startup = time.perf_counter()-start
+    for trial in trials:
+        trial.phase = 1
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return startup, peak, None
+
+def run_lazy(make_trial, n_trials, first_trial_nr=3):
+    """ Go through a LazyTrials, creating the next trial while the current one 'runs' (like TrialPrefetcher) """
+    tracemalloc.start()
+    start = time.perf_counter()
+    trials = LazyTrials(make_trial, n_trials, first_trial_nr=first_trial_nr)
+    startup = time.perf_counter()-start
+    create_times = np.zeros(n_trials)
+    for ix, trial in enumerate(trials):
+        trial.phase = 1
+        start = time.perf_counter()
+        trials.find(trial.trial_nr+1)
+        create_times[ix] = time.perf_counter()-start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return startup, peak, (create_times, trials.max_alive)
+
+def main(argv):
+
+    """bench_lazy_trials.py
+
+    Startup time and peak memory of the trials of lineprf, for an increasing number of repetitions of the design:
+    all trials created before the run ("eager"), against `lineexps.trials.LazyTrials` ("lazy"; each trial created
+    during the previous one, and released afterwards). For the lazy sequence, the time to create a trial (which is
+    spent during the previous trial) and the number of trials alive at once are reported too. Uses exptools2's Trial
+    if it's installed, otherwise plain objects with the same per-trial state. Memory is measured with tracemalloc and
+    excludes the compiled design.
+
+    Parameters
+    ----------
+    -r|--reps <list>        values of stim_repetitions [default = 1,4,16,64]
+    -q|--help               bring up this help text
+
+    Example
+    ----------
+    >>> python benchmarks/bench_lazy_trials.py
+    >>> python benchmarks/bench_lazy_trials.py --reps 1,128
+    """
+
+    repetitions = [1,4,16,64]
+
+    try:
+        opts = getopt.getopt(argv,"qr:",["help", "reps="])[0]
+    except getopt.GetoptError:
+        print("ERROR while handling arguments.. Did you specify an 'illegal' argument..?")
+        print(main.__doc__)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ('-q', '--help'):
+            print(main.__doc__)
+            sys.exit()
+        elif opt in ("-r", "--reps"):
+            repetitions = [int(i) for i in arg.split(",")]
+
+    trial_class = PlainTrial if Trial is None else Trial
+    print(f"Trials: {trial_class.__module__}.{trial_class.__name__}")
+
+    mb = lambda x: f"{x/1024**2:7.2f}MB"
+    for reps in repetitions:
+        design = compile_bar_design(60, [-7,7], 0.25, 20, 15, reps, 0.05, 2, [24.6, 49.2])
+        make_trial = make_factory(design, trial_class)
+
+        gc.collect()
+        eager_startup, eager_peak, _ = run_eager(make_trial, len(design))
+        gc.collect()
+        lazy_startup, lazy_peak, (create_times, max_alive) = run_lazy(make_trial, len(design))
+        print(f"reps = {reps:3d}, {len(design):6d} trials | eager: startup {eager_startup*1000:8.2f}ms, peak {mb(eager_peak)} | lazy: startup {lazy_startup*1000:5.3f}ms, peak {mb(lazy_peak)}, create {create_times.mean()*1e6:.1f}us/trial (max {create_times.max()*1e6:.1f}us), {max_alive} alive")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,149 @@
+import getopt
+import numpy as np
+import os
+import sys
+import tempfile
+import time
+opd = os.path.dirname
+sys.path.insert(0, opd(opd(os.path.abspath(__file__))))
+
+from lineexps.designs import DesignCache, compile_bar_design
+
+def legacy_design(bar_steps, span_locations, stim_duration, start_duration, inter_sweep_blank, stim_repetitions, fix_change_prob, thick_bar_scalar, bar_widths_pix, center_pix=(0,0)):
+    """ `pRFSession.create_design` and the per-trial loop of `create_trials` as they were, without PsychoPy """
+
+    locations = np.linspace(*span_locations, bar_steps)
+    baseline = np.full(int(start_duration//stim_duration), -1)
+    two_bar_pass_design = np.r_[np.arange(0,len(locations)), np.full(int(inter_sweep_blank//stim_duration), -1), np.arange(0,len(locations))].flatten()
+    rest = np.full(int(inter_sweep_blank//stim_duration), -1)
+    block_design = np.r_[two_bar_pass_design, rest, two_bar_pass_design].astype(int)
+    part_design = np.r_[block_design, rest, block_design[::-1], rest].astype(int)
+    full_design = np.r_[[part_design for i in range(stim_repetitions)]].flatten().astype(int)
+    full_design = np.concatenate((baseline, full_design))
+
+    thin = list(np.zeros_like(two_bar_pass_design))
+    thick = list(np.ones_like(two_bar_pass_design))
+    bar_rest = np.full(len(rest), 2)
+    thin_thick = np.r_[thin, bar_rest, thick, bar_rest, thin, bar_rest, thick, bar_rest].flatten().astype(int)
+    thin_thick = np.r_[[thin_thick for i in range(stim_repetitions)]].flatten().astype(int)
+    thin_thick = np.concatenate((baseline*-2, thin_thick))
+
+    oris = np.r_[np.zeros(len(locations)), np.full(int(inter_sweep_blank/stim_duration), 2), np.ones(len(locations))]
+    oris_block = np.r_[oris, np.full(len(rest),2), oris].flatten().astype(int)
+    oris_part = np.r_[oris_block, rest, oris_block, rest].astype(int)
+    oris_full = np.r_[[oris_part for i in range(stim_repetitions)]].flatten().astype(int)
+    oris_full = np.concatenate((baseline, oris_full))
+    n_trials = len(oris_full)
+
+    change_fixation = np.zeros_like(full_design)
+    interval = int(len(change_fixation)/(len(full_design)*fix_change_prob))
+    change_fixation[::interval] = 1
+
+    trials = []
+    for i in range(n_trials):
+        cond = ['horizontal', 'vertical', 'blank'][oris_full[i]]
+        if cond != "blank":
+            pos_step = locations[full_design[i]]
+            orientation = 0 if cond == "vertical" else 90
+            bar = ['thin', 'thick', 'rest'][thin_thick[i]]
+            if bar == "thick":
+                pos_step /= thick_bar_scalar
+                width = bar_widths_pix[1]
+            else:
+                width = bar_widths_pix[0]
+
+            if cond == "horizontal":
+                position = [center_pix[0], center_pix[1]+width*pos_step]
+            else:
+                position = [center_pix[0]+width*pos_step, center_pix[1]]
+        else:
+            position, orientation, bar = 0, 0, None
+
+        trials.append((cond, bar, position, orientation, change_fixation[i]))
+
+    return trials
+
+def same_trials(legacy, design):
+    """ True if the compiled design gives every trial the same condition, bar, position, orientation and fixation change """
+    if len(legacy) != len(design):
+        return False
+
+    conditions = np.array(["horizontal", "vertical", "blank"])[design["condition"]]
+    for (cond, bar, position, orientation, change), rec, rec_cond in zip(legacy, design, conditions):
+        if cond != rec_cond or bool(change) != bool(rec["fix_change"]):
+            return False
+
+        if cond != "blank":
+            if bar != ["thin", "thick"][rec["bar_type"]] or orientation != rec["orientation"]:
+                return False
+            if not np.allclose(position, [rec["pos_x"], rec["pos_y"]]):
+                return False
+
+    return True
+
+def main(argv):
+
+    """bench_lineprf_design.py
+
+    Time to build the lineprf design: the chained `np.r_`-calls of `create_design` plus the per-trial loop of
+    `create_trials` ("legacy"), against `lineexps.designs.compile_bar_design` and a `DesignCache` hit. Every cell of
+    the grid (repetitions x bar steps) is also checked for identical trials.
+
+    Parameters
+    ----------
+    -r|--reps <list>        values of stim_repetitions [default = 1,4,16,64]
+    -s|--steps <list>       values of bar_steps [default = 20,60,200]
+    -n|--n_times <n>        timings per cell (best is reported) [default = 3]
+    -q|--help               bring up this help text
+
+    Example
+    ----------
+    >>> python benchmarks/bench_lineprf_design.py
+    >>> python benchmarks/bench_lineprf_design.py --reps 128 --steps 60
+    """
+
+    repetitions = [1,4,16,64]
+    bar_steps   = [20,60,200]
+    n_times     = 3
+
+    try:
+        opts = getopt.getopt(argv,"qr:s:n:",["help", "reps=", "steps=", "n_times="])[0]
+    except getopt.GetoptError:
+        print("ERROR while handling arguments.. Did you specify an 'illegal' argument..?")
+        print(main.__doc__)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ('-q', '--help'):
+            print(main.__doc__)
+            sys.exit()
+        elif opt in ("-r", "--reps"):
+            repetitions = [int(i) for i in arg.split(",")]
+        elif opt in ("-s", "--steps"):
+            bar_steps = [int(i) for i in arg.split(",")]
+        elif opt in ("-n", "--n_times"):
+            n_times = int(arg)
+
+    def best_of(func):
+        times = []
+        for _ in range(n_times):
+            start = time.perf_counter()
+            out = func()
+            times.append(time.perf_counter()-start)
+        return out, min(times)*1000
+
+    # settings of lineprf; bar widths of 0.625 and 1.25 deg on the 7T screen
+    fixed = {"span_locations": [-7,7], "stim_duration": 0.25, "start_duration": 20, "inter_sweep_blank": 15, "fix_change_prob": 0.05, "thick_bar_scalar": 2, "bar_widths_pix": [24.6, 49.2], "center_pix": [31.2, -12.4]}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = DesignCache(cache_dir=tmp_dir)
+        for reps in repetitions:
+            for steps in bar_steps:
+                params = dict(fixed, bar_steps=steps, stim_repetitions=reps)
+                legacy, t_legacy = best_of(lambda: legacy_design(**params))
+                design, t_compile = best_of(lambda: compile_bar_design(**params))
+                cache.get_bar_design(**params)
+                _, t_cache = best_of(lambda: cache.get_bar_design(**params))
+                print(f"reps = {reps:3d}, steps = {steps:3d}, {len(design):6d} trials | legacy: {t_legacy:8.2f}ms | compile: {t_compile:6.2f}ms | cached: {t_cache:5.2f}ms | identical: {same_trials(legacy, design)}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
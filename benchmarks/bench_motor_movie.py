@@ -0,0 +1,149 @@
+import getopt
+import numpy as np
+import os
+import sys
+import tempfile
+import time
+opd = os.path.dirname
+sys.path.insert(0, opd(opd(os.path.abspath(__file__))))
+
+from lineexps.movies import FrameCache, FrameMovie
+
+def make_test_clip(fname, size=(1280,720), fps=30, duration=5):
+    """ Write a synthetic clip (moving gradient with noise, so it doesn't compress to nothing) """
+    import imageio
+
+    width, height = size
+    x = np.linspace(0, 4*np.pi, width)[np.newaxis,:]
+    y = np.linspace(0, 2*np.pi, height)[:,np.newaxis]
+    with imageio.get_writer(fname, fps=fps) as writer:
+        for ix in range(int(fps*duration)):
+            lum = 127.5+100*np.sin(x+y+ix/fps*2*np.pi)+np.random.randint(-20, 20, (height, width))
+            frame = np.clip(np.repeat(lum[...,np.newaxis], 3, axis=2), 0, 255).astype(np.uint8)
+            writer.append_data(frame)
+
+def summarize(name, times, period=None):
+    """ Mean/max time per frame (and frames over 1.5 refresh periods if `period` is given) """
+    txt = f"{name:>24}: mean = {times.mean()*1000:.2f}ms, max = {times.max()*1000:.2f}ms"
+    if period is not None:
+        txt += f", frames > 1.5 x {period*1000:.2f}ms = {np.sum(times > 1.5*period)}/{len(times)}"
+
+    print(txt)
+
+def bench_frames(fname, size, n_frames, refresh_rate, cache_dir):
+    """ Time of getting the frame for each screen refresh: live decoding vs. indexing the cached array """
+    from moviepy.video.io.VideoFileClip import VideoFileClip
+
+    display_times = np.arange(n_frames)/refresh_rate
+
+    clip = VideoFileClip(fname, audio=False, target_resolution=(size[1], size[0]))
+    times = np.zeros(n_frames)
+    for ix, t in enumerate(display_times):
+        start = time.perf_counter()
+        clip.get_frame(t % clip.duration)
+        times[ix] = time.perf_counter()-start
+    clip.close()
+    summarize("live decode", times)
+
+    cache = FrameCache(cache_dir=cache_dir)
+    for label in ["decode + write cache", "load cache (mmap)"]:
+        start = time.perf_counter()
+        frames, fps = cache.get_frames(fname, size)
+        print(f"{label:>24}: {round(time.perf_counter()-start,2)}s ({frames.shape[0]} frames, {round(frames.nbytes/1024**2,1)}MB)")
+
+    times = np.zeros(n_frames)
+    for ix, t in enumerate(display_times):
+        start = time.perf_counter()
+        np.ascontiguousarray(frames[int(t*fps) % frames.shape[0]])
+        times[ix] = time.perf_counter()-start
+    summarize("cached frames", times)
+
+def bench_window(fname, size, n_frames, cache_dir):
+    """ Time per frame (draw + flip) of MovieStim3 and FrameMovie in a window """
+    from psychopy.visual import MovieStim3, Window
+
+    win = Window(size=size, fullscr=False, units="pix")
+    period = win.monitorFramePeriod
+    try:
+        frames, fps = FrameCache(cache_dir=cache_dir).get_frames(fname, size)
+        movies = [
+            ("MovieStim3", MovieStim3(win, filename=fname, loop=True, size=size)),
+            ("FrameMovie", FrameMovie(win, frames, fps, size=size))]
+
+        for name, movie in movies:
+            times = np.zeros(n_frames)
+            for ix in range(n_frames):
+                start = time.perf_counter()
+                movie.draw()
+                win.flip()
+                times[ix] = time.perf_counter()-start
+            summarize(name, times, period=period)
+    finally:
+        win.close()
+
+def main(argv):
+
+    """bench_motor_movie.py
+
+    Benchmark of the movies of the motor experiment. A synthetic clip is written to a temporary directory (or use
+    your own), and the time to get the frame for every screen refresh is compared between decoding the clip live
+    (what MovieStim3 does) and indexing the decoded frames cached by `lineexps.movies.FrameCache`. The time to fill
+    and to load the cache is reported as well. With `--window`, MovieStim3 and FrameMovie are also drawn in a
+    PsychoPy window, and the time per frame (draw + flip) and the number of late frames are reported.
+
+    Parameters
+    ----------
+    -f|--file <movie>       movie file [default = synthetic clip]
+    -s|--size <w,h>         size the movie is shown at, in pixels [default = 1344,756; 70% of 1920x1080]
+    -n|--frames <n>         number of screen refreshes [default = 600]
+    -r|--refresh <hz>       refresh rate assumed without a window [default = 60]
+    -w|--window             also draw both in a window (needs PsychoPy and a display)
+    -q|--help               bring up this help text
+
+    Example
+    ----------
+    >>> python benchmarks/bench_motor_movie.py
+    >>> python benchmarks/bench_motor_movie.py --file motor/2hands.mp4 --window
+    """
+
+    fname        = None
+    size         = [1344,756]
+    n_frames     = 600
+    refresh_rate = 60
+    window       = False
+
+    try:
+        opts = getopt.getopt(argv,"qwf:s:n:r:",["help", "window", "file=", "size=", "frames=", "refresh="])[0]
+    except getopt.GetoptError:
+        print("ERROR while handling arguments.. Did you specify an 'illegal' argument..?")
+        print(main.__doc__)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ('-q', '--help'):
+            print(main.__doc__)
+            sys.exit()
+        elif opt in ("-f", "--file"):
+            fname = arg
+        elif opt in ("-s", "--size"):
+            size = [int(i) for i in arg.split(",")]
+        elif opt in ("-n", "--frames"):
+            n_frames = int(arg)
+        elif opt in ("-r", "--refresh"):
+            refresh_rate = float(arg)
+        elif opt in ("-w", "--window"):
+            window = True
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if fname is None:
+            fname = os.path.join(tmp_dir, "clip.mp4")
+            print(f"Writing synthetic clip to {fname}")
+            make_test_clip(fname)
+
+        cache_dir = os.path.join(tmp_dir, "movies")
+        bench_frames(fname, size, n_frames, refresh_rate, cache_dir)
+        if window:
+            bench_window(fname, size, n_frames, cache_dir)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
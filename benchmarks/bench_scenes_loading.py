@@ -0,0 +1,142 @@
+import getopt
+import h5py
+import numpy as np
+import os
+import random
+import subprocess
+import sys
+import tempfile
+opd = os.path.dirname
+sys.path.insert(0, opd(opd(os.path.abspath(__file__))))
+
+from lineexps.images import LoadReport, dataset_shape, load_all_images, load_images, texture_report
+
+def make_test_file(fname, n_images=2000, size=512):
+    """ Write a stimulus file with random 8-bit images, shaped like `stims_512.h5` """
+    with h5py.File(fname, "w") as h5file:
+        data = h5file.create_dataset("stimuli", (n_images, size, size), dtype=np.uint8, chunks=(1, size, size))
+        for start in range(0, n_images, 100):
+            stop = min(start+100, n_images)
+            data[start:stop] = np.random.randint(0, 256, (stop-start, size, size), dtype=np.uint8)
+
+def design_ids(n_images, n_trials=32, frequency=15, duration=3, target_window_length=5):
+    """ Image indices the scenes design needs; (positives of all trials, negatives of half of them) """
+    n_per_trial = int(np.ceil(frequency*duration))+1
+    positives, negatives = set(), set()
+    for i in range(n_trials):
+        positives.update(random.sample(range(n_images), k=n_per_trial))
+        if i % 2 == 0:
+            negatives.update(random.sample(range(n_images), k=target_window_length))
+
+    return positives, negatives
+
+def upload_textures(images, tex_res, negatives, separate_negatives):
+    """ Create (and draw once) a GratingStim per image, plus one per negative image if `separate_negatives` """
+    from psychopy.visual import GratingStim, Window
+
+    win = Window(size=[tex_res, tex_res], fullscr=False, units="pix")
+    try:
+        report = LoadReport("separate negative textures" if separate_negatives else "shared textures, inverted colour")
+        stims = [GratingStim(win, tex=img, units="pix", mask="raisedCos", texRes=tex_res, size=tex_res) for img in images.values()]
+        if separate_negatives:
+            stims += [GratingStim(win, tex=images[ix]*-1, units="pix", mask="raisedCos", texRes=tex_res, size=tex_res) for ix in negatives]
+
+        for stim in stims:
+            stim.draw()
+
+        win.flip()
+        print(report.done(len(images)) + f"; {texture_report(len(stims), tex_res)}")
+    finally:
+        win.close()
+
+def run_mode(fname, mode):
+    """ Load the images in this process and print the report (run in a separate process for a clean peak RSS) """
+    n_images = dataset_shape(fname)[0]
+    if mode == "full":
+        report = LoadReport("full (float64, all images)")
+        images = load_all_images(fname)
+        print(report.done(images.shape[0]) + f"; array = {round(images.nbytes/1024**2,1)}MB")
+        print(f"  positive + negative texture per image: {texture_report(2*images.shape[0], images.shape[1])}")
+    else:
+        positives, negatives = design_ids(n_images)
+        report = LoadReport("lazy (float32, design only)")
+        images = load_images(fname, sorted(positives | negatives))
+        print(report.done(len(images)) + f"; arrays = {round(sum(img.nbytes for img in images.values())/1024**2,1)}MB")
+
+        # textures: negatives as separate (negated) textures, or sharing the texture of the image
+        tex_res = dataset_shape(fname)[1]
+        if mode == "window":
+            for separate in [True, False]:
+                upload_textures(images, tex_res, negatives, separate)
+        else:
+            print(f"  separate negatives: {texture_report(len(positives)+len(negatives), tex_res)}")
+            print(f"  inverted polarity:  {texture_report(len(images), tex_res)}")
+
+def main(argv):
+
+    """bench_scenes_loading.py
+
+    Compare startup time and memory of loading the scenes stimuli: the full dataset as float64 (original), versus only
+    the images the design needs as float32 (`lineexps.images.load_images`). Each mode runs in its own process, so that
+    the peak RSS is not shared. For the lazy path, the number of textures (and their estimated GPU memory) is reported
+    for negative targets as separate, negated textures (original) and for negatives that reuse the texture of the image
+    with an inverted colour. With `--window`, both are also uploaded in a PsychoPy window and timed.
+
+    Parameters
+    ----------
+    -f|--file <h5>          stimulus file [default = random images in a temporary file]
+    -n|--images <n>         number of images in the temporary file [default = 2000]
+    -w|--window             also time the texture uploads (needs PsychoPy and a display)
+    -q|--help               bring up this help text
+
+    Example
+    ----------
+    >>> python benchmarks/bench_scenes_loading.py
+    >>> python benchmarks/bench_scenes_loading.py --file data/stims_512.h5
+    """
+
+    fname    = None
+    n_images = 2000
+    mode     = None
+    window   = False
+
+    try:
+        opts = getopt.getopt(argv,"qwf:n:m:",["help", "window", "file=", "images=", "mode="])[0]
+    except getopt.GetoptError:
+        print("ERROR while handling arguments.. Did you specify an 'illegal' argument..?")
+        print(main.__doc__)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ('-q', '--help'):
+            print(main.__doc__)
+            sys.exit()
+        elif opt in ("-f", "--file"):
+            fname = arg
+        elif opt in ("-n", "--images"):
+            n_images = int(arg)
+        elif opt in ("-m", "--mode"):
+            mode = arg
+        elif opt in ("-w", "--window"):
+            window = True
+
+    if mode is not None:
+        run_mode(fname, mode)
+        return
+
+    tmp_dir = None
+    if fname is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        fname = os.path.join(tmp_dir.name, "stims.h5")
+        print(f"Writing {n_images} random 512x512 images to {fname}")
+        make_test_file(fname, n_images=n_images)
+
+    try:
+        for mode in ["full", "window" if window else "lazy"]:
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--file", fname, "--mode", mode], check=True)
+    finally:
+        if tmp_dir is not None:
+            tmp_dir.cleanup()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,93 @@
+import getopt
+import numpy as np
+import os
+import sys
+import time
+opd = os.path.dirname
+sys.path.insert(0, opd(opd(os.path.abspath(__file__))))
+
+from lineexps.text import TextPool
+
+# instructions of the four phases of ScreenDelimiterTrial in lineprf2
+DELIMITER_TEXTS = [
+    f"""
+Use your right INDEX finger (or 'b') to move the bar {first}
+Use your right RING finger (or 'y') to move the bar {second}
+
+
+Use your right PINKY (or 'r') to continue to the next stage""" for first, second in [("UP", "DOWN"), ("RIGHT", "LEFT"), ("DOWN", "UP"), ("LEFT", "RIGHT")]]
+
+def run_phase(win, get_text, n_frames, txt):
+    """ Draw the delimiter text for `n_frames` frames; returns the time per frame (draw + flip) in seconds """
+
+    times = np.zeros(n_frames)
+    for ix in range(n_frames):
+        start = time.perf_counter()
+        get_text(txt).draw()
+        win.flip()
+        times[ix] = time.perf_counter()-start
+
+    return times
+
+def main(argv):
+
+    """bench_text_pool.py
+
+    Benchmark of the delimiter phase of `ScreenDelimiterTrial` (lineprf, lineprf2, ActNorm3/4). Before, a new
+    `TextStim` was created on every frame; now the stimulus is taken from the session's `TextPool`. Opens a (windowed)
+    PsychoPy window and reports the time per frame (draw + flip) for both, per phase. Because flips are synchronized to
+    the refresh rate, the interesting numbers are the maximum and the number of frames exceeding one refresh period.
+
+    Parameters
+    ----------
+    -n|--frames <n>         number of frames per phase [default = 120]
+    -s|--size <w,h>         window size in pixels [default = 1920,1080]
+    -q|--help               bring up this help text
+
+    Example
+    ----------
+    >>> python benchmarks/bench_text_pool.py
+    >>> python benchmarks/bench_text_pool.py --frames 600 --size 1280,720
+    """
+
+    n_frames = 120
+    size     = [1920,1080]
+
+    try:
+        opts = getopt.getopt(argv,"qn:s:",["help", "frames=", "size="])[0]
+    except getopt.GetoptError:
+        print("ERROR while handling arguments.. Did you specify an 'illegal' argument..?")
+        print(main.__doc__)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ('-q', '--help'):
+            print(main.__doc__)
+            sys.exit()
+        elif opt in ("-n", "--frames"):
+            n_frames = int(arg)
+        elif opt in ("-s", "--size"):
+            size = [int(i) for i in arg.split(",")]
+
+    from psychopy.visual import TextStim, Window
+
+    win = Window(size=size, fullscr=False, units="pix")
+    period = win.monitorFramePeriod
+    height, wrap_width = 0.5*1.5*40, 150*4*40
+
+    pool = TextPool(win)
+    methods = [
+        ("new TextStim", lambda txt: TextStim(win, txt, height=height, wrapWidth=wrap_width)),
+        ("TextPool", lambda txt: pool.get(txt, height=height, wrapWidth=wrap_width))]
+
+    try:
+        for name, get_text in methods:
+            times = np.concatenate([run_phase(win, get_text, n_frames, txt) for txt in DELIMITER_TEXTS])
+            print(f"{name:>13}: mean = {times.mean()*1000:.2f}ms, max = {times.max()*1000:.2f}ms, frames > 1.5 x {period*1000:.2f}ms = {np.sum(times > 1.5*period)}/{len(times)}")
+    finally:
+        win.close()
+
+    print(f"TextPool: {pool.misses} stimuli created, {pool.hits} reused")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,142 @@
+import getopt
+import numpy as np
+import os
+import sys
+import timeit
+opd = os.path.dirname
+sys.path.insert(0, opd(opd(os.path.abspath(__file__))))
+
+from lineexps.flicker import PhaseSelector
+
+class _Checkerboard(object):
+    """ Stand-in for a GratingStim, so that only the python cost of the selection is measured """
+
+    def setPos(self, pos):
+        self.pos = pos
+
+    def setOri(self, ori):
+        self.ori = ori
+
+    def draw(self):
+        pass
+
+class CascadeStim(object):
+    """ PRFStim.draw as it was before the lookup table (sin/cos comparison cascade) """
+
+    def __init__(self, flicker_frequency):
+        self.flicker_frequency = flicker_frequency
+        for ix in range(8):
+            setattr(self, f"checkerboard_{ix+1}", _Checkerboard())
+
+    def select(self, time, bar_direction):
+        sin = np.sin(2*np.pi*time*self.flicker_frequency)
+        cos = np.cos(2*np.pi*time*self.flicker_frequency)
+        if sin > 0 and cos > 0 and cos > sin:
+            ix = 1
+        elif sin > 0 and cos > 0 and cos < sin:
+            ix = 2
+        elif sin > 0 and cos < 0 and np.abs(cos) < sin:
+            ix = 3
+        elif sin > 0 and cos < 0 and np.abs(cos) > sin:
+            ix = 4
+        elif sin < 0 and cos < 0 and cos < sin:
+            ix = 5
+        elif sin < 0 and cos < 0 and cos > sin:
+            ix = 6
+        elif sin < 0 and cos > 0 and cos < np.abs(sin):
+            ix = 7
+        else:
+            ix = 8
+
+        if bar_direction != 0:
+            ix = 9-ix
+
+        return ix
+
+    def draw(self, time, pos_in_ori, orientation, bar_direction):
+        x_pos, y_pos = np.cos((2.0*np.pi)*-orientation/360.0)*pos_in_ori, np.sin((2.0*np.pi)*-orientation/360.0)*pos_in_ori
+        checkerboard = getattr(self, f"checkerboard_{self.select(time, bar_direction)}")
+        checkerboard.setPos([x_pos, y_pos])
+        checkerboard.setOri(orientation)
+        checkerboard.draw()
+
+class LookupStim(object):
+    """ PRFStim.draw with the lookup table """
+
+    def __init__(self, flicker_frequency, refresh_rate):
+        self.checkerboards = [_Checkerboard() for ix in range(8)]
+        self.phase_selector = PhaseSelector(flicker_frequency, refresh_rate=refresh_rate)
+
+    def select(self, time, bar_direction):
+        return self.phase_selector(time, bar_direction)+1
+
+    def draw(self, time, pos_in_ori, orientation, bar_direction):
+        x_pos, y_pos = np.cos((2.0*np.pi)*-orientation/360.0)*pos_in_ori, np.sin((2.0*np.pi)*-orientation/360.0)*pos_in_ori
+        checkerboard = self.checkerboards[self.phase_selector(time, bar_direction)]
+        checkerboard.setPos([x_pos, y_pos])
+        checkerboard.setOri(orientation)
+        checkerboard.draw()
+
+def main(argv):
+
+    """bench_wbprf_phase.py
+
+    Micro-benchmark of the per-frame python cost of the texture selection in `wbprf/stim.py::PRFStim.draw`; the
+    original sin/cos cascade versus the phase lookup table. Also checks that both select the same texture on every
+    frame (apart from frames that fall exactly on an octant boundary).
+
+    Parameters
+    ----------
+    -f|--freq <freq>        flicker frequency (Hz) [default = 3]
+    -r|--refresh <rate>     refresh rate (Hz) [default = 120]
+    -n|--frames <n>         number of frames to time [default = 100000]
+    -q|--help               bring up this help text
+
+    Example
+    ----------
+    >>> python benchmarks/bench_wbprf_phase.py
+    >>> python benchmarks/bench_wbprf_phase.py --freq 6 --refresh 60
+    """
+
+    freq    = 3
+    refresh = 120
+    n       = 100000
+
+    try:
+        opts = getopt.getopt(argv,"qf:r:n:",["help", "freq=", "refresh=", "frames="])[0]
+    except getopt.GetoptError:
+        print("ERROR while handling arguments.. Did you specify an 'illegal' argument..?")
+        print(main.__doc__)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ('-q', '--help'):
+            print(main.__doc__)
+            sys.exit()
+        elif opt in ("-f", "--freq"):
+            freq = float(arg)
+        elif opt in ("-r", "--refresh"):
+            refresh = float(arg)
+        elif opt in ("-n", "--frames"):
+            n = int(arg)
+
+    cascade = CascadeStim(freq)
+    lookup  = LookupStim(freq, refresh)
+
+    # frame times with a bit of jitter, like a real clock
+    times = np.arange(n)/refresh + np.random.uniform(0, 1e-4, n)
+    dirs  = np.random.randint(0, 2, n).astype(float)
+
+    # agreement; frames exactly on a boundary (sin or cos == 0) fall through to the last branch of the cascade
+    sel_cascade = np.array([cascade.select(t, d) for t, d in zip(times, dirs)])
+    sel_lookup  = np.array([lookup.select(t, d) for t, d in zip(times, dirs)])
+    print(f"Identical selection on {np.mean(sel_cascade == sel_lookup)*100:.3f}% of {n} frames")
+
+    args = list(zip(times.tolist(), dirs.tolist()))
+    for name, stim in [("cascade", cascade), ("lookup", lookup)]:
+        select = min(timeit.repeat(lambda: [stim.select(t, d) for t, d in args], number=1, repeat=5))
+        draw = min(timeit.repeat(lambda: [stim.draw(t, 1.5, 90, d) for t, d in args], number=1, repeat=5))
+        print(f"{name:>8}: selection = {select/n*1e6:.2f} us/frame, full draw() = {draw/n*1e6:.2f} us/frame")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
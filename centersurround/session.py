@@ -1,10 +1,27 @@
 import numpy as np
+import os
 import scipy.stats as ss
 import pandas as pd
 
 from exptools2.core import Session, PylinkEyetrackerSession
 from stimuli import FixationLines, HemiFieldStim, PRFStim
 from trial import TwoSidedTrial, InstructionTrial, DummyWaiterTrial, OutroTrial
+from lineexps.flicker import FlickerSchedule
+from lineexps.frames import FrameRecorder
+from lineexps.itis import iterative_itis
+from lineexps.prefetch import TrialPrefetcher
+from lineexps.settings import Default, compile_settings
+from lineexps.text import TextPool
+opj = os.path.join
+
+
+# settings that are read while trials are running
+SETTINGS_SPEC = {
+    "design": {
+        "stim_duration": float},
+    "stimuli": {
+        "frequency": float,
+        "lock_flicker_to_frames": Default(bool, False)}}
 
 class TwoSidedSession(PylinkEyetrackerSession):
     def __init__(self, output_str, output_dir, settings_file, eyetracker_on=True, params_file=None, hemi="L"):
@@ -21,6 +38,25 @@ class TwoSidedSession(PylinkEyetrackerSession):
             default settings file (in data/default_settings.yml)
         """
         super().__init__(output_str, output_dir=output_dir, settings_file=settings_file, eyetracker_on=eyetracker_on)  # initialize parent class!
+
+        # record flip times to detect dropped frames
+        self.frames = FrameRecorder(self)
+
+        # settings read during trials; validated here, so a missing/mistyped key fails before the run starts
+        self.cfg = compile_settings(self.settings, SETTINGS_SPEC)
+
+        # text stimuli of instruction/delimiter trials are created once and reused
+        self.text_pool = TextPool(self.win)
+
+        # per-trial setup runs during the previous trial, so that trial boundaries only swap stimuli
+        self.prefetch = TrialPrefetcher(self, enabled=self.settings['design'].get('prefetch_next_trial', True))
+
+        # contrast reversals of the flickering stimuli; optionally locked to frame boundaries
+        self.flicker = FlickerSchedule(
+            self.cfg.stimuli.frequency,
+            refresh_rate=getattr(self, 'actual_framerate', None),
+            lock_to_frames=self.cfg.stimuli.lock_flicker_to_frames)
+
         self.n_trials = self.settings['design'].get('n_trials')
 
         self.fixation = FixationLines(win=self.win,
@@ -64,30 +100,13 @@ class TwoSidedSession(PylinkEyetrackerSession):
                                             phase_durations=[self.settings['design'].get('end_duration')],
                                             txt='')
 
-        total_iti_duration = self.n_trials * self.settings['design'].get('mean_iti_duration')
-        min_iti_duration = total_iti_duration - self.settings['design'].get('total_iti_duration_leeway'),
-        max_iti_duration = total_iti_duration + self.settings['design'].get('total_iti_duration_leeway')
-
-        def return_itis(mean_duration, minimal_duration, maximal_duration, n_trials):
-            itis = np.random.exponential(scale=mean_duration-minimal_duration, size=n_trials)
-            itis += minimal_duration
-            itis[itis>maximal_duration] = maximal_duration
-            return itis
-
-        nits = 0
-        itis = return_itis(
+        itis = iterative_itis(
             mean_duration=self.settings['design'].get('mean_iti_duration'),
             minimal_duration=self.settings['design'].get('minimal_iti_duration'),
             maximal_duration=self.settings['design'].get('maximal_iti_duration'),
-            n_trials=self.n_trials)
-        while (itis.sum() < min_iti_duration) | (itis.sum() > max_iti_duration):
-            itis = return_itis(
-                mean_duration=self.settings['design'].get('mean_iti_duration'),
-                minimal_duration=self.settings['design'].get('minimal_iti_duration'),
-                maximal_duration=self.settings['design'].get('maximal_iti_duration'),
-                n_trials=self.n_trials)
-            nits += 1
-        print(f'ITIs created with total ITI duration of {itis.sum()} after {nits} iterations')
+            n_trials=self.n_trials,
+            leeway=self.settings['design'].get('total_iti_duration_leeway'),
+            verbose=True)
 
         # parameters
         left_rights = np.r_[np.ones(self.n_trials//3, dtype=int), np.zeros(self.n_trials//3, dtype=int), np.full(self.n_trials//3, 2, dtype=int)]
@@ -106,8 +125,9 @@ class TwoSidedSession(PylinkEyetrackerSession):
                 verbose=True))
         self.trials.append(outro_trial)
 
-    def create_trial(self):
-        pass
+    def create_trial(self, trial_nr=None):
+        """ Called by exptools2 during `load_next_during_phase` of the previous trial """
+        self.prefetch.prepare(trial_nr)
 
     def run(self):
         """ Runs experiment. """
@@ -121,6 +141,14 @@ class TwoSidedSession(PylinkEyetrackerSession):
         if self.eyetracker_on:
             self.start_recording_eyetracker()
         for trial in self.trials:
+            self.current_trial = trial
             trial.run()
 
         self.close()
+
+    def close(self):
+        """ Write the recorded flip times (and dropped frames per trial) and trial boundary times before closing the session """
+        self.frames.save(opj(self.output_dir, self.output_str+'_frames.npz'))
+        print(self.prefetch.summary())
+        self.prefetch.write(opj(self.output_dir, self.output_str+'_desc-prefetch.tsv'))
+        super().close()
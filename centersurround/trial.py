@@ -1,6 +1,5 @@
 import numpy as np
 from exptools2.core import Trial
-from psychopy.visual import TextStim
 from stimuli import FixationLines
 
 class TwoSidedTrial(Trial):
@@ -31,20 +30,24 @@ class TwoSidedTrial(Trial):
             Whether to print extra output (mostly timing info)
         """
         super().__init__(session, trial_nr, phase_durations, phase_names,
-                         parameters, timing, load_next_during_phase=None, verbose=verbose)
+                         parameters, timing, load_next_during_phase=session.prefetch.phase, verbose=verbose)
         self.condition = self.parameters['condition']
         self.fix_changed = False
 
     def create_trial(self):
         pass
 
+    def prepare(self):
+        # runs during the ITI of the previous trial (see lineexps.prefetch)
+        self.ori = 0 if self.parameters['condition'] == 'center' else 180
+
+    def activate(self):
+        # the stimuli are shared between trials, so the orientation is only applied at the boundary
+        self.session.hemistim.stimulus_1.ori = self.ori
+        self.session.hemistim.stimulus_2.ori = self.ori
+
     def run(self):
-        if self.parameters['condition'] == 'center':
-            self.session.hemistim.stimulus_1.ori = 0
-            self.session.hemistim.stimulus_2.ori = 0
-        else:
-            self.session.hemistim.stimulus_1.ori = 180
-            self.session.hemistim.stimulus_2.ori = 180
+        self.session.prefetch.enter(self)
         super().run()
 
     def draw(self):
@@ -75,8 +78,7 @@ class InstructionTrial(Trial):
         if txt is None:
             txt = '''Press any button to continue.'''
 
-        self.text = TextStim(self.session.win, txt,
-                             height=txt_height, wrapWidth=txt_width, **kwargs)
+        self.text = self.session.text_pool.get(txt, height=txt_height, wrapWidth=txt_width, **kwargs)
 
         self.keys = keys
 
@@ -1,7 +1,16 @@
 import os.path as op
 import argparse
+import sys
 from psychopy import logging
 import yaml
+
+# make the shared `lineexps` package importable when running from the experiment folder
+sys.path.insert(0, op.dirname(op.dirname(op.abspath(__file__))))
+
+# `--render` needs an X-display; without a monitor, run it under xvfb-run
+from lineexps.render import Renderer, require_display
+require_display(sys.argv)
+
 from session import CheckerSession
 from datetime import datetime
 
@@ -10,6 +19,7 @@ parser.add_argument('subject', default=None, nargs='?')
 parser.add_argument('ses', default=None, nargs='?')
 parser.add_argument('run', default=None, nargs='?')
 parser.add_argument('eyelink', default=False, nargs='?')
+parser.add_argument('--render', default=None, help="render the first frame of every trial phase to a .npy/.h5-file (virtual time; use xvfb-run without a monitor, see lineexps.render)")
 
 cmd_args = parser.parse_args()
 subject, ses, run, eyelink = cmd_args.subject, cmd_args.ses, cmd_args.run, cmd_args.eyelink
@@ -37,7 +47,7 @@ elif eyelink == '0':
     eyelink = 0    
 
 eyetracker_on = False
-if eyelink == 1:
+if eyelink == 1 and cmd_args.render is None:
     eyetracker_on = True
     logging.warn("Using eyetracker")
 
@@ -59,5 +69,8 @@ session_object = CheckerSession(
 
 session_object.create_trials()
 logging.warn(f'Writing results to: {op.join(session_object.output_dir, session_object.output_str)}')
+if cmd_args.render is not None:
+    Renderer(session_object, cmd_args.render)
+
 session_object.run()
 session_object.close()
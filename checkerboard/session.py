@@ -1,4 +1,5 @@
 import numpy as np
+import os
 from exptools2.core import PylinkEyetrackerSession
 from psychopy.visual import Circle
 from stimuli import CheckerStim
@@ -7,6 +8,22 @@ from trial import (
     InstructionTrial, 
     DummyWaiterTrial, 
     OutroTrial)
+from lineexps.fixation import FixationSchedule
+from lineexps.flicker import FlickerSchedule
+from lineexps.frames import FrameRecorder
+from lineexps.itis import iterative_itis
+from lineexps.settings import Default, compile_settings
+from lineexps.text import TextPool
+opj = os.path.join
+
+
+# settings that are read while trials are running
+SETTINGS_SPEC = {
+    "design": {
+        "stim_duration": float},
+    "stimuli": {
+        "frequency": float,
+        "lock_flicker_to_frames": Default(bool, False)}}
 
 class CheckerSession(PylinkEyetrackerSession):
     def __init__(self, output_str, output_dir, settings_file, eyetracker_on=True):
@@ -23,6 +40,22 @@ class CheckerSession(PylinkEyetrackerSession):
             default settings file (in data/default_settings.yml)
         """
         super().__init__(output_str, output_dir=output_dir, settings_file=settings_file, eyetracker_on=eyetracker_on)  # initialize parent class!
+
+        # record flip times to detect dropped frames
+        self.frames = FrameRecorder(self)
+
+        # settings read during trials; validated here, so a missing/mistyped key fails before the run starts
+        self.cfg = compile_settings(self.settings, SETTINGS_SPEC)
+
+        # text stimuli of instruction/delimiter trials are created once and reused
+        self.text_pool = TextPool(self.win)
+
+        # contrast reversals of the flickering stimuli; optionally locked to frame boundaries
+        self.flicker = FlickerSchedule(
+            self.cfg.stimuli.frequency,
+            refresh_rate=getattr(self, 'actual_framerate', None),
+            lock_to_frames=self.cfg.stimuli.lock_flicker_to_frames)
+
         self.repetitions = self.settings['design'].get('stim_repetitions')
         self.duration = self.settings['design'].get('stim_duration')
 
@@ -103,9 +136,8 @@ class CheckerSession(PylinkEyetrackerSession):
         self.dot_switch_color_times = np.arange(3, self.total_experiment_time*1.5, float(self.settings['Task_settings']['color_switch_interval']))
         self.dot_switch_color_times += (2*np.random.rand(len(self.dot_switch_color_times))-1)
 
-        # needed to keep track of which dot to print
-        self.current_dot_time = 0
-        self.next_dot_time = 1
+        # colour of the fixation dot at any time; disk_1 before the first switch, then alternating
+        self.fixation_schedule = FixationSchedule(self.dot_switch_color_times, states=[self.fixation_disk_1, self.fixation_disk_0])
 
         # append outro trial
         outro_trial = OutroTrial(
@@ -116,18 +148,7 @@ class CheckerSession(PylinkEyetrackerSession):
         self.trials.append(outro_trial)
 
     def change_fixation(self):
-        present_time = self.clock.getTime()
-        if self.next_dot_time<len(self.dot_switch_color_times):
-            if present_time<self.dot_switch_color_times[self.current_dot_time]:                
-                self.fixation_disk_1.draw()
-                self.dot_switch_color_times[self.current_dot_time]
-            else:
-                if present_time<self.dot_switch_color_times[self.next_dot_time]:
-                    self.fixation_disk_0.draw()
-                    self.dot_switch_color_times[self.next_dot_time]
-                else:
-                    self.current_dot_time+=2
-                    self.next_dot_time+=2        
+        self.fixation_schedule(self.clock.getTime()).draw()
 
     def create_trial(self):
         pass
@@ -144,39 +165,13 @@ class CheckerSession(PylinkEyetrackerSession):
         if self.eyetracker_on:
             self.start_recording_eyetracker()
         for trial in self.trials:
+            self.current_trial = trial
             trial.run()
 
         self.close()
 
-# iti function based on negative exponential
-def _return_itis(mean_duration, minimal_duration, maximal_duration, n_trials):
-    itis = np.random.exponential(scale=mean_duration-minimal_duration, size=n_trials)
-    itis += minimal_duration
-    itis[itis>maximal_duration] = maximal_duration
-    return itis
-
-def iterative_itis(mean_duration=6, minimal_duration=3, maximal_duration=18, n_trials=None, leeway=0, verbose=False):
-    
-    nits = 0
-    itis = _return_itis(
-        mean_duration=mean_duration,
-        minimal_duration=minimal_duration,
-        maximal_duration=maximal_duration,
-        n_trials=n_trials)
-
-    total_iti_duration = n_trials * mean_duration
-    min_iti_duration = total_iti_duration - leeway
-    max_iti_duration = total_iti_duration + leeway
-    while (itis.sum() < min_iti_duration) | (itis.sum() > max_iti_duration):
-        itis = _return_itis(
-            mean_duration=mean_duration,
-            minimal_duration=minimal_duration,
-            maximal_duration=maximal_duration,
-            n_trials=n_trials)
-        nits += 1
-
-    if verbose:
-        print(f'ITIs created with total ITI duration of {round(itis.sum(),2)}s after {nits} iterations')    
-
-    return itis
-
+    def close(self):
+        """ Write the recorded flip times (and dropped frames per trial) and fixation switches before closing the session """
+        self.frames.save(opj(self.output_dir, self.output_str+'_frames.npz'))
+        self.fixation_schedule.save(opj(self.output_dir, self.output_str+'_desc-fixationswitches.tsv'))
+        super().close()
@@ -20,6 +20,7 @@ class CheckerStim(object):
         self.pacman_angle = pacman_angle
         self.n_mask_pixels = n_mask_pixels
         self.frequency = frequency
+        self.stim_duration = self.session.settings['design'].get('stim_duration')
 
         mask = np.ones((n_mask_pixels))
         mask[-int(border_radius*n_mask_pixels):] = (np.cos(np.linspace(0,np.pi,int(border_radius*n_mask_pixels)))+1)/2
@@ -50,8 +51,9 @@ class CheckerStim(object):
 
     def draw(self):
 
-        phase = np.fmod(self.session.settings['design'].get('stim_duration')+self.session.timer.getTime(), 1.0/self.frequency) * self.frequency
-        if phase < 0.5:          
+        # contrast-reversal state (0 = first, 1 = second half of the cycle)
+        phase = self.session.flicker(self.stim_duration+self.session.timer.getTime())
+        if phase == 0:          
             self.stimulus_1.draw()
         else:          
             self.stimulus_2.draw()
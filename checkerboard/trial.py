@@ -1,6 +1,5 @@
 import numpy as np
 from exptools2.core import Trial
-from psychopy.visual import TextStim
 
 class CheckerTrial(Trial):
 
@@ -66,8 +65,7 @@ class InstructionTrial(Trial):
         if txt is None:
             txt = '''Press any button to continue.'''
 
-        self.text = TextStim(
-            self.session.win, 
+        self.text = self.session.text_pool.get(
             txt,
             height=txt_height, 
             wrapWidth=txt_width, 
@@ -7,6 +7,14 @@ import pandas as pd
 from psychopy import logging
 from itertools import product
 import yaml
+
+# make the shared `lineexps` package importable when running from the experiment folder
+sys.path.insert(0, op.dirname(op.dirname(op.abspath(__file__))))
+
+# `--render` needs an X-display; without a monitor, run it under xvfb-run
+from lineexps.render import Renderer, require_display
+require_display(sys.argv)
+
 from session import TwoSidedSession
 from datetime import datetime
 
@@ -16,6 +24,7 @@ parser.add_argument('subject', default=None, nargs='?')
 parser.add_argument('condition', default=None, nargs='?')
 parser.add_argument('ses', default=None, nargs='?')
 parser.add_argument('run', default=None, nargs='?')
+parser.add_argument('--render', default=None, help="render the first frame of every trial phase to a .npy/.h5-file (virtual time; use xvfb-run without a monitor, see lineexps.render)")
 
 cmd_args = parser.parse_args()
 subject, condition, ses, run, = cmd_args.subject, cmd_args.condition, cmd_args.ses, cmd_args.run
@@ -56,5 +65,8 @@ session_object = TwoSidedSession(output_str=output_str,
 
 session_object.create_trials()
 logging.warn(f'Writing results to: {op.join(session_object.output_dir, session_object.output_str)}')
+if cmd_args.render is not None:
+    Renderer(session_object, cmd_args.render)
+
 session_object.run()
 session_object.close()
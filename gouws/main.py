@@ -1,17 +1,27 @@
 import os.path as op
 import argparse
+import sys
 import numpy as np
 import scipy.stats as ss
 import pandas as pd
 from psychopy import logging
 from itertools import product
 import yaml
+
+# make the shared `lineexps` package importable when running from the experiment folder
+sys.path.insert(0, op.dirname(op.dirname(op.abspath(__file__))))
+
+# `--render` needs an X-display; without a monitor, run it under xvfb-run
+from lineexps.render import Renderer, require_display
+require_display(sys.argv)
+
 from session import TwoSidedSession
 
 parser = argparse.ArgumentParser()
 parser.add_argument('subject', default=None, nargs='?')
 parser.add_argument('run', default=None, nargs='?')
 parser.add_argument('eyelink', default=False, nargs='?')
+parser.add_argument('--render', default=None, help="render the first frame of every trial phase to a .npy/.h5-file (virtual time; use xvfb-run without a monitor, see lineexps.render)")
 
 cmd_args = parser.parse_args()
 subject, run, eyelink = cmd_args.subject, cmd_args.run, cmd_args.eyelink
@@ -26,7 +36,7 @@ if run is None:
 elif run == '0':
     run = 0
 
-if eyelink:
+if eyelink and cmd_args.render is None:
     eyetracker_on = True
     logging.warn("Using eyetracker")
 else:
@@ -43,5 +53,8 @@ session_object = TwoSidedSession(output_str=output_str,
                         eyetracker_on=eyetracker_on)
 session_object.create_trials()
 logging.warn(f'Writing results to: {op.join(session_object.output_dir, session_object.output_str)}')
+if cmd_args.render is not None:
+    Renderer(session_object, cmd_args.render)
+
 session_object.run()
 session_object.close()
\ No newline at end of file
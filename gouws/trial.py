@@ -1,6 +1,5 @@
 import numpy as np
 from exptools2.core import Trial
-from psychopy.visual import TextStim
 from stimuli import FixationLines
 
 class TwoSidedTrial(Trial):
@@ -31,7 +30,7 @@ class TwoSidedTrial(Trial):
             Whether to print extra output (mostly timing info)
         """
         super().__init__(session, trial_nr, phase_durations, phase_names,
-                         parameters, timing, load_next_during_phase=None, verbose=verbose)
+                         parameters, timing, load_next_during_phase=session.prefetch.phase, verbose=verbose)
         self.condition = self.parameters['condition']
         self.fix_changed = False
         self.direction_changed = False
@@ -40,13 +39,17 @@ class TwoSidedTrial(Trial):
     def create_trial(self):
         pass
 
+    def prepare(self):
+        # runs during the ITI of the previous trial (see lineexps.prefetch)
+        self.ori = 0 if self.parameters['condition'] == 'left' else 180
+
+    def activate(self):
+        # the stimuli are shared between trials, so the orientation is only applied at the boundary
+        self.session.hemistim.stimulus_1.ori = self.ori
+        self.session.hemistim.stimulus_2.ori = self.ori
+
     def run(self):
-        if self.parameters['condition'] == 'left':
-            self.session.hemistim.stimulus_1.ori = 0
-            self.session.hemistim.stimulus_2.ori = 0
-        else:
-            self.session.hemistim.stimulus_1.ori = 180
-            self.session.hemistim.stimulus_2.ori = 180
+        self.session.prefetch.enter(self)
         super().run()
 
     def draw(self):
@@ -60,7 +63,7 @@ class TwoSidedTrial(Trial):
             self.presentation_time = self.session.timer.getTime()
 
             if self.parameters['direction_changes'] == 1:
-                if (self.presentation_time > -self.session.settings['design'].get('stim_duration')/2):
+                if (self.presentation_time > -self.session.cfg.design.stim_duration/2):
                     print('switch direction')
                     phase = -phase
 
@@ -87,8 +90,7 @@ class InstructionTrial(Trial):
         if txt is None:
             txt = '''Press any button to continue.'''
 
-        self.text = TextStim(self.session.win, txt,
-                             height=txt_height, wrapWidth=txt_width, **kwargs)
+        self.text = self.session.text_pool.get(txt, height=txt_height, wrapWidth=txt_width, **kwargs)
 
         self.keys = keys
 
@@ -0,0 +1,41 @@
+"""
+Helpers shared by the experiments in this repository.
+
+The experiments are run from their own folder (e.g., `cd lineprf; python main.py`), so each `main.py` puts the
+repository root on `sys.path` before importing its session. Anything that is needed by more than one experiment
+lives in here rather than being copied into every folder.
+"""
+import os
+
+opj = os.path.join
+opd = os.path.dirname
+
+# root of the repository; used to resolve defaults
+repo_dir = opd(opd(os.path.abspath(__file__)))
+
+def default_cache_dir(*args):
+    """default_cache_dir
+
+    Location of on-disk caches (textures, designs, decoded movies). Defaults to `~/.cache/lineexps`, but can be
+    moved with the `LINEEXPS_CACHE_DIR` environment variable (e.g., to a fast local disk on the stimulus PC).
+
+    Parameters
+    ----------
+    *args: str
+        sub-directories to append to the cache root
+
+    Returns
+    ----------
+    str
+        path to the (created) cache directory
+
+    Example
+    ----------
+    >>> default_cache_dir("textures")
+    '/home/user/.cache/lineexps/textures'
+    """
+
+    root = os.environ.get("LINEEXPS_CACHE_DIR", opj(os.path.expanduser("~"), ".cache", "lineexps"))
+    path = opj(root, *args)
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -0,0 +1,82 @@
+"""
+Per-trial fields that are only known while a trial runs.
+
+Some values belong in the events log but only become available during the stimulus phase (e.g., when a target
+appeared, or how fast it was detected). Writing them into `session.global_log` with a boolean `.loc` lookup scans the
+whole (growing) DataFrame, on a frame that is being drawn. `TrialAnnotations` instead stores them in a preallocated
+array, indexed by trial number, and adds them to the log once, when the session closes.
+"""
+import numpy as np
+import pandas as pd
+
+class TrialAnnotations(object):
+
+    def __init__(self, trial_nrs, fields):
+        """TrialAnnotations
+
+        Parameters
+        ----------
+        trial_nrs: list, numpy.ndarray
+            trial numbers that can be annotated
+        fields: list
+            names of the fields (columns in the events log). Values are stored as floats; unset values are NaN
+
+        Example
+        ----------
+        >>> self.annotations = TrialAnnotations([trial.trial_nr for trial in self.trials], ["target_onset", "rt"])
+        >>> self.annotations.set(self.trial_nr, "target_onset", self.session.clock.getTime())
+        >>> self.annotations.merge(self.global_log)     # in close(), before the log is written
+        """
+
+        self.trial_nrs  = np.asarray(trial_nrs)
+        self.fields     = list(fields)
+        self.rows       = {int(nr): ix for ix, nr in enumerate(self.trial_nrs)}
+        self.columns    = {field: ix for ix, field in enumerate(self.fields)}
+        self.values     = np.full((len(self.trial_nrs), len(self.fields)), np.nan)
+
+    def set(self, trial_nr, field, value):
+        """ Store `value` for `field` of trial `trial_nr` (overwrites an earlier value) """
+        self.values[self.rows[trial_nr], self.columns[field]] = value
+
+    def get(self, trial_nr, field):
+        """ Stored value of `field` for trial `trial_nr` (NaN if it was not set) """
+        return self.values[self.rows[trial_nr], self.columns[field]]
+
+    def is_set(self, trial_nr, field):
+        return not np.isnan(self.get(trial_nr, field))
+
+    def to_dataframe(self):
+        """ One row per trial number, one column per field """
+        df = pd.DataFrame(self.values, index=self.trial_nrs, columns=self.fields)
+        df.index.name = "trial_nr"
+        return df
+
+    def merge(self, log):
+        """merge
+
+        Add the fields to every row of `log` with the same trial number. Values that were not set leave an existing
+        column as it was.
+
+        Parameters
+        ----------
+        log: pandas.DataFrame
+            events log with a 'trial_nr' column (e.g., `session.global_log`); changed in place
+
+        Returns
+        ----------
+        pandas.DataFrame
+            `log`
+        """
+
+        if len(log) == 0 or "trial_nr" not in log.columns:
+            return log
+
+        annotations = self.to_dataframe()
+        for field in self.fields:
+            values = log["trial_nr"].map(annotations[field])
+            if field in log.columns:
+                values = values.where(values.notna(), log[field])
+
+            log[field] = values
+
+        return log
@@ -0,0 +1,333 @@
+"""
+Stimulus files (image sets, movies) resolved by checksum from a local store.
+
+Experiments list the files they need in the `assets`-section of their `settings.yml`, by file name, with the sha256
+of the content, local places where the file may already be (`sources`, relative to the settings file) and, optionally,
+a `url` to download it from. `AssetStore.resolve` returns the path of a verified copy in the store
+(`~/.cache/lineexps/assets/<sha256[:2]>/<sha256>/<name>`, see `lineexps.default_cache_dir`). Files are hashed while
+they are read, in blocks, and are not hashed again unless their size or modification time changes.
+
+A download on the stimulus PC blocks the start of a session for minutes. Stage the files beforehand with:
+
+>>> python -m lineexps.assets scenes motor
+
+and set `LINEEXPS_OFFLINE=1` (or `offline=True`) on the stimulus PC: a file that is not in the store (or in one of
+its sources) then raises an error immediately, instead of being downloaded.
+"""
+import getopt
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import urllib.request
+from lineexps import default_cache_dir, repo_dir
+from lineexps.settings import load_settings
+opj = os.path.join
+
+BLOCK_SIZE = 2**20
+
+def offline_from_env():
+    """ True if `LINEEXPS_OFFLINE` is set to '1', 'true' or 'yes' """
+    return os.environ.get("LINEEXPS_OFFLINE", "").lower() in ("1", "true", "yes")
+
+def file_hash(fname, block_size=BLOCK_SIZE):
+    """ sha256 of a file, read in blocks of `block_size` bytes """
+    sha = hashlib.sha256()
+    with open(fname, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha.update(block)
+
+    return sha.hexdigest()
+
+def _stat_key(fname):
+    stat = os.stat(fname)
+    return [stat.st_size, stat.st_mtime_ns]
+
+class AssetStore(object):
+
+    def __init__(self, cache_dir=None, offline=None, timeout=30, verbose=True):
+        """AssetStore
+
+        Parameters
+        ----------
+        cache_dir: str, optional
+            root of the store. Defaults to `default_cache_dir("assets")`
+        offline: bool, optional
+            never download; files that are not available locally raise a `FileNotFoundError`. Defaults to the
+            `LINEEXPS_OFFLINE` environment variable
+        timeout: float, optional
+            timeout (in s) of the connection when downloading, default = 30
+        verbose: bool, optional
+            print where files are taken from, default = True
+
+        Example
+        ----------
+        >>> store = AssetStore()
+        >>> fname = store.resolve("stims_512.h5", sha256="...", url="https://...", sources=["../data/stims_512.h5"])
+        """
+
+        if cache_dir is None:
+            cache_dir = default_cache_dir("assets")
+
+        self.cache_dir  = cache_dir
+        self.offline    = offline_from_env() if offline is None else offline
+        self.timeout    = timeout
+        self.verbose    = verbose
+        self.index_file = opj(self.cache_dir, "index.json")
+
+    def path(self, name, sha256):
+        """ Location of file `name` with checksum `sha256` in the store """
+        return opj(self.cache_dir, sha256[:2], sha256, name)
+
+    def _read_index(self):
+        if not os.path.exists(self.index_file):
+            return {}
+
+        with open(self.index_file) as f:
+            return json.load(f)
+
+    def _update_index(self, key, sha256):
+        # checksums of files that were resolved without one (by url or name), so they are found next time
+        index = self._read_index()
+        index[key] = sha256
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.index_file, "w") as f:
+            json.dump(index, f, indent=1)
+
+    def verify(self, fname, sha256):
+        """ True if `fname` has checksum `sha256`; the result is remembered until the size or modification time changes """
+        marker = fname+".verified"
+        if os.path.exists(marker):
+            with open(marker) as f:
+                if json.load(f) == [sha256]+_stat_key(fname):
+                    return True
+
+        if file_hash(fname) != sha256:
+            return False
+
+        with open(marker, "w") as f:
+            json.dump([sha256]+_stat_key(fname), f)
+
+        return True
+
+    def _add(self, src, name, sha256):
+        # hard link if the source is on the same file system, copy otherwise
+        dst = self.path(name, sha256)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = dst+".tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copyfile(src, tmp)
+
+        os.replace(tmp, dst)
+        return dst
+
+    def download(self, url, name, sha256=None):
+        """download
+
+        Download `url` into the store, hashing it while it is written. The file is only moved into place if its
+        checksum matches `sha256` (if given).
+
+        Parameters
+        ----------
+        url: str
+            address of the file; `file://` urls work as well
+        name: str
+            file name in the store
+        sha256: str, optional
+            expected checksum
+
+        Returns
+        ----------
+        str
+            path of the file in the store
+        """
+
+        if self.offline:
+            raise FileNotFoundError(f"'{name}' is not in the asset store ({self.cache_dir}) and downloads are disabled (offline). Stage it with 'python -m lineexps.assets <experiment>' first")
+
+        if self.verbose:
+            print(f"Downloading '{name}' from {url}")
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        sha = hashlib.sha256()
+        with urllib.request.urlopen(url, timeout=self.timeout) as response:
+            with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=".part", delete=False) as f:
+                try:
+                    for block in iter(lambda: response.read(BLOCK_SIZE), b""):
+                        sha.update(block)
+                        f.write(block)
+                except BaseException:
+                    f.close()
+                    os.remove(f.name)
+                    raise
+
+        digest = sha.hexdigest()
+        if sha256 is not None and digest != sha256:
+            os.remove(f.name)
+            raise ValueError(f"Checksum of '{name}' from {url} is {digest}, expected {sha256}")
+
+        dst = self.path(name, digest)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        os.replace(f.name, dst)
+        self.verify(dst, digest)
+        return dst
+
+    def resolve(self, name, sha256=None, url=None, sources=None):
+        """resolve
+
+        Path of a verified copy of `name`. Looked up in the store first, then in `sources` (which are added to the
+        store), and finally downloaded from `url` (unless offline). Without `sha256`, the checksum of the first file
+        that is found is used, and printed so that it can be added to the settings.
+
+        Parameters
+        ----------
+        name: str
+            file name
+        sha256: str, optional
+            checksum of the content
+        url: str, optional
+            address to download the file from
+        sources: list, optional
+            local paths where the file may be
+
+        Returns
+        ----------
+        str
+            path of the file in the store
+
+        Raises
+        ----------
+        FileNotFoundError
+            if the file is not in the store or in any source, and there is no url or downloads are disabled
+        ValueError
+            if a file exists but its checksum does not match
+        """
+
+        key = url if url is not None else name
+        known = sha256 if sha256 is not None else self._read_index().get(key)
+
+        if known is not None:
+            fname = self.path(name, known)
+            if os.path.exists(fname):
+                if not self.verify(fname, known):
+                    raise ValueError(f"'{fname}' is corrupt (checksum differs from {known}); remove it and stage it again")
+
+                return fname
+
+        for src in sources or []:
+            if not os.path.exists(src):
+                continue
+
+            digest = file_hash(src)
+            if sha256 is not None and digest != sha256:
+                raise ValueError(f"Checksum of '{src}' is {digest}, expected {sha256}")
+
+            if self.verbose:
+                print(f"Adding '{src}' to the asset store")
+
+            fname = self._add(src, name, digest)
+            self.verify(fname, digest)
+            break
+        else:
+            if url is None:
+                raise FileNotFoundError(f"'{name}' is not in the asset store ({self.cache_dir}) or in any of {sources}, and has no url")
+
+            fname = self.download(url, name, sha256=sha256)
+            digest = os.path.basename(os.path.dirname(fname))
+
+        if sha256 is None:
+            self._update_index(key, digest)
+            if self.verbose:
+                print(f"'{name}' has no checksum in the settings; add 'sha256: {digest}'")
+
+        return fname
+
+    def resolve_settings(self, settings, name, base_dir):
+        """resolve_settings
+
+        Resolve an entry of the `assets`-section of a settings dictionary.
+
+        Parameters
+        ----------
+        settings: dict
+            settings of an experiment
+        name: str
+            key in `settings['assets']`
+        base_dir: str
+            directory that relative `sources` are relative to (normally that of the settings file)
+
+        Returns
+        ----------
+        str
+            path of the file in the store
+        """
+
+        spec = dict(settings["assets"][name])
+        sources = [src if os.path.isabs(src) else opj(base_dir, src) for src in spec.get("sources", [])]
+        return self.resolve(name, sha256=spec.get("sha256"), url=spec.get("url"), sources=sources)
+
+def stage(settings_file, store=None):
+    """ Resolve all assets of a settings file (downloads are allowed unless the store is offline) """
+    if store is None:
+        store = AssetStore(offline=False)
+
+    settings = load_settings(settings_file)
+    base_dir = os.path.dirname(os.path.abspath(settings_file))
+    return {name: store.resolve_settings(settings, name, base_dir) for name in settings.get("assets", {})}
+
+def main(argv):
+
+    """assets.py
+
+    Stage the stimulus files of one or more experiments in the local asset store, so that sessions can start without
+    a download (e.g., with `LINEEXPS_OFFLINE=1` on the stimulus PC). For each experiment folder, the `assets`-section
+    of `settings.yml` is read; files are taken from their sources or downloaded, and verified.
+
+    Parameters
+    ----------
+    <exp>                   experiment folder(s) (e.g., 'scenes'), relative to the repository or absolute
+    -c|--cache <dir>        store directory [default = ~/.cache/lineexps/assets, or $LINEEXPS_CACHE_DIR/assets]
+    -q|--help               bring up this help text
+
+    Example
+    ----------
+    >>> python -m lineexps.assets scenes motor
+    >>> python -m lineexps.assets --cache /scratch/assets scenes
+    """
+
+    cache_dir = None
+
+    try:
+        opts, args = getopt.getopt(argv,"qc:",["help", "cache="])
+    except getopt.GetoptError:
+        print("ERROR while handling arguments.. Did you specify an 'illegal' argument..?")
+        print(main.__doc__)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ('-q', '--help'):
+            print(main.__doc__)
+            sys.exit()
+        elif opt in ("-c", "--cache"):
+            cache_dir = arg
+
+    if len(args) == 0:
+        args = ["scenes", "motor"]
+
+    store = AssetStore(cache_dir=cache_dir, offline=False)
+    for exp in args:
+        if not os.path.isabs(exp) and not os.path.isdir(exp):
+            exp = opj(repo_dir, exp)
+
+        for name, fname in stage(opj(exp, "settings.yml"), store=store).items():
+            print(f"{name}: {fname}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,263 @@
+"""
+Trial design of the bar-sweep pRF experiment (`lineprf`), compiled from the `design`-section of its settings.
+
+A run consists of a baseline, followed by `stim_repetitions` repetitions of the same part. A part contains 8 sweeps
+of `bar_steps` steps, each followed by `inter_sweep_blank` seconds of blank trials. Sweeps alternate between
+horizontal and vertical bars, and the bar type is thin, thin, thick, thick, and so on. The last 4 sweeps go through
+the locations in reverse order. `compile_bar_design` computes everything the trials need (condition, location, bar
+type, orientation, position in pixels, fixation changes) from the trial index in one vectorised pass. It returns a
+structured array with one record per trial (`DESIGN_DTYPE`), so `create_trials` only indexes into it.
+
+The design only depends on a few numbers, so `DesignCache` stores compiled designs in
+`~/.cache/lineexps/designs` (see `lineexps.default_cache_dir`), keyed by their parameters.
+"""
+import hashlib
+import json
+import numpy as np
+import os
+from lineexps import default_cache_dir
+opj = os.path.join
+
+# bump when the design recipe changes so stale entries are not picked up
+CACHE_VERSION = 1
+
+CONDITIONS = ["horizontal", "vertical", "blank"]
+BAR_TYPES = ["thin", "thick", "rest"]
+
+# sweeps per part of the design, and the number of them that go through the locations in the original order
+SWEEPS_PER_PART = 8
+FORWARD_SWEEPS = 4
+
+DESIGN_DTYPE = np.dtype([
+    ("condition", np.int8),         # index into CONDITIONS
+    ("step", np.int16),             # index into the bar locations; -1 for blank trials
+    ("iteration", np.int16),        # repetition of the part; 0 for the baseline
+    ("bar_type", np.int8),          # index into BAR_TYPES
+    ("orientation", np.float32),    # degrees from a vertical bar
+    ("pos_step", np.float64),       # distance from the pRF in bar widths
+    ("pos_x", np.float64),          # position in pixels
+    ("pos_y", np.float64),
+    ("fix_change", np.bool_)])
+
+def _check(params):
+    # the same checks the chained version would have failed on later (or silently got wrong)
+    errors = []
+    if params["stim_duration"] <= 0:
+        errors.append(f"stim_duration must be positive, not {params['stim_duration']}")
+    if params["bar_steps"] < 1:
+        errors.append(f"bar_steps must be at least 1, not {params['bar_steps']}")
+    if params["stim_repetitions"] < 1:
+        errors.append(f"stim_repetitions must be at least 1, not {params['stim_repetitions']}")
+    if params["start_duration"] < 0 or params["inter_sweep_blank"] < 0:
+        errors.append("start_duration and inter_sweep_blank can't be negative")
+    if not 0 < params["fix_change_prob"] <= 1:
+        errors.append(f"fix_change_prob must be in (0,1], not {params['fix_change_prob']}")
+    if len(params["span_locations"]) != 2:
+        errors.append(f"span_locations must be [start, stop], not {params['span_locations']}")
+    if params["thick_bar_scalar"] <= 0:
+        errors.append(f"thick bar as scalar of thin bar must be positive, not {params['thick_bar_scalar']}")
+
+    if len(errors) > 0:
+        raise ValueError("Invalid design:\n  "+"\n  ".join(errors))
+
+def compile_bar_design(
+    bar_steps,
+    span_locations,
+    stim_duration,
+    start_duration,
+    inter_sweep_blank,
+    stim_repetitions,
+    fix_change_prob,
+    thick_bar_scalar,
+    bar_widths_pix,
+    center_pix=(0,0)):
+    """compile_bar_design
+
+    One record per trial of the bar-sweep design (baseline included).
+
+    Parameters
+    ----------
+    bar_steps: int
+        locations per sweep
+    span_locations: list
+        [start, stop] of the locations, in bar widths from the pRF
+    stim_duration: float
+        duration of a trial (s)
+    start_duration: float
+        duration of the baseline (s)
+    inter_sweep_blank: float
+        blank period after each sweep (s)
+    stim_repetitions: int
+        number of parts
+    fix_change_prob: float
+        fraction of trials with a fixation change; the changes are spread evenly over the run
+    thick_bar_scalar: float
+        width of the thick bar relative to the thin bar. Thick bars take steps that are this much smaller, so they
+        cover the same area as the thin bar
+    bar_widths_pix: list
+        widths of the thin and thick bar in pixels
+    center_pix: list, tuple, optional
+        position of the pRF in pixels, default = (0,0)
+
+    Returns
+    ----------
+    numpy.ndarray
+        structured array with dtype `DESIGN_DTYPE`
+
+    Example
+    ----------
+    >>> design = compile_bar_design(60, [-7,7], 0.25, 20, 15, 1, 0.05, 2, [24.6, 49.2])
+    >>> len(design), CONDITIONS[design["condition"][80]], design["step"][80]
+    (1040, 'horizontal', 0)
+    """
+
+    _check({
+        "bar_steps": bar_steps,
+        "span_locations": span_locations,
+        "stim_duration": stim_duration,
+        "start_duration": start_duration,
+        "inter_sweep_blank": inter_sweep_blank,
+        "stim_repetitions": stim_repetitions,
+        "fix_change_prob": fix_change_prob,
+        "thick_bar_scalar": thick_bar_scalar})
+
+    n_baseline = int(start_duration//stim_duration)
+    n_blank = int(inter_sweep_blank//stim_duration)
+    segment = bar_steps+n_blank
+    part = SWEEPS_PER_PART*segment
+    n_trials = n_baseline+stim_repetitions*part
+
+    design = np.zeros(n_trials, dtype=DESIGN_DTYPE)
+
+    # position of every trial within its part; baseline trials are blanks of iteration 0
+    t = np.arange(stim_repetitions*part)
+    sweep, offset = np.divmod(t % part, segment)
+    in_sweep = offset < bar_steps
+    trials = design[n_baseline:]
+
+    trials["iteration"] = t//part+1
+    trials["condition"] = np.where(in_sweep, sweep % 2, 2)
+    trials["bar_type"] = np.where(in_sweep, (sweep//2) % 2, 2)
+    trials["step"] = np.where(in_sweep, np.where(sweep < FORWARD_SWEEPS, offset, bar_steps-1-offset), -1)
+    design["condition"][:n_baseline] = 2
+    design["bar_type"][:n_baseline] = 2
+    design["step"][:n_baseline] = -1
+
+    # positions of the bars; horizontal bars move along y, vertical bars along x
+    bar = design["condition"] < 2
+    locations = np.linspace(*span_locations, bar_steps)
+    scale = np.where(design["bar_type"] == 1, thick_bar_scalar, 1)
+    design["pos_step"][bar] = locations[design["step"][bar]]/scale[bar]
+    shift = np.asarray(bar_widths_pix, dtype=float)[np.minimum(design["bar_type"], 1)]*design["pos_step"]
+    horizontal = design["condition"] == 0
+    design["orientation"] = np.where(horizontal, 90, 0)
+    design["pos_x"] = np.where(bar, center_pix[0]+np.where(horizontal, 0, shift), 0)
+    design["pos_y"] = np.where(bar, center_pix[1]+np.where(horizontal, shift, 0), 0)
+
+    # fixation changes at a fixed interval
+    interval = int(n_trials/(n_trials*fix_change_prob))
+    design["fix_change"][::interval] = True
+
+    return design
+
+def bar_design_params(settings):
+    """ Parameters of `compile_bar_design` that come from the settings (everything but the pixel geometry) """
+    design = settings['design']
+    return {
+        "bar_steps": int(design['bar_steps']),
+        "span_locations": [float(i) for i in design['span_locations']],
+        "stim_duration": float(design['stim_duration']),
+        "start_duration": float(design['start_duration']),
+        "inter_sweep_blank": float(design['inter_sweep_blank']),
+        "stim_repetitions": int(design['stim_repetitions']),
+        "fix_change_prob": float(design['fix_change_prob']),
+        "thick_bar_scalar": float(settings['stimuli']['thick bar as scalar of thin bar'])}
+
+class DesignCache(object):
+
+    def __init__(self, cache_dir=None, verbose=False):
+        """DesignCache
+
+        Persistent cache of compiled designs. Entries are `.npy`-files (structured arrays) with a `.json`-sidecar
+        containing the parameters.
+
+        Parameters
+        ----------
+        cache_dir: str, optional
+            directory to store the designs in. Defaults to `default_cache_dir("designs")`
+        verbose: bool, optional
+            print whether designs were loaded or compiled
+
+        Example
+        ----------
+        >>> cache = DesignCache()
+        >>> design = cache.get_bar_design(bar_widths_pix=[24.6, 49.2], center_pix=[10, -5], **bar_design_params(settings))
+        """
+
+        if cache_dir is None:
+            cache_dir = default_cache_dir("designs")
+        else:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self.cache_dir  = cache_dir
+        self.verbose    = verbose
+        self.hits       = 0
+        self.misses     = 0
+
+    def key(self, **params):
+        """ Hash of the (json-serialized) design parameters """
+        params["version"] = CACHE_VERSION
+        txt = json.dumps(params, sort_keys=True)
+        return hashlib.sha1(txt.encode("utf8")).hexdigest()
+
+    def get_bar_design(self, bar_widths_pix, center_pix=(0,0), **params):
+        """get_bar_design
+
+        The design of `compile_bar_design`, either from disk or by compiling (and storing) it.
+
+        Parameters
+        ----------
+        bar_widths_pix: list
+            widths of the thin and thick bar in pixels
+        center_pix: list, tuple, optional
+            position of the pRF in pixels, default = (0,0)
+        **params:
+            other arguments of `compile_bar_design` (e.g., from `bar_design_params`)
+
+        Returns
+        ----------
+        numpy.ndarray
+            structured array with dtype `DESIGN_DTYPE`
+        """
+
+        params["bar_widths_pix"] = [round(float(i), 6) for i in bar_widths_pix]
+        params["center_pix"] = [round(float(i), 6) for i in center_pix]
+        fname = opj(self.cache_dir, f"{self.key(**params)}.npy")
+
+        if os.path.exists(fname):
+            try:
+                design = np.load(fname)
+                if design.dtype == DESIGN_DTYPE:
+                    self.hits += 1
+                    if self.verbose:
+                        print(f"Loaded design from {fname}")
+                    return design
+            except (ValueError, OSError):
+                # truncated/corrupt entry; fall through and compile again
+                pass
+
+        design = compile_bar_design(**params)
+        self.misses += 1
+
+        tmp = f"{fname}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, design)
+        os.replace(tmp, fname)
+
+        with open(fname.replace(".npy", ".json"), "w") as f:
+            json.dump(params, f, indent=4)
+
+        if self.verbose:
+            print(f"Wrote design to {fname}")
+
+        return design
@@ -0,0 +1,452 @@
+"""
+Stimulus orders and ITIs for the ActNorm experiments, chosen by design efficiency.
+
+ActNorm, ActNorm3 and ActNorm4 read the order of the conditions (`order_task-<task>.txt`) and the ITIs
+(`itis_task-<task>.txt`) from files in their folder. `DesignSpace` describes what a valid design is for an experiment
+(from its `settings.yml`): a balanced order of the conditions, and ITIs drawn like `lineexps.itis.iterative_itis`
+(capped exponential, total within `total_iti_duration_leeway` of `n_trials*mean_iti_duration`), with a run that fits
+in `intended_duration`. Candidates are scored in batches: the response to each stimulus (a boxcar of its duration,
+convolved with the canonical HRF) is added to a (candidates, conditions, time) design matrix at once, and the
+efficiency `n_contrasts/trace(C (X'X)^-1 C')` is computed for all candidates with batched linear algebra. Batches run
+on a pool of processes; the best design is written to the order/ITI files:
+
+>>> python -m lineexps.efficiency ActNorm3 --task SRFa,SRFb,SRFi
+"""
+import getopt
+import multiprocessing
+import numpy as np
+import os
+import sys
+import time
+from scipy import stats
+from lineexps import repo_dir
+from lineexps.itis import return_itis
+from lineexps.settings import load_settings
+opj = os.path.join
+
+# conditions (in the order of the values in the order-files) and whether the ITI precedes the stimulus in a trial
+EXPERIMENTS = {
+    "ActNorm": {"evs": ["act","norm"], "iti_first": True},
+    "ActNorm3": {"evs": ["act","suppr_1","suppr_2"], "iti_first": False},
+    "ActNorm4": {"evs": ["act","suppr_short","suppr_long"], "iti_first": False}}
+
+def spm_hrf(dt, length=32):
+    """ Canonical (SPM) double-gamma HRF sampled every `dt` s for `length` s, normalized to a sum of 1 """
+    t = np.arange(0, length, dt)
+    hrf = stats.gamma.pdf(t, 6)-stats.gamma.pdf(t, 16)/6
+    return hrf/hrf.sum()
+
+def contrast_matrix(n_conditions, contrasts="all"):
+    """ 'main' (each condition vs. baseline), 'diff' (all pairwise differences) or 'all' (both) """
+    main = np.eye(n_conditions)
+    diff = np.array([main[i]-main[j] for i in range(n_conditions) for j in range(i+1, n_conditions)]).reshape(-1, n_conditions)
+    return {"main": main, "diff": diff, "all": np.vstack([main, diff])}[contrasts]
+
+class DesignSpace(object):
+
+    def __init__(
+        self,
+        evs,
+        n_repetitions,
+        stim_duration,
+        mean_iti_duration,
+        minimal_iti_duration,
+        maximal_iti_duration,
+        leeway=0,
+        start_duration=0,
+        end_duration=0,
+        intended_duration=None,
+        iti_first=False,
+        dt=0.1,
+        contrasts="all"):
+        """DesignSpace
+
+        Valid orders/ITIs of an experiment and their design efficiency.
+
+        Parameters
+        ----------
+        evs: list
+            names of the conditions; the order-files contain indices into this list
+        n_repetitions: int
+            presentations per condition
+        stim_duration: float, list
+            duration of the stimulus (s), or one per condition
+        mean_iti_duration: float
+            mean ITI
+        minimal_iti_duration: float
+            shortest ITI
+        maximal_iti_duration: float
+            longest ITI
+        leeway: float, optional
+            allowed difference between the total ITI and `n_trials*mean_iti_duration`, default = 0
+        start_duration: float, optional
+            time between the trigger and the first trial, default = 0
+        end_duration: float, optional
+            time after the last trial, default = 0
+        intended_duration: float, optional
+            maximal duration of the run; also the length of the modelled time series. Defaults to the duration with
+            the longest allowed total ITI
+        iti_first: bool, optional
+            the ITI precedes the stimulus in a trial (ActNorm), default = False
+        dt: float, optional
+            time resolution of the design matrix (s), default = 0.1
+        contrasts: str, optional
+            contrasts to optimise for; see `contrast_matrix`. Default = 'all'
+
+        Example
+        ----------
+        >>> space = DesignSpace.from_settings("ActNorm3")
+        >>> orders, itis = space.draw(1000)
+        >>> space.efficiency(orders, itis).shape
+        (1000,)
+        """
+
+        self.evs                    = list(evs)
+        self.n_conditions           = len(self.evs)
+        self.n_repetitions          = int(n_repetitions)
+        self.n_trials               = self.n_conditions*self.n_repetitions
+        self.stim_duration          = np.broadcast_to(np.asarray(stim_duration, dtype=float), (self.n_conditions,)).copy()
+        self.mean_iti_duration      = mean_iti_duration
+        self.minimal_iti_duration   = minimal_iti_duration
+        self.maximal_iti_duration   = maximal_iti_duration
+        self.leeway                 = leeway
+        self.start_duration         = start_duration
+        self.end_duration           = end_duration
+        self.iti_first              = iti_first
+        self.dt                     = dt
+        self.contrasts              = contrast_matrix(self.n_conditions, contrasts)
+
+        self.iti_total = self.n_trials*self.mean_iti_duration
+        fixed = self.start_duration+self.end_duration+self.n_repetitions*self.stim_duration.sum()
+        self.intended_duration = fixed+self.iti_total+self.leeway if intended_duration is None else intended_duration
+        if fixed+self.iti_total-self.leeway > self.intended_duration:
+            raise ValueError(f"A run of {self.n_trials} trials takes at least {fixed+self.iti_total-self.leeway}s, more than the intended {self.intended_duration}s")
+
+        # response to a single stimulus of each condition
+        hrf = spm_hrf(dt)
+        self.kernels = [np.convolve(np.ones(int(round(i/dt))), hrf) for i in self.stim_duration]
+        self.kernel_length = max([len(i) for i in self.kernels])
+        self.kernels = np.array([np.pad(i, (0, self.kernel_length-len(i))) for i in self.kernels])
+        self.n_samples = int(np.ceil(self.intended_duration/dt))
+        self.base_order = np.repeat(np.arange(self.n_conditions), self.n_repetitions)
+
+    @classmethod
+    def from_settings(cls, exp, settings_file=None, **kwargs):
+        """ Design space of experiment folder `exp` (a key of `EXPERIMENTS`), from its `settings.yml` """
+        name = os.path.basename(os.path.normpath(exp))
+        if name not in EXPERIMENTS:
+            raise ValueError(f"Unknown experiment '{name}'; choose from {list(EXPERIMENTS)}")
+
+        if settings_file is None:
+            exp_dir = exp if os.path.isdir(exp) else opj(repo_dir, name)
+            settings_file = opj(exp_dir, "settings.yml")
+
+        settings = load_settings(settings_file)
+        design = settings["design"]
+        evs = EXPERIMENTS[name]["evs"]
+        n_repetitions = settings.get("stimuli", {}).get("n_repetitions")
+        if n_repetitions is None:
+            n_repetitions = design["n_trials"]//len(evs)
+
+        return cls(
+            evs,
+            n_repetitions,
+            design["stim_duration"],
+            design["mean_iti_duration"],
+            design["minimal_iti_duration"],
+            design["maximal_iti_duration"],
+            leeway=design.get("total_iti_duration_leeway", 0),
+            start_duration=design.get("start_duration", 0),
+            end_duration=design.get("end_duration", 0),
+            intended_duration=design.get("intended_duration"),
+            iti_first=EXPERIMENTS[name]["iti_first"],
+            **kwargs)
+
+    def _conditional_itis(self, n_sets):
+        # ITIs with a total drawn uniformly within the leeway (normalized exponentials; see lineexps.itis.conditional_itis)
+        cap = self.maximal_iti_duration-self.minimal_iti_duration
+        found = []
+        n_found = 0
+        while n_found < n_sets:
+            totals = self.iti_total+np.random.uniform(-self.leeway, self.leeway, size=(n_sets, 1))
+            draws = np.random.exponential(size=(n_sets, self.n_trials))
+            draws *= (totals-self.n_trials*self.minimal_iti_duration)/draws.sum(axis=1, keepdims=True)
+            ok = np.all(draws <= cap, axis=1)
+            found.append(self.minimal_iti_duration+draws[ok])
+            n_found += ok.sum()
+
+        return np.vstack(found)[:n_sets]
+
+    def draw(self, n_sets, n_batches=10):
+        """draw
+
+        Random valid designs: shuffled balanced orders, and ITIs from the capped exponential whose total is within
+        the leeway (the remainder, if batched rejection doesn't find enough, conditional on the total).
+
+        Parameters
+        ----------
+        n_sets: int
+            number of designs
+        n_batches: int, optional
+            maximum number of batches of rejection sampling, default = 10
+
+        Returns
+        ----------
+        orders: numpy.ndarray
+            condition indices of shape (n_sets, n_trials)
+        itis: numpy.ndarray
+            ITIs of shape (n_sets, n_trials)
+        """
+
+        orders = self.base_order[np.argsort(np.random.random_sample((n_sets, self.n_trials)), axis=1)]
+
+        found = []
+        n_found = 0
+        for _ in range(n_batches):
+            itis = return_itis(self.mean_iti_duration, self.minimal_iti_duration, self.maximal_iti_duration, (n_sets, self.n_trials))
+            itis = itis[np.abs(itis.sum(axis=1)-self.iti_total) <= self.leeway]
+            found.append(itis)
+            n_found += len(itis)
+            if n_found >= n_sets:
+                break
+
+        if n_found < n_sets:
+            found.append(self._conditional_itis(n_sets-n_found))
+
+        itis = np.vstack(found)[:n_sets]
+
+        # runs that don't fit in the intended duration are replaced by shorter ITIs
+        fixed = self.start_duration+self.end_duration+self.n_repetitions*self.stim_duration.sum()
+        too_long = fixed+itis.sum(axis=1) > self.intended_duration
+        while np.any(too_long):
+            itis[too_long] = self._conditional_itis(too_long.sum())
+            too_long = fixed+itis.sum(axis=1) > self.intended_duration
+
+        return orders, itis
+
+    def onsets(self, orders, itis):
+        """ Stimulus onsets (s after the trigger) of designs `orders`/`itis`, both of shape (n_sets, n_trials) """
+        trial_durations = self.stim_duration[orders]+itis
+        starts = self.start_duration+np.concatenate([np.zeros((len(orders), 1)), np.cumsum(trial_durations, axis=1)[:,:-1]], axis=1)
+        if self.iti_first:
+            starts += itis
+
+        return starts
+
+    def design_matrix(self, orders, itis):
+        """ HRF-convolved regressors of shape (n_sets, n_conditions, n_samples) """
+        orders = np.atleast_2d(orders)
+        n_sets = len(orders)
+        positions = np.rint(self.onsets(orders, np.atleast_2d(itis))/self.dt).astype(int)[...,np.newaxis]+np.arange(self.kernel_length)
+        rows = (np.arange(n_sets)[:,np.newaxis]*self.n_conditions+orders)[...,np.newaxis]*self.n_samples
+
+        # responses to all stimuli of all designs at once; parts after the end of the run are dropped
+        inside = positions < self.n_samples
+        flat = np.broadcast_to(rows+positions, positions.shape)[inside]
+        weights = self.kernels[orders][inside]
+        X = np.bincount(flat, weights=weights, minlength=n_sets*self.n_conditions*self.n_samples)
+        return X.reshape(n_sets, self.n_conditions, self.n_samples)
+
+    def efficiency(self, orders, itis):
+        """efficiency
+
+        Design efficiency `n_contrasts/trace(C (X'X)^-1 C')` of each design, with mean-centred regressors (i.e., an
+        intercept in the model).
+
+        Parameters
+        ----------
+        orders: numpy.ndarray
+            condition indices of shape (n_sets, n_trials)
+        itis: numpy.ndarray
+            ITIs of shape (n_sets, n_trials)
+
+        Returns
+        ----------
+        numpy.ndarray
+            efficiency per design (higher is better)
+        """
+
+        X = self.design_matrix(orders, itis)
+        X -= X.mean(axis=2, keepdims=True)
+        XtX = np.matmul(X, X.transpose(0,2,1))
+        variances = np.einsum("ck,nkl,cl->n", self.contrasts, np.linalg.pinv(XtX), self.contrasts)
+        return len(self.contrasts)/variances
+
+def _search(args):
+    # one worker: `n_candidates` random designs in batches; returns the best and the number evaluated
+    space, n_candidates, batch_size, seed = args
+    np.random.seed(seed)
+    best = (-np.inf, None, None)
+    for start in range(0, n_candidates, batch_size):
+        orders, itis = space.draw(min(batch_size, n_candidates-start))
+        scores = space.efficiency(orders, itis)
+        ix = np.argmax(scores)
+        if scores[ix] > best[0]:
+            best = (scores[ix], orders[ix], itis[ix])
+
+    return best+(n_candidates,)
+
+def optimize(space, n_candidates=100000, batch_size=250, n_jobs=None, seed=None, verbose=False):
+    """optimize
+
+    Random search over `space`, in batches of `batch_size` designs spread over `n_jobs` processes.
+
+    Parameters
+    ----------
+    space: DesignSpace
+        valid designs and their efficiency
+    n_candidates: int, optional
+        number of designs to evaluate, default = 100000
+    batch_size: int, optional
+        designs per batch, default = 250
+    n_jobs: int, optional
+        number of processes; defaults to the number of CPUs. 1 runs in the current process
+    seed: int, optional
+        seed of the search
+    verbose: bool, optional
+        print the number of designs per second
+
+    Returns
+    ----------
+    score: float
+        efficiency of the best design
+    order: numpy.ndarray
+        condition index per trial
+    itis: numpy.ndarray
+        ITI per trial
+    """
+
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+
+    # a few tasks per process, so that the processes finish at about the same time
+    n_tasks = max(1, min(n_jobs*4, n_candidates//batch_size))
+    seeds = np.random.RandomState(seed).randint(2**31-1, size=n_tasks)
+    sizes = np.full(n_tasks, n_candidates//n_tasks)
+    sizes[:n_candidates % n_tasks] += 1
+    tasks = [(space, int(n), batch_size, int(s)) for n, s in zip(sizes, seeds)]
+
+    start = time.perf_counter()
+    if n_jobs == 1:
+        results = [_search(task) for task in tasks]
+    else:
+        with multiprocessing.Pool(n_jobs) as pool:
+            results = pool.map(_search, tasks)
+
+    elapsed = time.perf_counter()-start
+    score, order, itis, _ = max(results, key=lambda i: i[0])
+    if verbose:
+        print(f"Evaluated {n_candidates} designs in {round(elapsed,2)}s ({int(n_candidates/elapsed)}/s, {n_jobs} processes)")
+
+    return score, order, itis
+
+def main(argv):
+
+    """efficiency.py
+
+    Write order- and ITI-files for ActNorm, ActNorm3 or ActNorm4 with the highest design efficiency among random
+    valid designs (see `lineexps.efficiency.DesignSpace`). The efficiency of existing files is printed for comparison
+    if they have as many trials as the design space. Existing files are only replaced with `--overwrite`.
+
+    Parameters
+    ----------
+    <exp>                   experiment folder: ActNorm, ActNorm3 or ActNorm4
+    -t|--task <list>        tasks to create files for [default = SRFa,SRFb,SRFi]
+    -n|--candidates <n>     designs evaluated per task [default = 100000]
+    -b|--batch <n>          designs per batch [default = 250]
+    -j|--jobs <n>           number of processes [default = number of CPUs]
+    -c|--contrasts <str>    'main', 'diff' or 'all' [default = all]
+    -d|--dt <s>             time resolution of the design matrix [default = 0.1]
+    -s|--seed <n>           seed of the search
+    -o|--out <dir>          folder to write the files to [default = experiment folder]
+    -w|--overwrite          replace existing files [default = leave them]
+    -x|--dry                don't write files
+    -q|--help               bring up this help text
+
+    Example
+    ----------
+    >>> python -m lineexps.efficiency ActNorm3
+    >>> python -m lineexps.efficiency ActNorm4 --task SRFa --candidates 1000000 --contrasts diff --overwrite
+    """
+
+    tasks           = ["SRFa","SRFb","SRFi"]
+    n_candidates    = 100000
+    batch_size      = 250
+    n_jobs          = None
+    contrasts       = "all"
+    dt              = 0.1
+    seed            = None
+    out_dir         = None
+    dry             = False
+    overwrite       = False
+
+    try:
+        opts, args = getopt.gnu_getopt(argv,"qxwt:n:b:j:c:d:s:o:",["help", "dry", "overwrite", "task=", "candidates=", "batch=", "jobs=", "contrasts=", "dt=", "seed=", "out="])
+    except getopt.GetoptError:
+        print("ERROR while handling arguments.. Did you specify an 'illegal' argument..?")
+        print(main.__doc__)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ('-q', '--help'):
+            print(main.__doc__)
+            sys.exit()
+        elif opt in ("-t", "--task"):
+            tasks = arg.split(",")
+        elif opt in ("-n", "--candidates"):
+            n_candidates = int(arg)
+        elif opt in ("-b", "--batch"):
+            batch_size = int(arg)
+        elif opt in ("-j", "--jobs"):
+            n_jobs = int(arg)
+        elif opt in ("-c", "--contrasts"):
+            contrasts = arg
+        elif opt in ("-d", "--dt"):
+            dt = float(arg)
+        elif opt in ("-s", "--seed"):
+            seed = int(arg)
+        elif opt in ("-o", "--out"):
+            out_dir = arg
+        elif opt in ("-x", "--dry"):
+            dry = True
+        elif opt in ("-w", "--overwrite"):
+            overwrite = True
+
+    if len(args) != 1:
+        print(main.__doc__)
+        sys.exit(2)
+
+    exp = args[0]
+    exp_dir = exp if os.path.isdir(exp) else opj(repo_dir, exp)
+    if out_dir is None:
+        out_dir = exp_dir
+
+    space = DesignSpace.from_settings(exp_dir, dt=dt, contrasts=contrasts)
+    print(f"{os.path.basename(os.path.normpath(exp_dir))}: {space.n_repetitions} x {space.evs}, runs up to {space.intended_duration}s")
+
+    for ix, task in enumerate(tasks):
+        order_file = opj(out_dir, f"order_task-{task}.txt")
+        iti_file = opj(out_dir, f"itis_task-{task}.txt")
+        exists = os.path.exists(order_file) or os.path.exists(iti_file)
+        if os.path.exists(order_file) and os.path.exists(iti_file):
+            current_order = np.atleast_1d(np.loadtxt(order_file).astype(int))
+            current_itis = np.atleast_1d(np.loadtxt(iti_file))
+            if len(current_order) == len(current_itis) == space.n_trials:
+                current = space.efficiency(current_order[np.newaxis], current_itis[np.newaxis])[0]
+                print(f"task-{task}: efficiency of current files = {round(current,4)}")
+            else:
+                print(f"WARNING: task-{task}: current files have {len(current_order)} trials, the design space has {space.n_trials}; not compared")
+
+        score, order, itis = optimize(space, n_candidates=n_candidates, batch_size=batch_size, n_jobs=n_jobs, seed=None if seed is None else seed+ix, verbose=True)
+        print(f"task-{task}: best efficiency = {round(score,4)}; total ITI = {round(itis.sum(),2)}s")
+
+        if exists and not overwrite:
+            print(f"task-{task}: {order_file} and/or {iti_file} exist; not written (use --overwrite to replace them)")
+        elif not dry:
+            os.makedirs(out_dir, exist_ok=True)
+            np.savetxt(order_file, order, fmt="%d")
+            np.savetxt(iti_file, itis)
+            print(f"Wrote {order_file} and {iti_file}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,188 @@
+"""
+Colour switches of the fixation dot.
+
+Several experiments have participants press a button whenever the fixation dot changes colour. The switch times are
+drawn when the session is created; during the run, the colour to draw is looked up from the current time. Previously,
+each session walked a pair of pointers through the switch times once per frame, which skipped a frame (nothing was
+drawn) on every second switch and needed special handling of the end of the schedule. `FixationSchedule` keeps the
+switch times as a sorted array, finds the number of switches that have passed with `np.searchsorted`, and records the
+time at which each switch actually appeared on screen.
+
+`switch_times` draws the schedule itself: intervals between switches from a capped exponential, with all switches
+within a given period and (optionally) not too close to the onsets of stimuli.
+"""
+import numpy as np
+import os
+import pandas as pd
+from lineexps.itis import conditional_itis, return_itis
+
+def _distance_to(times, events):
+    # distance of each time to the nearest event (events sorted); works on arrays of any shape
+    ix = np.searchsorted(events, times)
+    left = events[np.clip(ix-1, 0, len(events)-1)]
+    right = events[np.clip(ix, 0, len(events)-1)]
+    return np.minimum(np.abs(times-left), np.abs(times-right))
+
+def switch_times(n_switches, period, mean_duration, minimal_duration, maximal_duration, avoid=None, min_spacing=0, batch_size=1000, n_batches=20, verbose=False):
+    """switch_times
+
+    Times of colour switches of the fixation dot. Candidate schedules are drawn in batches (intervals from
+    `lineexps.itis.return_itis`) and the first one that ends within `period`, with no switch within `min_spacing` of
+    any time in `avoid`, is used. If none is found after `n_batches`, the intervals are drawn conditional on a total
+    that fits in `period`, and switches that are too close to an event in `avoid` are left out. If that leaves no
+    switches, a ValueError is raised.
+
+    Parameters
+    ----------
+    n_switches: int
+        number of switches
+    period: float
+        the last switch happens before this time (s)
+    mean_duration: float
+        mean interval between switches
+    minimal_duration: float
+        shortest interval
+    maximal_duration: float
+        longest interval
+    avoid: list, numpy.ndarray, optional
+        times (e.g., stimulus onsets) that switches should stay away from
+    min_spacing: float, optional
+        minimal distance (s) between a switch and the times in `avoid`, default = 0
+    batch_size: int, optional
+        number of candidate schedules per batch, default = 1000
+    n_batches: int, optional
+        maximum number of batches, default = 20
+    verbose: bool, optional
+        print how the schedule was made
+
+    Returns
+    ----------
+    numpy.ndarray
+        sorted switch times
+
+    Example
+    ----------
+    >>> onsets = np.arange(30, 370, 20)
+    >>> times = switch_times(60, 370, 6, 4, 8, avoid=onsets, min_spacing=1)
+    >>> times[-1] < 370, _distance_to(times, onsets).min() >= 1
+    (True, True)
+    """
+
+    avoid = np.sort(np.asarray([] if avoid is None else avoid, dtype=float))
+    check_spacing = min_spacing > 0 and len(avoid) > 0
+
+    for _ in range(n_batches):
+        times = np.cumsum(return_itis(mean_duration, minimal_duration, maximal_duration, (batch_size, n_switches)), axis=1)
+        ok = times[:,-1] <= period
+        if check_spacing:
+            ok &= np.all(_distance_to(times, avoid) >= min_spacing, axis=1)
+
+        accepted = np.flatnonzero(ok)
+        if len(accepted) > 0:
+            if verbose:
+                print(f"Fixation switches: {n_switches} in {round(times[accepted[0],-1],2)}s")
+            return times[accepted[0]]
+
+    # expected total of the capped exponential, or less if that doesn't fit
+    scale = mean_duration-minimal_duration
+    expected = minimal_duration+scale*(1-np.exp(-(maximal_duration-minimal_duration)/scale))
+    total = min(n_switches*expected, period)
+    times = np.cumsum(conditional_itis(minimal_duration, maximal_duration, n_switches, total, scale=scale, batch_size=batch_size, n_batches=n_batches))
+
+    n_dropped = 0
+    if check_spacing:
+        keep = _distance_to(times, avoid) >= min_spacing
+        n_dropped = int(np.sum(~keep))
+        times = times[keep]
+
+    if len(times) == 0:
+        raise ValueError(f"None of the {n_switches} fixation switches is at least {min_spacing}s away from the {len(avoid)} times in `avoid`; lower `min_spacing` or change the switch intervals")
+
+    if verbose:
+        print(f"Fixation switches: {len(times)} in {round(times[-1],2)}s (drawn conditional on the total; {n_dropped} left out near onsets)")
+
+    return times
+
+class FixationSchedule(object):
+
+    def __init__(self, switch_times, states=(0,1)):
+        """FixationSchedule
+
+        Parameters
+        ----------
+        switch_times: list, numpy.ndarray
+            times (in s, on the session clock) at which the fixation dot switches colour. Sorted on initialization
+        states: list, tuple, optional
+            states to cycle through; before the first switch `states[0]` is active, after the first switch
+            `states[1]`, etc. Can be anything, e.g. colours or the fixation stimuli themselves. Default = (0,1)
+
+        Example
+        ----------
+        >>> self.fixation_schedule = FixationSchedule(self.dot_switch_color_times, states=[self.fixation_disk_1, self.fixation_disk_0])
+        >>> self.fixation_schedule(self.clock.getTime()).draw()
+        """
+
+        self.switch_times   = np.sort(np.asarray(switch_times, dtype=float))
+        self.states         = list(states)
+        self.n_states       = len(self.states)
+        self.n_switches     = len(self.switch_times)
+
+        # time at which each switch was first drawn
+        self.shown_times    = np.full(self.n_switches, np.nan)
+
+        # number of switches passed at the last lookup, and the interval in which that count stays the same
+        self.n_passed       = 0
+        self._start         = -np.inf
+        self._end           = self.switch_times[0] if self.n_switches > 0 else np.inf
+
+    def n_passed_at(self, time):
+        """ Number of switches at or before `time` (vectorized; `time` can be an array) """
+        return np.searchsorted(self.switch_times, time, side="right")
+
+    def state_at(self, time):
+        """ State at `time`, without recording anything """
+        return self.states[int(self.n_passed_at(time)) % self.n_states]
+
+    def __call__(self, time):
+        """__call__
+
+        State at `time` (normally the current time of the session clock). If one or more switches have passed since
+        the previous call, `time` is recorded as the time at which they were shown.
+
+        Parameters
+        ----------
+        time: float
+            time on the session clock
+
+        Returns
+        ----------
+        object
+            active element of `states`
+        """
+
+        # within the same interval as the previous frame; no search needed
+        if self._start <= time < self._end:
+            return self.states[self.n_passed % self.n_states]
+
+        n_passed = int(self.n_passed_at(time))
+        if n_passed > self.n_passed:
+            self.shown_times[self.n_passed:n_passed] = time
+
+        self.n_passed   = n_passed
+        self._start     = self.switch_times[n_passed-1] if n_passed > 0 else -np.inf
+        self._end       = self.switch_times[n_passed] if n_passed < self.n_switches else np.inf
+
+        return self.states[n_passed % self.n_states]
+
+    def to_dataframe(self):
+        """ Dataframe with the scheduled and shown time of each switch, and the delay between them """
+        return pd.DataFrame({
+            "switch": np.arange(self.n_switches),
+            "scheduled": self.switch_times,
+            "shown": self.shown_times,
+            "delay": self.shown_times-self.switch_times}).set_index("switch")
+
+    def save(self, fname):
+        """ Write all switches to a tsv-file at once (switches that were never shown have 'n/a' as shown time) """
+        os.makedirs(os.path.dirname(os.path.abspath(fname)), exist_ok=True)
+        self.to_dataframe().to_csv(fname, sep="\t", na_rep="n/a")
@@ -0,0 +1,152 @@
+"""
+Selection of flickering/moving checkerboard phases.
+
+Several experiments decide on every frame which of a set of checkerboard textures to draw, based on the current
+time and a flicker frequency. Rather than evaluating trigonometry and comparison cascades per frame, the mapping from
+time to texture index is precomputed as a lookup table, so that the frame loop only does a multiplication, a modulo
+and an array index.
+"""
+import numpy as np
+
+# used if the frame rate of the window could not be measured
+DEFAULT_REFRESH_RATE = 60
+
+def phase_lookup_table(flicker_frequency, refresh_rate=None, n_phases=8):
+    """phase_lookup_table
+
+    Create a table mapping phase bins of one flicker cycle onto texture indices (0, ..., n_phases-1). The number of
+    bins is chosen such that every bin is at most one frame long and the texture boundaries coincide with bin
+    boundaries, so indexing the table is exact (not quantized to frames).
+
+    Parameters
+    ----------
+    flicker_frequency: float
+        number of cycles (through all `n_phases` textures) per second
+    refresh_rate: float, optional
+        refresh rate of the monitor in Hz. Defaults to `DEFAULT_REFRESH_RATE`
+    n_phases: int, optional
+        number of textures in one cycle, default = 8
+
+    Returns
+    ----------
+    numpy.ndarray
+        integer array of length n_bins (a multiple of `n_phases`). Reversing the table (`table[::-1]`) reverses the
+        direction of motion
+
+    Example
+    ----------
+    >>> table = phase_lookup_table(3, refresh_rate=120)
+    >>> table.shape
+    (40,)
+    >>> table[int(t*3*table.shape[0]) % table.shape[0]] # texture index at time t
+    """
+
+    if refresh_rate is None or refresh_rate <= 0:
+        refresh_rate = DEFAULT_REFRESH_RATE
+
+    bins_per_phase = max(1, int(np.ceil(refresh_rate/(flicker_frequency*n_phases))))
+    n_bins = n_phases*bins_per_phase
+    return np.arange(n_bins)//bins_per_phase
+
+class PhaseSelector(object):
+
+    def __init__(self, flicker_frequency, refresh_rate=None, n_phases=8):
+        """PhaseSelector
+
+        Pick a texture index from the current time with a single lookup. The forward and reversed tables are stacked,
+        so the direction is selected by indexing as well.
+
+        Parameters
+        ----------
+        flicker_frequency: float
+            number of cycles per second
+        refresh_rate: float, optional
+            refresh rate of the monitor in Hz
+        n_phases: int, optional
+            number of textures in one cycle, default = 8
+
+        Example
+        ----------
+        >>> selector = PhaseSelector(3, refresh_rate=120)
+        >>> selector(0.1, direction=0)
+        2
+        >>> selector(0.1, direction=1)
+        5
+        """
+
+        self.flicker_frequency  = flicker_frequency
+        self.n_phases           = n_phases
+        table                   = phase_lookup_table(flicker_frequency, refresh_rate=refresh_rate, n_phases=n_phases)
+        self.n_bins             = table.shape[0]
+        self.bins_per_second    = flicker_frequency*self.n_bins
+
+        # plain lists; indexing a list with a python int is faster than indexing a numpy array
+        self.tables             = (table.tolist(), table[::-1].tolist())
+
+    def __call__(self, time, direction=0):
+        return self.tables[1 if direction else 0][int(time*self.bins_per_second) % self.n_bins]
+
+class FlickerSchedule(object):
+
+    def __init__(self, frequency, refresh_rate=None, lock_to_frames=False):
+        """FlickerSchedule
+
+        Contrast-reversal state (0 or 1) of a flickering stimulus, replacing the per-frame
+        `np.fmod(stim_duration+timer.getTime(), 1/frequency)*frequency < 0.5`. State 0 is the first half of a cycle
+        (`stimulus_1`), state 1 the second half (`stimulus_2`).
+
+        By default, the state is derived from the elapsed time, like before. With `lock_to_frames=True`, the elapsed
+        time is rounded to the nearest frame and every half-cycle lasts exactly the same number of frames, so the duty
+        cycle no longer depends on jitter of the timer. In that case, the frequency is rounded to the nearest one that
+        fits the refresh rate (e.g., 8Hz at 120Hz = 7.5 frames per half-cycle > 8 frames, or 7.5Hz).
+
+        Parameters
+        ----------
+        frequency: float
+            number of full (two-reversal) cycles per second
+        refresh_rate: float, optional
+            refresh rate of the monitor in Hz. Defaults to `DEFAULT_REFRESH_RATE`
+        lock_to_frames: bool, optional
+            lock reversals to frame boundaries, default = False
+
+        Example
+        ----------
+        >>> flicker = FlickerSchedule(8, refresh_rate=120)
+        >>> flicker(0.05)           # state at 50ms after stimulus onset
+        0
+        >>> flicker.state_at_frame(8)
+        1
+        """
+
+        if refresh_rate is None or refresh_rate <= 0:
+            refresh_rate = DEFAULT_REFRESH_RATE
+
+        self.frequency          = frequency
+        self.refresh_rate       = refresh_rate
+        self.lock_to_frames     = lock_to_frames
+        self.reversals_per_sec  = 2.0*frequency
+
+        # one cycle of states, per frame
+        self.frames_per_half    = max(1, int(round(refresh_rate/self.reversals_per_sec)))
+        if lock_to_frames:
+            self.table          = [0]*self.frames_per_half + [1]*self.frames_per_half
+            self.actual_frequency = refresh_rate/(2.0*self.frames_per_half)
+        else:
+            self.actual_frequency = frequency
+
+    def state_at_frame(self, frame):
+        """ Contrast-reversal state at a frame index (counted from stimulus onset) """
+        if self.lock_to_frames:
+            return self.table[frame % len(self.table)]
+
+        return int(frame*self.reversals_per_sec/self.refresh_rate) % 2
+
+    def __call__(self, elapsed):
+        """ Contrast-reversal state at `elapsed` seconds after stimulus onset """
+        if elapsed < 0:
+            return 0
+
+        if self.lock_to_frames:
+            return self.table[int(elapsed*self.refresh_rate+0.5) % len(self.table)]
+
+        return int(elapsed*self.reversals_per_sec) % 2
@@ -0,0 +1,159 @@
+"""
+Record the time of every flip of the window, so that dropped frames can be traced back to a trial and phase.
+
+`FrameRecorder` replaces `session.win.flip` with a thin wrapper that stores the flip time, trial number and phase in
+preallocated arrays (a ring buffer; nothing is allocated during the experiment). When the session is closed, the
+intervals between flips are compared with the refresh period of the monitor, and the recording is written to
+`<output_str>_frames.npz` next to the `_events.tsv`-file.
+
+The trial and phase are read from `session.current_trial`, which the run loops of the sessions set before running a
+trial. Times are taken from `session.clock`, so they are in the same timebase as the onsets in the events file.
+"""
+import numpy as np
+import os
+import pandas as pd
+
+# used if the frame rate of the window could not be measured
+DEFAULT_REFRESH_RATE = 60
+
+class FrameRecorder(object):
+
+    def __init__(self, session, capacity=2**18, threshold=1.5, refresh_rate=None):
+        """FrameRecorder
+
+        Parameters
+        ----------
+        session: exptools2.core.Session
+            session to record flips of. `session.win.flip` is wrapped on initialization
+        capacity: int, optional
+            number of flips to keep. Default = 2**18, which is ~36 minutes at 120Hz (3.5MB). If more flips are recorded,
+            the oldest are overwritten
+        threshold: float, optional
+            intervals longer than `threshold` times the refresh period are flagged as dropped frames, default = 1.5
+        refresh_rate: float, optional
+            refresh rate of the monitor in Hz. Defaults to `session.actual_framerate`, or 60Hz if that is unavailable
+
+        Example
+        ----------
+        >>> self.frames = FrameRecorder(self)    # in Session.__init__, after the window has been created
+        >>> self.frames.save(opj(self.output_dir, self.output_str+'_frames.npz'))
+        """
+
+        if refresh_rate is None:
+            refresh_rate = getattr(session, "actual_framerate", None)
+
+        if refresh_rate is None or refresh_rate <= 0:
+            refresh_rate = DEFAULT_REFRESH_RATE
+
+        self.session        = session
+        self.capacity       = int(capacity)
+        self.threshold      = threshold
+        self.refresh_period = 1.0/refresh_rate
+        self.flip_times     = np.zeros(self.capacity)
+        self.trial_nrs      = np.full(self.capacity, -1, dtype=np.int32)
+        self.phases         = np.full(self.capacity, -1, dtype=np.int16)
+        self.n_flips        = 0
+        self.saved          = False
+
+        # wrap the flip of the window
+        self._flip          = session.win.flip
+        session.win.flip    = self.flip
+
+    def flip(self, *args, **kwargs):
+        """ Flip the window and record time, trial and phase """
+
+        flip_time = self._flip(*args, **kwargs)
+
+        ix = self.n_flips % self.capacity
+        self.flip_times[ix] = self.session.clock.getTime()
+        trial = getattr(self.session, "current_trial", None)
+        if trial is not None:
+            self.trial_nrs[ix] = trial.trial_nr
+            self.phases[ix] = trial.phase
+        else:
+            self.trial_nrs[ix] = -1
+            self.phases[ix] = -1
+
+        self.n_flips += 1
+        return flip_time
+
+    def get_data(self):
+        """get_data
+
+        Recorded flips in chronological order, with the interval since the previous flip and whether that interval
+        counts as a dropped frame.
+
+        Returns
+        ----------
+        dict
+            dictionary with arrays 'flip_time', 'trial_nr', 'phase', 'interval' and 'dropped'
+        """
+
+        n = min(self.n_flips, self.capacity)
+        order = np.arange(self.n_flips-n, self.n_flips) % self.capacity
+
+        flip_times = self.flip_times[order]
+        intervals = np.r_[np.nan, np.diff(flip_times)]
+        return {
+            "flip_time": flip_times,
+            "trial_nr": self.trial_nrs[order],
+            "phase": self.phases[order],
+            "interval": intervals,
+            "dropped": intervals > self.threshold*self.refresh_period}
+
+    def summary(self):
+        """summary
+
+        Number of flips and dropped frames per trial. A dropped frame is attributed to the trial of the flip that
+        came late.
+
+        Returns
+        ----------
+        pandas.DataFrame
+            dataframe indexed by trial_nr with columns 'n_flips', 'n_dropped' and 'max_interval' (in s)
+        """
+
+        data = self.get_data()
+        df = pd.DataFrame({
+            "trial_nr": data["trial_nr"],
+            "dropped": data["dropped"],
+            "interval": data["interval"]})
+
+        return df.groupby("trial_nr").agg(
+            n_flips=("dropped", "size"),
+            n_dropped=("dropped", "sum"),
+            max_interval=("interval", "max"))
+
+    def save(self, fname, verbose=True):
+        """save
+
+        Write the recording to a compressed `.npz`-file and print the dropped frames per trial. Only the first call
+        writes anything, so it is safe to call from `close()` (which may be called more than once).
+
+        Parameters
+        ----------
+        fname: str
+            output file (e.g., `<output_dir>/<output_str>_frames.npz`)
+        verbose: bool, optional
+            print summary of dropped frames
+        """
+
+        if self.saved:
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(fname)), exist_ok=True)
+        data = self.get_data()
+        np.savez_compressed(
+            fname,
+            refresh_period=self.refresh_period,
+            threshold=self.threshold,
+            **data)
+
+        self.saved = True
+
+        if verbose:
+            summary = self.summary()
+            dropped = summary.loc[summary["n_dropped"] > 0]
+            print(f"Dropped frames: {int(data['dropped'].sum())}/{len(data['dropped'])} flips (interval > {self.threshold} x {round(self.refresh_period*1000,2)}ms)")
+            for trial_nr, row in dropped.iterrows():
+                print(f"\ttrial {trial_nr}: {int(row['n_dropped'])}/{int(row['n_flips'])} (max interval = {round(row['max_interval']*1000,2)}ms)")
@@ -0,0 +1,228 @@
+"""
+Loading of image stimuli from HDF5-files.
+
+The scenes experiment stores its images as one (n_images, height, width) dataset of 8-bit values. Reading the whole
+dataset with `np.array(...)` and scaling it to PsychoPy's -1..1 range creates a float64 copy of every image, even though
+a run only shows a small fraction of them. `load_images` reads only the rows it is asked for (as slices of contiguous
+rows, in chunks) and converts them to float32 in place. `ImageTextureCache` then bounds how many of those images are
+resident as textures at the same time.
+"""
+import h5py
+import numpy as np
+import time
+from collections import OrderedDict
+from lineexps.textures import process_memory
+
+def dataset_shape(fname, dataset="stimuli"):
+    """ Shape of a dataset, without reading it """
+    with h5py.File(fname, "r") as h5file:
+        return h5file[dataset].shape
+
+def to_rgb(images):
+    """ Scale 8-bit images to PsychoPy's -1..1 range in place (same as `-1 + images/128`) """
+    images /= 128
+    images -= 1
+    return images
+
+def load_images(fname, indices, dataset="stimuli", chunk_size=64, dtype=np.float32):
+    """load_images
+
+    Read a subset of images from an HDF5-file and scale them to -1..1.
+
+    Parameters
+    ----------
+    fname: str
+        path to the HDF5-file
+    indices: list, numpy.ndarray
+        indices of the images (first axis of the dataset) to read. Duplicates are read once
+    dataset: str, optional
+        name of the dataset, default = 'stimuli'
+    chunk_size: int, optional
+        number of images per read, default = 64
+    dtype: numpy.dtype, optional
+        data type of the returned images, default = np.float32
+
+    Returns
+    ----------
+    dict
+        dictionary mapping each index onto its image. The images are views into one array
+
+    Example
+    ----------
+    >>> images = load_images("stims_512.h5", [3, 10, 7])
+    >>> images[10].shape, images[10].dtype
+    ((512, 512), dtype('float32'))
+    """
+
+    indices = np.unique(np.asarray(indices, dtype=int))
+
+    # contiguous runs of indices are read as one slice (fancy indexing in h5py is slow); long runs are split in chunks
+    breaks = np.flatnonzero(np.diff(indices) != 1)+1
+    starts = np.r_[0, breaks]
+    stops = np.r_[breaks, len(indices)]
+
+    with h5py.File(fname, "r") as h5file:
+        data = h5file[dataset]
+        images = np.empty((len(indices),)+data.shape[1:], dtype=dtype)
+        for start, stop in zip(starts, stops):
+            for chunk_start in range(start, stop, chunk_size):
+                chunk_stop = min(chunk_start+chunk_size, stop)
+                images[chunk_start:chunk_stop] = data[indices[chunk_start]:indices[chunk_stop-1]+1]
+
+    to_rgb(images)
+    return {int(ix): img for ix, img in zip(indices, images)}
+
+def load_all_images(fname, dataset="stimuli"):
+    """ Read all images as float64 in the -1..1 range; the original loading of the scenes experiment """
+    with h5py.File(fname, "r") as h5file:
+        return (-1 + np.array(h5file.get(dataset)) / 128)*1
+
+class LoadReport(object):
+
+    def __init__(self, name):
+        """LoadReport
+
+        Measure the wall-clock time and memory of a loading step, to print next to the number of images it loaded.
+
+        Parameters
+        ----------
+        name: str
+            name of the step in the report
+
+        Example
+        ----------
+        >>> report = LoadReport("images")
+        >>> images = load_images(fname, ids)
+        >>> print(report.done(len(images)))
+        images: 331 images in 0.41s (RSS = 612.3MB, peak = 640.1MB)
+        """
+
+        self.name   = name
+        self.start  = time.perf_counter()
+
+    def done(self, n_images):
+        elapsed = time.perf_counter()-self.start
+        rss, peak = process_memory()
+        mem = ", ".join([f"{label} = {round(value/1024**2,1)}MB" for label, value in [("RSS", rss), ("peak", peak)] if value is not None])
+        return f"{self.name}: {n_images} images in {round(elapsed,2)}s ({mem})"
+
+def texture_nbytes(n_textures, tex_res, bytes_per_texel=12):
+    """ Estimated GPU memory of `n_textures` square textures; PsychoPy uploads numpy textures as 3 float32 channels """
+    return n_textures*tex_res**2*bytes_per_texel
+
+def texture_report(n_textures, tex_res):
+    """ One-line summary of the number of textures and their estimated GPU memory """
+    return f"{n_textures} textures of {tex_res}x{tex_res} (~{round(texture_nbytes(n_textures, tex_res)/1024**2,1)}MB GPU memory)"
+
+class ImageTextureCache(object):
+
+    def __init__(self, images, make_stim, tex_res, budget_mb=512):
+        """ImageTextureCache
+
+        Keep the stimuli (and thereby the GPU textures) of at most `budget_mb` worth of images. Stimuli are created on
+        request and the least recently used ones are dropped when the budget is exceeded. The images that are about to
+        be shown can be queued with `prefetch`, and uploaded a few per frame with `upload_next` while nothing else is
+        happening (e.g., in the ITI), so that no upload is needed on the frame an image is shown.
+
+        Parameters
+        ----------
+        images: dict
+            dictionary mapping image indices onto arrays (e.g., from `load_images`)
+        make_stim: callable
+            function that creates the stimulus of an image array (this uploads the texture)
+        tex_res: int
+            resolution of the (square) textures, to estimate their memory
+        budget_mb: float, optional
+            maximum estimated GPU memory of the textures in MB, default = 512. At least one prefetched set of images
+            is always kept, even if it exceeds the budget
+
+        Example
+        ----------
+        >>> self.image_cache = ImageTextureCache(self.images, self.make_image_stim, tex_res, budget_mb=512)
+        >>> self.image_cache.prefetch(trial.image_ids)      # at the start of the ITI
+        >>> self.image_cache.upload_next()                  # on every frame of the ITI
+        >>> self.image_cache.get(ix).draw()                 # stimulus phase
+        """
+
+        self.images         = images
+        self.make_stim      = make_stim
+        self.nbytes         = texture_nbytes(1, tex_res)
+        self.budget         = budget_mb*1024**2
+        self.stims          = OrderedDict()
+        self.queue          = []
+        self.pinned         = set()
+        self.current        = None
+
+        self.hits           = 0
+        self.misses         = 0
+        self.evictions      = 0
+        self.upload_times   = {"prefetch": [], "late": []}
+
+    def _upload(self, ix, kind):
+        start = time.perf_counter()
+        stim = self.make_stim(self.images[ix])
+        self.upload_times[kind].append(time.perf_counter()-start)
+
+        self.stims[ix] = stim
+        self._evict()
+        return stim
+
+    def _evict(self):
+        # least recently used first; images that are queued for the coming stimulus phase are kept
+        for ix in list(self.stims.keys()):
+            if len(self.stims)*self.nbytes <= self.budget:
+                break
+
+            if ix not in self.pinned:
+                stim = self.stims.pop(ix)
+                clear = getattr(stim, "clearTextures", None)
+                if clear is not None:
+                    clear()
+
+                self.evictions += 1
+
+    def get(self, ix):
+        """ Stimulus of image `ix`; uploaded now (a 'late' upload) if it is not resident. An image is drawn on every
+        frame it is shown, so only a change of image counts as a lookup for the hit rate """
+        stim = self.stims.get(ix)
+        changed = ix != self.current
+        self.current = ix
+        if stim is not None:
+            self.stims.move_to_end(ix)
+            if changed:
+                self.hits += 1
+            return stim
+
+        self.misses += 1
+        return self._upload(ix, "late")
+
+    def prefetch(self, indices):
+        """ Queue images for upload, and protect them from eviction until the next call """
+        self.pinned = set(indices)
+        self.current = None
+        self.queue = [ix for ix in dict.fromkeys(indices) if ix not in self.stims]
+        for ix in indices:
+            if ix in self.stims:
+                self.stims.move_to_end(ix)
+
+    def upload_next(self, n=1):
+        """ Upload the next `n` queued images; returns the number of images that were uploaded """
+        n_uploaded = 0
+        while self.queue and n_uploaded < n:
+            ix = self.queue.pop(0)
+            if ix not in self.stims:
+                self._upload(ix, "prefetch")
+                n_uploaded += 1
+
+        return n_uploaded
+
+    def summary(self):
+        """ One-line summary of hit rate, evictions and upload times """
+        lookups = self.hits+self.misses
+        hit_rate = round(self.hits/lookups*100, 2) if lookups > 0 else 0
+        uploads = []
+        for kind, times in self.upload_times.items():
+            if len(times) > 0:
+                uploads.append(f"{len(times)} {kind} (mean = {round(np.mean(times)*1000,2)}ms, max = {round(np.max(times)*1000,2)}ms)")
+
+        return f"Texture cache: {hit_rate}% hits ({self.hits}/{lookups} images shown), {self.evictions} evicted, uploads: {', '.join(uploads) if uploads else 'none'}"
@@ -0,0 +1,183 @@
+"""
+Inter-trial intervals drawn from a (shifted, truncated) exponential distribution with a fixed total duration.
+
+The experiments draw ITIs as `minimal + exponential(mean - minimal)`, capped at `maximal`, and want the total to be
+within `leeway` of `n_trials*mean` so that runs have a predictable length. Previously, each session redrew all ITIs
+until the total happened to land in that window, without a limit on the number of attempts; for small leeways or many
+trials, that can take very long (and never finishes for a leeway of 0). `iterative_itis` now:
+
+1. draws the ITIs in batches (many candidate sets at once) and keeps the first set whose total is within the leeway,
+   which gives exactly the same distribution as the loop, but only for a limited number of batches
+2. otherwise, samples the ITIs conditional on their total: exponentials that are divided by their sum are uniformly
+   distributed on the simplex, so scaling them to the time above `minimal` gives the exact total. Sets in which an
+   ITI exceeds `maximal` are rejected (again in batches); if that keeps failing, the excess of ITIs above `maximal` is
+   moved to the other ITIs
+
+`iti_report` compares the ITIs with the truncated exponential they are drawn from (Kolmogorov-Smirnov test).
+"""
+import numpy as np
+from scipy import stats
+
+def return_itis(mean_duration, minimal_duration, maximal_duration, n_trials):
+    """ ITIs of `minimal_duration` plus an exponential with mean `mean_duration-minimal_duration`, capped at `maximal_duration` """
+    itis = np.random.exponential(scale=mean_duration-minimal_duration, size=n_trials)
+    itis += minimal_duration
+    itis[itis>maximal_duration] = maximal_duration
+    return itis
+
+def _rejection(mean_duration, minimal_duration, maximal_duration, n_trials, low, high, batch_size, n_batches):
+    # same distribution as redrawing until the total is in [low, high], but many sets at once; batches start small
+    # (most settings accept one of the first few sets) and grow to `batch_size`
+    for ix in range(n_batches):
+        itis = return_itis(mean_duration, minimal_duration, maximal_duration, (min(batch_size, 16*4**ix), n_trials))
+        totals = itis.sum(axis=1)
+        ok = np.flatnonzero((totals >= low) & (totals <= high))
+        if len(ok) > 0:
+            return itis[ok[0]]
+
+    return None
+
+def _redistribute(excess, cap):
+    # move the part of each value above `cap` to the values below it, proportional to their room; keeps the sum
+    excess = excess.copy()
+    for _ in range(len(excess)):
+        over = excess > cap
+        if not np.any(over):
+            break
+
+        surplus = np.sum(excess[over]-cap)
+        excess[over] = cap
+        room = cap-excess
+        excess += surplus*room/room.sum()
+
+    return excess
+
+def conditional_itis(minimal_duration, maximal_duration, n_trials, total, scale=1, batch_size=1000, n_batches=20):
+    """conditional_itis
+
+    ITIs with an exact `total`: independent exponentials conditioned on their sum are uniform on the simplex, so the
+    time above `minimal_duration` is divided over the trials by normalized exponentials. Sets in which an ITI exceeds
+    `maximal_duration` are rejected; if no set is accepted after `n_batches`, the excess is redistributed.
+
+    Parameters
+    ----------
+    minimal_duration: float
+        shortest ITI
+    maximal_duration: float
+        longest ITI
+    n_trials: int
+        number of ITIs
+    total: float
+        sum of the ITIs
+    scale: float, optional
+        scale of the exponentials; doesn't affect the result (only there for symmetry with `return_itis`)
+    batch_size: int, optional
+        number of candidate sets per batch, default = 1000
+    n_batches: int, optional
+        maximum number of batches, default = 20
+
+    Returns
+    ----------
+    numpy.ndarray
+        ITIs summing to `total`
+    """
+
+    excess = total-n_trials*minimal_duration
+    cap = maximal_duration-minimal_duration
+    if excess < 0 or excess > n_trials*cap:
+        raise ValueError(f"A total of {total}s can't be divided over {n_trials} ITIs between {minimal_duration}s and {maximal_duration}s")
+
+    for _ in range(n_batches):
+        draws = np.random.exponential(scale=scale, size=(batch_size, n_trials))
+        draws *= excess/draws.sum(axis=1, keepdims=True)
+        ok = np.flatnonzero(np.all(draws <= cap, axis=1))
+        if len(ok) > 0:
+            return minimal_duration+draws[ok[0]]
+
+    return minimal_duration+_redistribute(draws[0], cap)
+
+def iterative_itis(mean_duration=6, minimal_duration=3, maximal_duration=18, n_trials=None, leeway=0, verbose=False, total=None, batch_size=1000, n_batches=20):
+    """iterative_itis
+
+    ITIs with a total of `n_trials*mean_duration` (or `total`) +/- `leeway`, in bounded time. Sets are first drawn in
+    batches from the capped exponential (`return_itis`) and accepted if their total is within `leeway`; if none is
+    found after `n_batches` (or if `leeway` is 0), `conditional_itis` draws a set with exactly the target total.
+
+    Parameters
+    ----------
+    mean_duration: float, optional
+        mean ITI, default = 6
+    minimal_duration: float, optional
+        shortest ITI, default = 3
+    maximal_duration: float, optional
+        longest ITI, default = 18
+    n_trials: int
+        number of ITIs
+    leeway: float, optional
+        allowed difference between the total and the target, default = 0
+    verbose: bool, optional
+        print the total and how the ITIs were drawn
+    total: float, optional
+        target total; defaults to `n_trials*mean_duration`
+    batch_size: int, optional
+        maximum number of candidate sets per batch, default = 1000
+    n_batches: int, optional
+        maximum number of batches per stage, default = 20
+
+    Returns
+    ----------
+    numpy.ndarray
+        ITIs
+
+    Example
+    ----------
+    >>> itis = iterative_itis(mean_duration=6, minimal_duration=3, maximal_duration=18, n_trials=32, leeway=2)
+    >>> abs(itis.sum()-32*6) <= 2
+    True
+    """
+
+    if total is None:
+        total = n_trials*mean_duration
+
+    itis = None
+    method = "exact total"
+    if leeway > 0:
+        itis = _rejection(mean_duration, minimal_duration, maximal_duration, n_trials, total-leeway, total+leeway, batch_size, n_batches)
+        method = "batched rejection"
+
+    if itis is None:
+        itis = conditional_itis(minimal_duration, maximal_duration, n_trials, total, scale=mean_duration-minimal_duration, batch_size=batch_size, n_batches=n_batches)
+        method = "exact total"
+
+    if verbose:
+        print(f'ITIs created with total ITI duration of {round(itis.sum(),2)}s ({method}); {iti_report(itis, mean_duration, minimal_duration, maximal_duration)}')
+
+    return itis
+
+def iti_report(itis, mean_duration, minimal_duration, maximal_duration):
+    """iti_report
+
+    Compare ITIs with the exponential they are drawn from (shifted by `minimal_duration`, truncated at
+    `maximal_duration`) with a Kolmogorov-Smirnov test.
+
+    Parameters
+    ----------
+    itis: numpy.ndarray
+        ITIs
+    mean_duration: float
+        mean ITI of the (untruncated) distribution
+    minimal_duration: float
+        shortest ITI
+    maximal_duration: float
+        longest ITI
+
+    Returns
+    ----------
+    str
+        mean of the ITIs, KS statistic and p-value
+    """
+
+    scale = mean_duration-minimal_duration
+    ref = stats.truncexpon(b=(maximal_duration-minimal_duration)/scale, loc=minimal_duration, scale=scale)
+    ks = stats.kstest(np.asarray(itis), ref.cdf)
+    return f"mean = {round(np.mean(itis),2)}s (expected {round(ref.mean(),2)}s), KS = {round(ks.statistic,3)} (p = {round(ks.pvalue,3)})"
@@ -0,0 +1,288 @@
+"""
+Pre-decoded movie frames for looping video stimuli (`motor`).
+
+`MovieStim3` decodes its clip with ffmpeg while the movie is shown, so a slow decode shows up as a dropped frame.
+The clips are short and loop, so they can be decoded once, at the size they are shown at, into a uint8-array of
+shape (n_frames, height, width, 3). `FrameCache` stores that array as an `.npy`-file (keyed by the sha256 of the
+movie file and the size) and memory-maps it in later sessions; `FrameMovie` draws the frame that belongs to the
+elapsed time and only uploads a texture when the frame changes. No decoder runs during the presentation.
+
+The cache lives in `~/.cache/lineexps/movies` (see `lineexps.default_cache_dir`).
+"""
+import ctypes
+import hashlib
+import json
+import numpy as np
+import os
+from lineexps import default_cache_dir
+from lineexps.assets import file_hash
+opj = os.path.join
+
+# bump when the decoding changes so stale entries are not picked up
+CACHE_VERSION = 1
+
+def decode_movie(fname, size):
+    """decode_movie
+
+    Decode all frames of a movie, resized to `size`.
+
+    Parameters
+    ----------
+    fname: str
+        path to the movie file
+    size: list, tuple
+        (width, height) in pixels
+
+    Returns
+    ----------
+    fps: float
+        frame rate of the movie
+    frames: generator
+        uint8-arrays of shape (height, width, 3)
+    n_frames: int
+        (approximate) number of frames, from the duration and frame rate
+    """
+
+    from moviepy.video.io.VideoFileClip import VideoFileClip
+
+    width, height = [int(round(i)) for i in size]
+    clip = VideoFileClip(fname, audio=False, target_resolution=(height, width))
+    n_frames = int(np.ceil(clip.duration*clip.fps))
+
+    def frames():
+        try:
+            for frame in clip.iter_frames(fps=clip.fps, dtype="uint8"):
+                yield frame[...,:3]
+        finally:
+            clip.close()
+
+    return clip.fps, frames(), n_frames
+
+class FrameCache(object):
+
+    def __init__(self, cache_dir=None, verbose=False):
+        """FrameCache
+
+        Persistent cache of decoded movies. Entries are stored as `.npy`-files with a `.json`-sidecar (frame rate,
+        number of frames, source file), and are loaded memory-mapped (read-only).
+
+        Parameters
+        ----------
+        cache_dir: str, optional
+            directory to store the frames in. Defaults to `default_cache_dir("movies")`
+        verbose: bool, optional
+            print whether frames were loaded or decoded
+
+        Example
+        ----------
+        >>> cache = FrameCache()
+        >>> frames, fps = cache.get_frames("2hands.mp4", (1344, 756))
+        >>> frames.shape, frames.dtype
+        ((150, 756, 1344, 3), dtype('uint8'))
+        """
+
+        if cache_dir is None:
+            cache_dir = default_cache_dir("movies")
+        else:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self.cache_dir  = cache_dir
+        self.verbose    = verbose
+        self.hits       = 0
+        self.misses     = 0
+
+    def key(self, fname, size):
+        """ Hash of the content of the movie file, the size and the cache version """
+        params = {"sha256": file_hash(fname), "size": [int(round(i)) for i in size], "version": CACHE_VERSION}
+        return hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf8")).hexdigest()
+
+    def get_frames(self, fname, size):
+        """get_frames
+
+        Frames of `fname` at `size`, either from disk or by decoding (and storing) them.
+
+        Parameters
+        ----------
+        fname: str
+            path to the movie file
+        size: list, tuple
+            (width, height) in pixels at which the movie is shown
+
+        Returns
+        ----------
+        frames: numpy.memmap
+            read-only uint8-array of shape (n_frames, height, width, 3)
+        fps: float
+            frame rate of the movie
+        """
+
+        key = self.key(fname, size)
+        npy = opj(self.cache_dir, f"{key}.npy")
+        meta_file = opj(self.cache_dir, f"{key}.json")
+
+        if os.path.exists(npy) and os.path.exists(meta_file):
+            try:
+                with open(meta_file) as f:
+                    meta = json.load(f)
+
+                frames = np.load(npy, mmap_mode='r')
+                self.hits += 1
+                if self.verbose:
+                    print(f"Loaded {meta['n_frames']} frames of {fname} from {npy}")
+                return frames[:meta["n_frames"]], meta["fps"]
+            except (ValueError, OSError, KeyError):
+                # truncated/corrupt entry; fall through and decode again
+                pass
+
+        fps, frames, n_frames = decode_movie(fname, size)
+        self.misses += 1
+
+        # frames are written straight into the memory-mapped file; never more than one frame is held in memory
+        width, height = [int(round(i)) for i in size]
+        tmp = f"{npy}.{os.getpid()}.tmp"
+        out = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.uint8, shape=(n_frames+1, height, width, 3))
+        n_written = 0
+        for frame in frames:
+            if n_written == out.shape[0]:
+                break
+
+            out[n_written] = frame
+            n_written += 1
+
+        out.flush()
+        del out
+        os.replace(tmp, npy)
+
+        with open(meta_file, "w") as f:
+            json.dump({"source": os.path.abspath(fname), "fps": fps, "n_frames": n_written, "size": [width, height]}, f, indent=4)
+
+        if self.verbose:
+            print(f"Decoded {n_written} frames of {fname} to {npy}")
+
+        return np.load(npy, mmap_mode='r')[:n_written], fps
+
+class FrameMovie(object):
+
+    def __init__(self, win, frames, fps, size=None, pos=(0,0), units=None, loop=True, opacity=1.0):
+        """FrameMovie
+
+        Looping movie drawn from an array of uint8 RGB frames. Like `MovieStim3`, the movie runs on its own clock
+        from the moment it is created; on each `draw`, the frame belonging to the elapsed time is shown. The texture
+        is only updated when that frame differs from the one shown previously.
+
+        Parameters
+        ----------
+        win: psychopy.visual.Window
+            window to draw in
+        frames: numpy.ndarray
+            uint8-array of shape (n_frames, height, width, 3), e.g. from `FrameCache.get_frames`
+        fps: float
+            frame rate of the movie
+        size: list, tuple, optional
+            (width, height) of the movie in `units`; defaults to the size of the frames (in pixels)
+        pos: list, tuple, optional
+            centre of the movie in `units`, default = (0,0)
+        units: str, optional
+            units of `size` and `pos`; defaults to the units of the window
+        loop: bool, optional
+            start over after the last frame (otherwise the last frame is kept), default = True
+        opacity: float, optional
+            opacity of the movie, default = 1
+
+        Example
+        ----------
+        >>> frames, fps = FrameCache().get_frames("2hands.mp4", (1344, 756))
+        >>> movie = FrameMovie(win, frames, fps, size=(1344, 756), units="pix")
+        >>> movie.draw()
+        """
+
+        from psychopy import core
+        from psychopy.tools.monitorunittools import convertToPix
+
+        self.win        = win
+        self.frames     = frames
+        self.fps        = float(fps)
+        self.n_frames   = frames.shape[0]
+        self.loop       = loop
+        self.opacity    = opacity
+        self.units      = win.units if units is None else units
+        self.size       = np.asarray((frames.shape[2], frames.shape[1]) if size is None else size, dtype=float)
+        self.pos        = np.asarray(pos, dtype=float)
+        self.clock      = core.Clock()
+
+        # corners of the movie, in the order of MovieStim3 (texture coordinates in `draw`)
+        corners = np.array([[0.5,-0.5], [-0.5,-0.5], [-0.5,0.5], [0.5,0.5]])*self.size
+        self.vertices_pix = convertToPix(corners, self.pos, self.units, self.win)
+
+        self.frame_ix   = -1
+        self.n_uploads  = 0
+        self._create_texture()
+
+    def _create_texture(self):
+        from pyglet import gl as GL
+
+        self._texID = GL.GLuint()
+        GL.glGenTextures(1, ctypes.byref(self._texID))
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self._texID)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_LINEAR)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR)
+        GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+        height, width = self.frames.shape[1:3]
+        GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGB8, width, height, 0, GL.GL_RGB, GL.GL_UNSIGNED_BYTE, None)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+
+    def frame_at(self, time):
+        """ Index of the frame shown at `time` (s) after the start of the movie """
+        frame_ix = int(time*self.fps)
+        if self.loop:
+            return frame_ix % self.n_frames
+
+        return min(frame_ix, self.n_frames-1)
+
+    def _upload(self, frame_ix):
+        from pyglet import gl as GL
+
+        # a frame of a memory-mapped array is one contiguous block; only its pages are read from disk
+        frame = np.ascontiguousarray(self.frames[frame_ix])
+        height, width = frame.shape[:2]
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self._texID)
+        GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+        GL.glTexSubImage2D(GL.GL_TEXTURE_2D, 0, 0, 0, width, height, GL.GL_RGB, GL.GL_UNSIGNED_BYTE, frame.ctypes.data_as(ctypes.POINTER(ctypes.c_ubyte)))
+        self.frame_ix = frame_ix
+        self.n_uploads += 1
+
+    def draw(self, win=None):
+        from pyglet import gl as GL
+
+        win = self.win if win is None else win
+        frame_ix = self.frame_at(self.clock.getTime())
+        if frame_ix != self.frame_ix:
+            self._upload(frame_ix)
+
+        GL.glPushMatrix()
+        GL.glPushClientAttrib(GL.GL_CLIENT_ALL_ATTRIB_BITS)
+        win.setScale('pix')
+
+        # shaders of other stimuli would interpret the texture; draw with the fixed pipeline
+        GL.glUseProgram(0)
+        GL.glActiveTexture(GL.GL_TEXTURE1)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self._texID)
+        GL.glEnable(GL.GL_TEXTURE_2D)
+        GL.glTexEnvi(GL.GL_TEXTURE_ENV, GL.GL_TEXTURE_ENV_MODE, GL.GL_MODULATE)
+        GL.glColor4f(1, 1, 1, self.opacity)
+
+        v = self.vertices_pix
+        array = (GL.GLfloat * 20)(
+            1, 1, v[0,0], v[0,1], 0.,
+            0, 1, v[1,0], v[1,1], 0.,
+            0, 0, v[2,0], v[2,1], 0.,
+            1, 0, v[3,0], v[3,1], 0.)
+
+        GL.glInterleavedArrays(GL.GL_T2F_V3F, 0, array)
+        GL.glDrawArrays(GL.GL_QUADS, 0, 4)
+
+        GL.glPopClientAttrib()
+        GL.glPopMatrix()
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
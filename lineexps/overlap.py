@@ -0,0 +1,337 @@
+"""
+Overlap of the stimuli of different conditions, from screenshots or rendered frames.
+
+The stimuli of ActNorm3/4 are black and white on a grey background, so a pixel belongs to a stimulus if its red and
+green channels are both dark or both bright (which also leaves out the red fixation dot). The frames of a subject are
+read into one (n_conditions, height, width, 3) uint8 stack and thresholded at once. They can come from:
+
+- a directory with the png-files of `python main.py --png --demo` (decoded in parallel on a thread pool)
+- a `.npy`-file, e.g., from `python main.py --render frames.npy`; read memory-mapped, so `--frames` only loads the
+  selected frames
+- a `.npz`-file with a `frames` array, or with one array (image or stack) per condition
+- an `.h5`-file with a `frames` dataset (requires h5py)
+
+The figure has the overlap of all conditions (each in its own colour) in the first panel, followed by the frame of each
+condition. It is written next to the input as `<sub>_<ses>_<task>_<run>_<acq>_desc-stimuli.{svg,png}` (the BIDS
+components found in the path):
+
+>>> python -m lineexps.overlap ActNorm3/logs/sub-001_ses-1_task-SRFa_run-demo ActNorm3/logs/sub-002_ses-1_task-SRFa_run-demo
+"""
+import getopt
+import glob
+import numpy as np
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+opj = os.path.join
+
+# colours of the conditions in the overlap panel (red, green, blue first, then the rest of matplotlib's tab10)
+COLORS = np.array([
+    [1,0,0],
+    [0,0.5,0],
+    [0,0,1],
+    [1.000,0.498,0.055],
+    [0.580,0.404,0.741],
+    [0.549,0.337,0.294],
+    [0.890,0.467,0.761],
+    [0.498,0.498,0.498],
+    [0.737,0.741,0.133],
+    [0.090,0.745,0.812]])
+
+def read_image(fname):
+    """ Image file as uint8 RGB array (alpha is dropped) """
+    import matplotlib.image as mpimg
+
+    img = mpimg.imread(fname)[...,:3]
+    if img.dtype.kind == "f":
+        img = 255*img
+
+    return img.astype(np.uint8)
+
+def read_images(files, n_jobs=None):
+    """read_images
+
+    Decode image files on a thread pool and stack them.
+
+    Parameters
+    ----------
+    files: list
+        image files (all of the same size)
+    n_jobs: int, optional
+        number of threads; defaults to the choice of `ThreadPoolExecutor`
+
+    Returns
+    ----------
+    numpy.ndarray
+        uint8 array of shape (n_files, height, width, 3)
+    """
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        imgs = list(pool.map(read_image, files))
+
+    shapes = set(img.shape for img in imgs)
+    if len(shapes) > 1:
+        raise ValueError(f"Images have different sizes: {sorted(shapes)}")
+
+    return np.stack(imgs)
+
+def load_stack(path, frames=None, n_jobs=None):
+    """load_stack
+
+    Frames of one subject/run (see the module docstring for the formats).
+
+    Parameters
+    ----------
+    path: str
+        directory with png-files, or a .npy-, .npz- or .h5-file
+    frames: list, optional
+        indices of the frames to use (e.g., the trials/phases of the conditions in a rendered run); all if None
+    n_jobs: int, optional
+        number of threads to decode png-files with
+
+    Returns
+    ----------
+    numpy.ndarray
+        uint8 array (or memory map) of shape (n_frames, height, width, 3)
+    """
+
+    ext = os.path.splitext(path)[1].lower()
+    if os.path.isdir(path):
+        files = sorted(glob.glob(opj(path, "*.png")))
+        if len(files) == 0:
+            raise FileNotFoundError(f"No png-files in '{path}'")
+
+        if frames is not None:
+            files = [files[i] for i in frames]
+        return read_images(files, n_jobs=n_jobs)
+
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Could not find '{path}'")
+
+    if ext == ".npy":
+        stack = np.load(path, mmap_mode="r")
+    elif ext == ".npz":
+        with np.load(path) as f:
+            if "frames" in f.files:
+                stack = f["frames"]
+            else:
+                stack = np.concatenate([f[key].reshape((-1,)+f[key].shape[-3:]) for key in f.files])
+    elif ext in (".h5", ".hdf5"):
+        import h5py
+        with h5py.File(path, "r") as f:
+            if frames is None:
+                stack = f["frames"][:]
+            else:
+                # h5py reads increasing indices only
+                unique = np.unique(frames)
+                stack = f["frames"][unique]
+                frames = np.searchsorted(unique, frames)
+    else:
+        raise ValueError(f"Unknown format '{ext}'; use a directory with png-files, or a .npy-, .npz- or .h5-file")
+
+    if stack.ndim != 4 or stack.shape[-1] not in (3,4):
+        raise ValueError(f"Expected frames of shape (n_frames, height, width, 3), not {stack.shape}")
+
+    if frames is not None:
+        stack = stack[np.asarray(frames)]
+
+    return stack[...,:3]
+
+def binarize(stack, low=40, high=200, chunk_size=64):
+    """binarize
+
+    Pixels of the stimulus in each frame: red and green both below `low`, or both above `high`.
+
+    Parameters
+    ----------
+    stack: numpy.ndarray
+        uint8 array of shape (n_frames, height, width, 3)
+    low: int, optional
+        upper bound of dark pixels, default = 40
+    high: int, optional
+        lower bound of bright pixels, default = 200
+    chunk_size: int, optional
+        frames that are thresholded at once (limits memory for memory-mapped stacks), default = 64
+
+    Returns
+    ----------
+    numpy.ndarray
+        boolean array of shape (n_frames, height, width)
+    """
+
+    masks = np.zeros(stack.shape[:3], dtype=bool)
+    for start in range(0, len(stack), chunk_size):
+        chunk = np.asarray(stack[start:start+chunk_size])
+        red, green = chunk[...,0], chunk[...,1]
+        masks[start:start+chunk_size] = ((red < low) & (green < low)) | ((red > high) & (green > high))
+
+    return masks
+
+def overlap_map(masks, colors=None):
+    """overlap_map
+
+    Number of conditions that cover each pixel, and an RGB image in which each pixel has the mean colour of the
+    conditions covering it (white if none).
+
+    Parameters
+    ----------
+    masks: numpy.ndarray
+        boolean array of shape (n_conditions, height, width)
+    colors: numpy.ndarray, optional
+        RGB colour (0-1) per condition; defaults to `COLORS` (repeated if there are more conditions)
+
+    Returns
+    ----------
+    counts: numpy.ndarray
+        int array of shape (height, width)
+    rgb: numpy.ndarray
+        float array of shape (height, width, 3)
+
+    Example
+    ----------
+    >>> counts, rgb = overlap_map(binarize(load_stack("logs/sub-001_ses-1_task-SRFa_run-demo")))
+    >>> (counts > 1).sum()/(counts > 0).sum()   # fraction of stimulated pixels shared by conditions
+    """
+
+    if colors is None:
+        colors = COLORS[np.arange(len(masks)) % len(COLORS)]
+
+    counts = masks.sum(axis=0)
+    rgb = np.tensordot(masks.astype(np.float32), np.asarray(colors, dtype=np.float32), axes=(0,0))
+    rgb /= np.maximum(counts, 1)[...,np.newaxis]
+    rgb[counts == 0] = 1
+    return counts, rgb
+
+def output_base(path):
+    """ BIDS-components (sub, ses, task, run, acq) in `path` as `sub-<sub>_ses-<ses>...`, or the name of `path` """
+
+    comps = dict()
+    for key, value in re.findall(r"(sub|ses|task|run|acq)-([a-zA-Z0-9]+)", os.path.basename(os.path.normpath(path))):
+        comps.setdefault(key, value)
+
+    base = "_".join(f"{key}-{comps[key]}" for key in ["sub","ses","task","run","acq"] if key in comps)
+    if base == "":
+        base = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+
+    return base
+
+def plot_overlap(stack, masks, fname, extensions=("svg","png")):
+    """plot_overlap
+
+    Overlap of all conditions, followed by the frame of each condition, with lines through the centre of the screen.
+
+    Parameters
+    ----------
+    stack: numpy.ndarray
+        uint8 array of shape (n_conditions, height, width, 3)
+    masks: numpy.ndarray
+        boolean array of shape (n_conditions, height, width)
+    fname: str
+        output file without extension
+    extensions: list, tuple, optional
+        formats to save, default = ('svg', 'png')
+    """
+
+    import matplotlib.pyplot as plt
+
+    counts, rgb = overlap_map(masks)
+    n = len(stack)
+    fig, axs = plt.subplots(ncols=n+1, figsize=(5*(n+1),5), sharex=True, sharey=True, squeeze=False)
+    axs = axs[0]
+
+    panels = [(rgb, "overlap")]+[(stack[ix], f"ev-{ix+1}") for ix in range(n)]
+    for ax, (img, title) in zip(axs, panels):
+        ax.imshow(img)
+        ax.axhline(img.shape[0]//2, color="k", lw=0.5, ls="--")
+        ax.axvline(img.shape[1]//2, color="k", lw=0.5, ls="--")
+        ax.set_title(title)
+        ax.axis('off')
+
+    print(f"Writing '{fname}'")
+    for ext in extensions:
+        fig.savefig(
+            f"{fname}.{ext}",
+            bbox_inches="tight",
+            facecolor="white",
+            dpi=300
+        )
+
+    plt.close(fig)
+
+def main(argv):
+
+    """overlap.py
+
+    Figures of the overlap between the stimuli of the conditions, for one or more subjects/runs. Each input is a
+    directory with the screenshots of a `--demo` run (`python main.py --png --demo --fix`), or a .npy/.npz/.h5-stack
+    of frames (e.g., from `python main.py --render frames.npy`). The figure is written next to the input.
+
+    Parameters
+    ----------
+    <path> [<path> ...]     directories with png-files, or stacks of frames
+    -f|--frames <list>      indices of the frames to use per input (e.g., 3,5,7) [default = all]
+    -j|--jobs <n>           threads to decode png-files with [default = chosen by ThreadPoolExecutor]
+    -o|--out <dir>          output directory [default = directory of the input]
+    -l|--low <value>        red/green below this are dark stimulus pixels [default = 40]
+    -u|--high <value>       red/green above this are bright stimulus pixels [default = 200]
+    -x|--ext <list>         figure formats [default = svg,png]
+    -q|--help               bring up this help text
+
+    Example
+    ----------
+    >>> python -m lineexps.overlap logs/sub-001_ses-1_task-SRFa_run-demo
+    >>> python -m lineexps.overlap logs/sub-00*_ses-1_task-SRFa_run-demo --jobs 8
+    >>> python -m lineexps.overlap logs/sub-001_frames.npy --frames 2,4,6
+    """
+
+    frames      = None
+    n_jobs      = None
+    out_dir     = None
+    low         = 40
+    high        = 200
+    extensions  = ["svg","png"]
+
+    try:
+        opts, args = getopt.gnu_getopt(argv,"qf:j:o:l:u:x:",["help", "frames=", "jobs=", "out=", "low=", "high=", "ext="])
+    except getopt.GetoptError:
+        print("ERROR while handling arguments.. Did you specify an 'illegal' argument..?")
+        print(main.__doc__)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ('-q', '--help'):
+            print(main.__doc__)
+            sys.exit()
+        elif opt in ("-f", "--frames"):
+            frames = [int(i) for i in arg.split(",")]
+        elif opt in ("-j", "--jobs"):
+            n_jobs = int(arg)
+        elif opt in ("-o", "--out"):
+            out_dir = arg
+        elif opt in ("-l", "--low"):
+            low = int(arg)
+        elif opt in ("-u", "--high"):
+            high = int(arg)
+        elif opt in ("-x", "--ext"):
+            extensions = arg.split(",")
+
+    if len(args) == 0:
+        print(main.__doc__)
+        sys.exit(2)
+
+    for path in args:
+        stack = load_stack(path, frames=frames, n_jobs=n_jobs)
+        masks = binarize(stack, low=low, high=high)
+        counts = masks.sum(axis=0)
+        shared = (counts > 1).sum()/max((counts > 0).sum(), 1)
+        print(f"{path}: {len(stack)} conditions, {100*shared:.1f}% of stimulated pixels shared")
+
+        target = out_dir
+        if target is None:
+            target = os.path.dirname(os.path.normpath(path))
+        os.makedirs(target or ".", exist_ok=True)
+        plot_overlap(stack, masks, opj(target, f"{output_base(path)}_desc-stimuli"), extensions=extensions)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,115 @@
+"""
+Preparing the next trial while the current one is running.
+
+exptools2 can call `session.create_trial(trial_nr+1)` at the start of a given phase of a trial (its
+`load_next_during_phase`), but all trials in this repository pass None, so any per-trial setup (picking a movie,
+setting the orientation or position of shared stimuli) runs at the boundary between two trials. `TrialPrefetcher`
+implements that hook for trials that are already created: a trial can define
+
+- `prepare()`: everything that doesn't change what is on screen (look-ups, computing values, picking stimuli). Runs
+  during `phase` of the previous trial, or at the boundary if that didn't happen
+- `activate()`: the remaining, cheap, step at the boundary (e.g., applying the prepared orientation to a shared
+  stimulus)
+
+The time spent on both is recorded per trial, so the boundary overhead with and without prefetching can be compared
+(set `prefetch_next_trial: False` in the `design`-section of the settings).
+"""
+import numpy as np
+import os
+import pandas as pd
+import time
+
+class TrialPrefetcher(object):
+
+    def __init__(self, session, phase=0, enabled=True, trials="trials"):
+        """TrialPrefetcher
+
+        Parameters
+        ----------
+        session: exptools2.core.Session
+            session whose `trials` are prepared
+        phase: int, optional
+            phase of a trial during which the next trial is prepared, default = 0 (the ITI in most experiments)
+        enabled: bool, optional
+            prepare trials during the previous trial; if False, everything runs at the boundary. Default = True
+        trials: str, optional
+            attribute of the session with the trials, default = 'trials'
+
+        Example
+        ----------
+        >>> self.prefetch = TrialPrefetcher(self, enabled=self.settings['design'].get('prefetch_next_trial', True))
+        >>> super().__init__(..., load_next_during_phase=self.session.prefetch.phase)     # in Trial.__init__
+        >>> self.prefetch.prepare(trial_nr)                                               # in Session.create_trial
+        >>> self.session.prefetch.enter(self)                                             # in Trial.run
+        """
+
+        self.session    = session
+        self.enabled    = enabled
+        self.phase      = phase if enabled else None
+        self.trials_attr= trials
+        self.trials     = {}
+        self.prepared   = set()
+
+        # per trial: time of prepare() (s), whether it ran in the previous trial, and time spent at the boundary (s)
+        self.records    = {}
+
+    def _find(self, trial_nr):
+        trials = getattr(self.session, self.trials_attr, [])
+
+        # lazy sequences (`lineexps.trials.LazyTrials`) create the trial on request; don't keep a reference to it
+        if hasattr(trials, "find"):
+            return trials.find(trial_nr)
+
+        if trial_nr not in self.trials:
+            self.trials = {trial.trial_nr: trial for trial in trials}
+
+        return self.trials.get(trial_nr)
+
+    def _prepare(self, trial, during_previous):
+        start = time.perf_counter()
+        prepare = getattr(trial, "prepare", None)
+        if prepare is not None:
+            prepare()
+
+        self.prepared.add(trial.trial_nr)
+        self.records[trial.trial_nr] = [time.perf_counter()-start, during_previous, np.nan]
+
+    def prepare(self, trial_nr):
+        """ Prepare trial `trial_nr` (called by exptools2, through `session.create_trial`); unknown trials are ignored """
+        trial = self._find(trial_nr)
+        if trial is not None and trial.trial_nr not in self.prepared:
+            self._prepare(trial, True)
+
+    def enter(self, trial):
+        """ At the start of `trial.run`: prepare the trial if that didn't happen yet, and activate it """
+        start = time.perf_counter()
+        if trial.trial_nr not in self.prepared:
+            self._prepare(trial, False)
+
+        activate = getattr(trial, "activate", None)
+        if activate is not None:
+            activate()
+
+        self.records[trial.trial_nr][2] = time.perf_counter()-start
+
+    def to_dataframe(self):
+        """ One row per trial: 'prepare' and 'boundary' times (in s) and whether it was 'prefetched' """
+        trial_nrs = sorted(self.records)
+        records = np.array([self.records[nr] for nr in trial_nrs], dtype=float).reshape(-1, 3)
+        return pd.DataFrame({
+            "prepare": records[:,0],
+            "prefetched": records[:,1].astype(bool),
+            "boundary": records[:,2]}, index=pd.Index(trial_nrs, name="trial_nr"))
+
+    def summary(self):
+        """ One-line summary of the time spent at trial boundaries """
+        df = self.to_dataframe().dropna(subset=["boundary"])
+        if len(df) == 0:
+            return "Trial boundaries: no trials"
+
+        boundary = df["boundary"].values*1000
+        return f"Trial boundaries ({'prefetch' if self.enabled else 'no prefetch'}): {len(df)} trials, {int(df['prefetched'].sum())} prepared during the previous trial; setup at boundary mean = {round(boundary.mean(),3)}ms, max = {round(boundary.max(),3)}ms"
+
+    def write(self, fname):
+        os.makedirs(os.path.dirname(os.path.abspath(fname)), exist_ok=True)
+        self.to_dataframe().to_csv(fname, sep="\t", na_rep="n/a")
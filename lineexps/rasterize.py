@@ -0,0 +1,278 @@
+"""
+Binary aperture design matrices of the bar-sweep pRF experiment, computed from the compiled design.
+
+The design matrix for pRF fitting used to be made from screenshots (`--png`): a full real-time run in which every
+trial is saved with `win.getMovieFrame()`/`saveMovieFrames`, which drops frames. Everything that determines which part
+of the screen is stimulated is known beforehand, though:
+
+- the bars (`lineexps.designs`): a square of the height of the window, with a band of the bar width in the middle,
+  centred on the position of the trial and rotated by its orientation (0 = vertical)
+- the aperture: `filters.makeMask(shape='raisedCosine', radius=[x_rad,y_rad], fringeWidth=0.02)` over the window,
+  centred on the pRF. That is an ellipse with semi-axes `x_rad*width/2` and `y_rad*height/2` pixels (a circle in
+  lineprf). It counts as stimulated where the mask is at least half transparent, i.e. inside the middle of the fringe
+- `cut_pixels` from the screen delimiter (`<output_str>_desc-screen.json`): pixels at the edges of the screen that the
+  participant can't see
+
+`rasterize_design` samples these at the centres of the pixels of a (downsampled) grid for many trials at once. It
+returns an array of shape (n_trials, n_pix_y, n_pix_x) with the top of the screen in the first row. This takes seconds,
+not the duration of a run:
+
+>>> python -m lineexps.rasterize lineprf --params ../data/sub-001_model-norm_desc-best_vertices.csv --out dm.npy
+"""
+import getopt
+import json
+import numpy as np
+import os
+import pandas as pd
+import sys
+from lineexps import repo_dir
+from lineexps.designs import DesignCache, bar_design_params
+from lineexps.settings import load_settings
+from lineexps.textures import DEFAULT_WIN_SIZE, deg2pix
+opj = os.path.join
+
+def pixel_grid(win_size, n_pix=100):
+    """pixel_grid
+
+    Centres (in PsychoPy's 'pix'-units: origin in the middle of the screen, y up) of the pixels of a grid that covers
+    the window with `n_pix` rows and as many columns as fit the aspect ratio.
+
+    Parameters
+    ----------
+    win_size: list, tuple
+        (width, height) of the window in pixels
+    n_pix: int, optional
+        number of rows, default = 100
+
+    Returns
+    ----------
+    x: numpy.ndarray
+        x-coordinates of the columns
+    y: numpy.ndarray
+        y-coordinates of the rows (from top to bottom)
+    """
+
+    width, height = win_size
+    n_x = int(round(n_pix*width/height))
+    x = (np.arange(n_x)+0.5)*width/n_x-width/2
+    y = height/2-(np.arange(n_pix)+0.5)*height/n_pix
+    return x, y
+
+def aperture_mask(x, y, win_size, center_pix=(0,0), fraction=1, fringe_width=0.02, cut_pixels=None):
+    """aperture_mask
+
+    Binary version of the raised-cosine aperture of lineprf, with the pixels removed by the screen delimiter.
+
+    Parameters
+    ----------
+    x: numpy.ndarray
+        x-coordinates of the columns (see `pixel_grid`)
+    y: numpy.ndarray
+        y-coordinates of the rows
+    win_size: list, tuple
+        (width, height) of the window in pixels
+    center_pix: list, tuple, optional
+        centre of the aperture (the pRF) in pixels, default = (0,0)
+    fraction: float, optional
+        `fraction_aperture_size`; the aperture is a circle with a diameter of `fraction` times the screen height.
+        Default = 1
+    fringe_width: float, optional
+        `fringeWidth` of `makeMask`, default = 0.02
+    cut_pixels: dict, optional
+        pixels to remove at the 'top', 'right', 'bottom' and 'left' of the screen
+
+    Returns
+    ----------
+    numpy.ndarray
+        boolean array of shape (len(y), len(x))
+    """
+
+    width, height = win_size
+    y_rad = fraction
+    x_rad = (height/width)*y_rad
+    rad = np.sqrt(((x[np.newaxis,:]-center_pix[0])/(x_rad*width/2))**2+((y[:,np.newaxis]-center_pix[1])/(y_rad*height/2))**2)
+    mask = rad < 1-fringe_width/2
+
+    if cut_pixels is not None:
+        mask &= (x[np.newaxis,:] >= -width/2+cut_pixels.get("left", 0)) & (x[np.newaxis,:] <= width/2-cut_pixels.get("right", 0))
+        mask &= (y[:,np.newaxis] <= height/2-cut_pixels.get("top", 0)) & (y[:,np.newaxis] >= -height/2+cut_pixels.get("bottom", 0))
+
+    return mask
+
+def rasterize_design(design, bar_widths_pix, win_size, n_pix=100, aperture=None, chunk_size=256):
+    """rasterize_design
+
+    Binary design matrix: for each trial, which pixels of the grid are covered by the bar (and the aperture).
+
+    Parameters
+    ----------
+    design: numpy.ndarray
+        compiled design (see `lineexps.designs.DESIGN_DTYPE`); uses 'condition', 'bar_type', 'orientation', 'pos_x'
+        and 'pos_y'
+    bar_widths_pix: list
+        widths of the thin and thick bar in pixels
+    win_size: list, tuple
+        (width, height) of the window in pixels
+    n_pix: int, optional
+        number of rows of the grid, default = 100
+    aperture: numpy.ndarray, optional
+        boolean mask of shape (n_pix, n_columns) (see `aperture_mask`); everything is visible if None
+    chunk_size: int, optional
+        trials that are computed at once, default = 256
+
+    Returns
+    ----------
+    numpy.ndarray
+        boolean array of shape (n_trials, n_pix, n_columns)
+
+    Example
+    ----------
+    >>> x, y = pixel_grid([1920, 1080], n_pix=100)
+    >>> aperture = aperture_mask(x, y, [1920, 1080], center_pix=[31.2, -12.4], fraction=0.7)
+    >>> dm = rasterize_design(design, [24.6, 49.2], [1920, 1080], n_pix=100, aperture=aperture)
+    >>> dm.shape
+    (1040, 100, 178)
+    """
+
+    x, y = pixel_grid(win_size, n_pix=n_pix)
+    height = win_size[1]
+    dm = np.zeros((len(design), len(y), len(x)), dtype=bool)
+
+    bar = design["condition"] < 2
+    theta = np.deg2rad(design["orientation"].astype(float))
+    half_width = np.asarray(bar_widths_pix, dtype=float)[np.minimum(design["bar_type"], 1)]/2
+
+    for start in range(0, len(design), chunk_size):
+        sl = slice(start, start+chunk_size)
+        dx = x[np.newaxis,np.newaxis,:]-design["pos_x"][sl,np.newaxis,np.newaxis]
+        dy = y[np.newaxis,:,np.newaxis]-design["pos_y"][sl,np.newaxis,np.newaxis]
+        cos = np.cos(theta[sl])[:,np.newaxis,np.newaxis]
+        sin = np.sin(theta[sl])[:,np.newaxis,np.newaxis]
+
+        # coordinates across and along the bar; the band is `bar width` wide, the square the height of the window
+        across = np.abs(dx*cos+dy*sin)
+        along = np.abs(dy*cos-dx*sin)
+        dm[sl] = (across <= half_width[sl,np.newaxis,np.newaxis]) & (along <= height/2) & bar[sl,np.newaxis,np.newaxis]
+
+    if aperture is not None:
+        dm &= aperture[np.newaxis]
+
+    return dm
+
+def design_matrix_from_settings(settings_file, params_file=None, hemi="L", screen_file=None, n_pix=100):
+    """design_matrix_from_settings
+
+    Design matrix of a lineprf run, without a window: the pixel geometry is computed from the `monitor`- and
+    `window`-sections of the settings (like `lineexps.textures.prewarm`), the pRF location from the parameter file.
+
+    Parameters
+    ----------
+    settings_file: str
+        settings of lineprf
+    params_file: str, optional
+        pRF parameter file (csv with 'hemi', 'x' and 'y' in degrees); the bars are centred on the screen if None
+    hemi: str, optional
+        hemisphere to take the pRF from, default = 'L'
+    screen_file: str, optional
+        json-file written by the screen delimiter (`<output_str>_desc-screen.json`)
+    n_pix: int, optional
+        number of rows of the grid, default = 100
+
+    Returns
+    ----------
+    dm: numpy.ndarray
+        boolean array of shape (n_trials, n_pix, n_columns)
+    design: numpy.ndarray
+        the compiled design
+    """
+
+    settings = load_settings(settings_file)
+    win_size = [int(i) for i in settings.get('window', {}).get('size', DEFAULT_WIN_SIZE)]
+    to_pix = lambda deg: float(deg2pix(deg, settings['monitor']['width'], settings['monitor']['distance'], win_size))
+
+    center_pix = [0, 0]
+    if params_file is not None:
+        prf = pd.read_csv(params_file).set_index('hemi')
+        center_pix = [to_pix(prf['x'][hemi]), to_pix(prf['y'][hemi])]
+
+    thin = settings['stimuli']['bar_width_deg']
+    bar_widths_pix = [to_pix(thin), to_pix(thin*settings['stimuli']['thick bar as scalar of thin bar'])]
+    design = DesignCache().get_bar_design(bar_widths_pix=bar_widths_pix, center_pix=center_pix, **bar_design_params(settings))
+
+    cut_pixels = None
+    if screen_file is not None:
+        with open(screen_file) as f:
+            cut_pixels = json.load(f)
+
+    x, y = pixel_grid(win_size, n_pix=n_pix)
+    aperture = aperture_mask(
+        x,
+        y,
+        win_size,
+        center_pix=center_pix,
+        fraction=settings['stimuli'].get('fraction_aperture_size', 1),
+        cut_pixels=cut_pixels)
+
+    return rasterize_design(design, bar_widths_pix, win_size, n_pix=n_pix, aperture=aperture), design
+
+def main(argv):
+
+    """rasterize.py
+
+    Write the binary design matrix of a lineprf run (one frame per trial) as a .npy-file, computed from the settings
+    instead of screenshots. No window is opened.
+
+    Parameters
+    ----------
+    <exp>                   experiment folder [default = lineprf]
+    -p|--params <file>      pRF parameter file (csv; 'hemi', 'x', 'y') [default = bars centred on the screen]
+    -h|--hemi <hemi>        hemisphere in the parameter file [default = L]
+    -s|--screen <file>      json-file of the screen delimiter with pixels to remove
+    -n|--n_pix <n>          number of rows of the design matrix [default = 100]
+    -o|--out <file>         output file [default = design_matrix.npy]
+    -q|--help               bring up this help text
+
+    Example
+    ----------
+    >>> python -m lineexps.rasterize lineprf --params data/sub-001_model-norm_desc-best_vertices.csv --hemi L
+    >>> python -m lineexps.rasterize lineprf --screen logs/sub-001_ses-1_task-pRF_run-1/sub-001_ses-1_task-pRF_run-1_desc-screen.json --n_pix 200
+    """
+
+    params_file = None
+    hemi        = "L"
+    screen_file = None
+    n_pix       = 100
+    out_file    = "design_matrix.npy"
+
+    try:
+        opts, args = getopt.gnu_getopt(argv,"qp:h:s:n:o:",["help", "params=", "hemi=", "screen=", "n_pix=", "out="])
+    except getopt.GetoptError:
+        print("ERROR while handling arguments.. Did you specify an 'illegal' argument..?")
+        print(main.__doc__)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ('-q', '--help'):
+            print(main.__doc__)
+            sys.exit()
+        elif opt in ("-p", "--params"):
+            params_file = arg
+        elif opt in ("-h", "--hemi"):
+            hemi = arg
+        elif opt in ("-s", "--screen"):
+            screen_file = arg
+        elif opt in ("-n", "--n_pix"):
+            n_pix = int(arg)
+        elif opt in ("-o", "--out"):
+            out_file = arg
+
+    exp = args[0] if len(args) > 0 else "lineprf"
+    if not os.path.isabs(exp) and not os.path.isdir(exp):
+        exp = opj(repo_dir, exp)
+
+    dm, design = design_matrix_from_settings(opj(exp, "settings.yml"), params_file=params_file, hemi=hemi, screen_file=screen_file, n_pix=n_pix)
+    np.save(out_file, dm)
+    print(f"Wrote design matrix of shape {dm.shape} ({int(np.sum(dm.any(axis=(1,2))))} trials with a bar) to {out_file}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,315 @@
+"""
+Render a session to an array (one frame per trial phase), without a monitor and without running in real time.
+
+`python main.py --render frames.npy` runs the experiment as usual, with three differences:
+
+- the window still needs an X-display. On a machine without a monitor (or GPU), run it in a virtual framebuffer, which
+  Mesa renders in software (llvmpipe): `xvfb-run -s "-screen 0 1920x1080x24" python main.py --render frames.npy`.
+  pyglet's headless (EGL) mode can't be used, because PsychoPy 2021.1.4 reads the X-window handle of the window it
+  creates
+- `session.clock` and `session.timer` are replaced by `VirtualClock`s. Time only moves when the window is flipped: at
+  the first flip of a phase after its duration was added to the timer, it jumps to the end of the phase. With
+  `load_next_during_phase`, exptools2 flips once before that (and then creates the next trial); that flip advances one
+  refresh period. Phases of infinite duration (waiting for a key or trigger) end right away. `display_text` doesn't
+  wait for keys. Phases timed in frames advance one refresh period per flip
+- the first frame of every phase is read from the back buffer before it is flipped, and streamed to disk
+
+Frames are written as uint8 arrays of shape (n_frames, height, width, 3), with the top of the screen in the first row:
+
+- `.npy`: frames are appended to the file as they come in, and the header is written when the session is closed, so
+  the result can be opened with `np.load(fname, mmap_mode='r')`. The trial number, phase and (virtual) onset of every
+  frame are written to a `.tsv`-file with the same name
+- `.h5`/`.hdf5`: a chunked (one frame per chunk) dataset `frames`, with datasets `trial_nr`, `phase` and `onset`.
+  Requires h5py
+
+Frames can be downsampled with `render: {downsample: 4}` in the settings (every 4th pixel in both directions). Stimuli
+that use the real time instead of the session's clock (e.g., `psychopy.core.getTime()` in `scenes`) are drawn as they
+are at the onset of the phase.
+"""
+import atexit
+import numpy as np
+import os
+import pandas as pd
+import struct
+import sys
+from lineexps.frames import DEFAULT_REFRESH_RATE
+
+# size of the header of streamed .npy-files; leaves room for any shape
+NPY_HEADER_SIZE = 256
+
+def require_display(argv):
+    """require_display
+
+    Stop with a hint to use `xvfb-run` if `--render` is in `argv` and there is no X-display (on Linux), rather than
+    letting PsychoPy fail while it creates the window.
+
+    Parameters
+    ----------
+    argv: list
+        command line arguments (e.g., `sys.argv`)
+
+    Example
+    ----------
+    >>> require_display(sys.argv)
+    >>> from session import pRFSession
+    """
+
+    if not any(arg == "--render" or arg.startswith("--render=") for arg in argv):
+        return
+
+    if sys.platform.startswith("linux") and not os.environ.get("DISPLAY"):
+        sys.exit(f"--render needs an X-display; without a monitor, use a virtual one: xvfb-run -s \"-screen 0 1920x1080x24\" python {' '.join(argv)}")
+
+class VirtualTime(object):
+    """ Time shared by the virtual clocks of a session; only moves when it is advanced """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def advance(self, dt):
+        self.now += dt
+
+    def advance_to(self, t):
+        self.now = max(self.now, t)
+
+class VirtualClock(object):
+
+    def __init__(self, time):
+        """VirtualClock
+
+        Stand-in for `psychopy.core.Clock` that reads a `VirtualTime`.
+
+        Parameters
+        ----------
+        time: VirtualTime
+            time to read
+        """
+
+        self.time   = time
+        self._t0    = time.now
+
+    def getTime(self):
+        return self.time.now-self._t0
+
+    def reset(self, newT=0.0):
+        self._t0 = self.time.now+newT
+
+    def add(self, t):
+        self._t0 += t
+
+    def getLastResetTime(self):
+        return self._t0
+
+def _npy_header(shape):
+    """ Header (version 1.0) of a C-ordered uint8 .npy-file of `shape`, padded to `NPY_HEADER_SIZE` bytes """
+    header = "{'descr': '|u1', 'fortran_order': False, 'shape': %s, }" % repr(tuple(shape))
+    header = header.ljust(NPY_HEADER_SIZE-10-1)+"\n"
+    return b"\x93NUMPY\x01\x00"+struct.pack("<H", len(header))+header.encode("latin1")
+
+class FrameWriter(object):
+
+    def __init__(self, fname):
+        """FrameWriter
+
+        Stream frames (uint8 arrays of the same shape) to a `.npy`- or HDF5-file.
+
+        Parameters
+        ----------
+        fname: str
+            output file; HDF5 if it ends with '.h5' or '.hdf5', .npy otherwise
+
+        Example
+        ----------
+        >>> writer = FrameWriter("frames.npy")
+        >>> writer.write(frame, trial_nr=3, phase=0, onset=20.0)
+        >>> writer.close()
+        >>> frames = np.load("frames.npy", mmap_mode='r')
+        """
+
+        self.fname      = fname
+        self.hdf5       = os.path.splitext(fname)[1].lower() in (".h5", ".hdf5")
+        self.shape      = None
+        self.n_frames   = 0
+        self.index      = []
+        self.closed     = False
+        self._file      = None
+
+        out_dir = os.path.dirname(os.path.abspath(fname))
+        os.makedirs(out_dir, exist_ok=True)
+
+    def _open(self, shape):
+        self.shape = tuple(shape)
+        if self.hdf5:
+            try:
+                import h5py
+            except ImportError:
+                raise ImportError(f"h5py is required to write '{self.fname}'; use a .npy-file instead")
+
+            self._file = h5py.File(self.fname, "w")
+            self._frames = self._file.create_dataset("frames", shape=(0,)+self.shape, maxshape=(None,)+self.shape, chunks=(1,)+self.shape, dtype=np.uint8)
+        else:
+            self._file = open(self.fname, "wb")
+            self._file.write(_npy_header((0,)+self.shape))
+
+    def write(self, frame, trial_nr=-1, phase=-1, onset=np.nan):
+        """ Append `frame`, with the trial, phase and onset it belongs to """
+
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        if self._file is None:
+            self._open(frame.shape)
+        elif frame.shape != self.shape:
+            raise ValueError(f"Frame of shape {frame.shape} doesn't match the previous frames {self.shape}")
+
+        if self.hdf5:
+            self._frames.resize(self.n_frames+1, axis=0)
+            self._frames[self.n_frames] = frame
+        else:
+            self._file.write(frame.tobytes())
+
+        self.index.append((trial_nr, phase, onset))
+        self.n_frames += 1
+
+    def close(self):
+        """ Write the header/index and close the file; can be called more than once """
+
+        if self.closed:
+            return
+
+        self.closed = True
+        index = pd.DataFrame(self.index, columns=["trial_nr", "phase", "onset"])
+        if self._file is None:
+            return
+
+        if self.hdf5:
+            for col in index.columns:
+                self._file.create_dataset(col, data=index[col].values)
+        else:
+            self._file.seek(0)
+            self._file.write(_npy_header((self.n_frames,)+self.shape))
+            index.to_csv(os.path.splitext(self.fname)[0]+".tsv", sep="\t", index_label="frame")
+
+        self._file.close()
+
+def read_frame(win, downsample=1):
+    """read_frame
+
+    Contents of the buffer that is drawn to (the framebuffer object if the window uses one, the back buffer
+    otherwise), i.e. what the next flip will show.
+
+    Parameters
+    ----------
+    win: psychopy.visual.Window
+        window to read from
+    downsample: int, optional
+        keep every n-th row and column, default = 1
+
+    Returns
+    ----------
+    numpy.ndarray
+        uint8 array of shape (height, width, 3), top row first
+    """
+
+    from pyglet import gl as GL
+
+    width, height = [int(i) for i in win.size]
+    buf = (GL.GLubyte*(width*height*3))()
+    GL.glPixelStorei(GL.GL_PACK_ALIGNMENT, 1)
+    GL.glReadPixels(0, 0, width, height, GL.GL_RGB, GL.GL_UNSIGNED_BYTE, buf)
+    frame = np.frombuffer(buf, dtype=np.uint8).reshape(height, width, 3)[::-1]
+    return frame[::downsample,::downsample]
+
+class Renderer(object):
+
+    def __init__(self, session, fname, downsample=None, refresh_rate=None):
+        """Renderer
+
+        Drive `session` with virtual time and write the first frame of each trial phase to `fname` (see the module
+        docstring). Wraps `session.win.flip`, `session.display_text` and `session.close`, so create it after the
+        session and before `session.run()`.
+
+        Parameters
+        ----------
+        session: exptools2.core.Session
+            session to render
+        fname: str
+            output file (.npy or .h5)
+        downsample: int, optional
+            keep every n-th row and column. Defaults to `render: downsample` in the settings, or 1
+        refresh_rate: float, optional
+            rate (Hz) at which time advances for flips that don't start a phase. Defaults to `render: refresh_rate` in
+            the settings, or `DEFAULT_REFRESH_RATE`
+
+        Example
+        ----------
+        >>> session_object = pRFSession(...)
+        >>> Renderer(session_object, "frames.npy")
+        >>> session_object.run()
+        >>> session_object.close()
+        """
+
+        settings = getattr(session, "settings", None) or {}
+        settings = settings.get("render", None) or {}
+        if downsample is None:
+            downsample = settings.get("downsample", 1)
+
+        if refresh_rate is None:
+            refresh_rate = settings.get("refresh_rate", DEFAULT_REFRESH_RATE)
+
+        self.session        = session
+        self.downsample     = max(1, int(downsample))
+        self.frame_period   = 1.0/refresh_rate
+        self.writer         = FrameWriter(fname)
+        self.time           = VirtualTime()
+        self.last_phase     = None
+        self.jumped         = False
+
+        # replace the clocks of the session
+        session.clock       = VirtualClock(self.time)
+        session.timer       = VirtualClock(self.time)
+
+        # wrap the methods that flip, wait or close
+        self._flip          = session.win.flip
+        self._display_text  = session.display_text
+        self._close         = session.close
+        session.win.flip    = self.flip
+        session.display_text= self.display_text
+        session.close       = self.close
+
+        atexit.register(self.writer.close)
+
+    def flip(self, *args, **kwargs):
+        """ Capture the first frame of each phase, flip, and move time to the end of the phase """
+
+        trial = getattr(self.session, "current_trial", None)
+        key = None if trial is None else (trial.trial_nr, trial.phase)
+        if key is not None and key != self.last_phase:
+            self.writer.write(read_frame(self.session.win, self.downsample), trial_nr=trial.trial_nr, phase=trial.phase, onset=self.session.clock.getTime())
+            self.last_phase = key
+            self.jumped = False
+
+        flip_time = self._flip(*args, **kwargs)
+
+        # jump once per phase, at the first flip after the phase duration was added to the timer. With
+        # `load_next_during_phase`, the first flip of that phase comes from `load_next_trial`, before `timer.add`
+        remaining = -self.session.timer.getTime()
+        if key is not None and not self.jumped and remaining > 0:
+            if np.isinf(remaining):
+                # waiting for a key or trigger that won't come
+                self.session.timer.reset()
+            else:
+                self.time.advance_to(self.session.timer.getLastResetTime())
+            self.jumped = True
+        else:
+            self.time.advance(self.frame_period)
+
+        return flip_time
+
+    def display_text(self, text, keys=None, duration=None, **kwargs):
+        """ `Session.display_text` without waiting for keys """
+        return self._display_text(text, duration=0, **kwargs)
+
+    def close(self, *args, **kwargs):
+        """ Finish the output file and close the session """
+        self.writer.close()
+        print(f"Rendered {self.writer.n_frames} frames to {self.writer.fname}")
+        return self._close(*args, **kwargs)
@@ -0,0 +1,148 @@
+"""
+Scoring of the fixation task after the run.
+
+During the run, trials only append the time of each button press to a list. Afterwards, all responses are matched to
+all colour switches at once: `np.searchsorted` finds the most recent switch before each response, and a response
+counts as a hit if it follows that switch within the response interval. The first response in the window of a
+switch is the hit; further presses in the same window are 'repeat', and presses outside any window are false alarms.
+"""
+import numpy as np
+import os
+import pandas as pd
+
+def score_responses(switch_times, response_times, response_interval):
+    """score_responses
+
+    Match button presses to colour switches of the fixation dot.
+
+    Parameters
+    ----------
+    switch_times: list, numpy.ndarray
+        times of the colour switches (in s, on the session clock). Switches that were never shown can be set to NaN;
+        they are left out
+    response_times: list, numpy.ndarray
+        times of the button presses (same clock)
+    response_interval: float
+        time (in s) after a switch in which a press counts as a hit
+
+    Returns
+    ----------
+    switches: pandas.DataFrame
+        one row per switch, with columns 'time', 'hit' (bool) and 'rt' (NaN for misses)
+    responses: pandas.DataFrame
+        one row per response, with columns 'time', 'switch' (index of the preceding switch, -1 if none), 'rt' (time
+        since that switch) and 'outcome' ('hit', 'repeat' or 'false_alarm')
+
+    Example
+    ----------
+    >>> switches, responses = score_responses([2, 6, 10], [2.4, 2.6, 8.0, 10.3], 0.8)
+    >>> switches['hit'].values
+    array([ True, False,  True])
+    >>> responses['outcome'].values
+    array(['hit', 'repeat', 'false_alarm', 'hit'], dtype=object)
+    """
+
+    switch_times = np.asarray(switch_times, dtype=float)
+    switch_times = np.sort(switch_times[~np.isnan(switch_times)])
+    response_times = np.sort(np.asarray(response_times, dtype=float))
+
+    # most recent switch before each response (a press at the exact time of the switch does not count)
+    switch_ix = np.searchsorted(switch_times, response_times, side="left")-1
+    rt = np.full(response_times.shape, np.nan)
+    has_switch = switch_ix >= 0
+    rt[has_switch] = response_times[has_switch]-switch_times[switch_ix[has_switch]]
+    in_window = has_switch & (rt < response_interval)
+
+    # first response within the window of a switch is the hit
+    outcome = np.where(in_window, "repeat", "false_alarm").astype(object)
+    hit_switches, first = np.unique(switch_ix[in_window], return_index=True)
+    outcome[np.flatnonzero(in_window)[first]] = "hit"
+
+    hit = np.zeros(switch_times.shape, dtype=bool)
+    hit[hit_switches] = True
+    switch_rt = np.full(switch_times.shape, np.nan)
+    switch_rt[hit_switches] = rt[np.flatnonzero(in_window)[first]]
+
+    switches = pd.DataFrame({
+        "time": switch_times,
+        "hit": hit,
+        "rt": switch_rt})
+    switches.index.name = "switch"
+
+    responses = pd.DataFrame({
+        "time": response_times,
+        "switch": switch_ix,
+        "rt": rt,
+        "outcome": outcome})
+    responses.index.name = "response"
+
+    return switches, responses
+
+def score_summary(switches, responses):
+    """score_summary
+
+    Hits, misses, false alarms and reaction times of a scored run.
+
+    Parameters
+    ----------
+    switches: pandas.DataFrame
+        output of `score_responses`
+    responses: pandas.DataFrame
+        output of `score_responses`
+
+    Returns
+    ----------
+    pandas.Series
+        'n_switches', 'n_responses', 'hits', 'misses', 'false_alarms', 'repeats', 'hit_rate', 'rt_mean', 'rt_median'
+        and 'rt_std' (reaction times of hits, in s)
+    """
+
+    n_switches = len(switches)
+    hits = int(switches["hit"].sum())
+    rts = switches["rt"].dropna()
+    return pd.Series({
+        "n_switches": n_switches,
+        "n_responses": len(responses),
+        "hits": hits,
+        "misses": n_switches-hits,
+        "false_alarms": int((responses["outcome"] == "false_alarm").sum()),
+        "repeats": int((responses["outcome"] == "repeat").sum()),
+        "hit_rate": hits/n_switches if n_switches > 0 else np.nan,
+        "rt_mean": rts.mean(),
+        "rt_median": rts.median(),
+        "rt_std": rts.std()})
+
+def score_fixation_task(schedule, response_times, response_interval, fname=None):
+    """score_fixation_task
+
+    Score the fixation task of a session. Only switches that were shown during the run are scored, at the time they
+    appeared on screen; if the schedule was never drawn, the scheduled times are used instead.
+
+    Parameters
+    ----------
+    schedule: lineexps.fixation.FixationSchedule
+        colour switches of the session
+    response_times: list, numpy.ndarray
+        times of the button presses
+    response_interval: float
+        time (in s) after a switch in which a press counts as a hit
+    fname: str, optional
+        if given, the scored responses are written to this tsv-file (e.g., `<output_str>_desc-fixationtask.tsv`)
+
+    Returns
+    ----------
+    pandas.Series
+        summary from `score_summary`
+    """
+
+    switch_times = schedule.shown_times
+    if np.all(np.isnan(switch_times)):
+        switch_times = schedule.switch_times
+
+    switches, responses = score_responses(switch_times, response_times, response_interval)
+
+    if fname is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(fname)), exist_ok=True)
+        responses.to_csv(fname, sep="\t", na_rep="n/a")
+
+    return score_summary(switches, responses)
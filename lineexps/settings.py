@@ -0,0 +1,184 @@
+import os
+import re
+import yaml
+from collections import namedtuple
+opj = os.path.join
+opd = os.path.dirname
+
+try:
+    from exptools2.core.session import _merge_settings
+except ImportError:
+    # offline tools (cache pre-warming, design checks) should not need psychopy/exptools2
+    def _merge_settings(default, user):
+        """ Recursively merge `user` into `default` (same behaviour as exptools2) """
+        for key, value in user.items():
+            if isinstance(value, dict) and isinstance(default.get(key), dict):
+                _merge_settings(default[key], value)
+            else:
+                default[key] = value
+
+def load_settings(settings_file):
+    """load_settings
+
+    Read a settings file the same way exptools2 does when a Session is created: the package's default settings are
+    read first, and the experiment's yml-file is merged on top. This allows offline tools (e.g., cache pre-warming)
+    to see the same window/monitor settings as the experiment itself, without opening a window.
+
+    Parameters
+    ----------
+    settings_file: str
+        path to the experiment's yml-file
+
+    Returns
+    ----------
+    dict
+        merged settings
+
+    Example
+    ----------
+    >>> settings = load_settings("lineprf/settings.yml")
+    >>> settings['window']['size']
+    [1920, 1080]
+    """
+
+    settings = {}
+    try:
+        import exptools2
+        default_file = opj(opd(exptools2.__file__), 'data', 'default_settings.yml')
+        with open(default_file, 'r', encoding='utf8') as f_in:
+            settings = yaml.safe_load(f_in)
+    except (ImportError, OSError):
+        pass
+
+    with open(settings_file, 'r', encoding='utf8') as f_in:
+        user_settings = yaml.safe_load(f_in)
+
+    _merge_settings(settings, user_settings)
+    return settings
+
+class Default(object):
+
+    __slots__ = ("types", "value")
+
+    def __init__(self, types, value=None):
+        """Default
+
+        Entry of a settings specification for an optional key: if the key is missing (or None) in the settings file,
+        `value` is used instead.
+
+        Parameters
+        ----------
+        types: type, tuple
+            allowed type(s) of the value in the settings file
+        value: object, optional
+            value to use if the key is missing
+        """
+        self.types = types
+        self.value = value
+
+def attribute_name(key):
+    """ Convert a key of the settings file to an attribute name (e.g., 'Task settings' > 'task_settings') """
+    return re.sub(r"\W+", "_", str(key).strip()).strip("_").lower()
+
+def _check_value(value, types, path):
+    """ Validate (and, where lossless, convert) a single value. Returns (value, error) """
+
+    types = types if isinstance(types, tuple) else (types,)
+
+    # yaml reads '1' as int; accept it where a float is expected. bool is an int too, but never a number here
+    if isinstance(value, bool):
+        if bool in types:
+            return value, None
+    elif isinstance(value, int) and float in types and int not in types:
+        return float(value), None
+    elif isinstance(value, (list, tuple)) and (list in types or tuple in types):
+        return tuple(value), None
+    elif isinstance(value, types):
+        return value, None
+
+    names = "/".join([t.__name__ for t in types])
+    return None, f"'{path}' should be {names}, not {type(value).__name__} ({value!r})"
+
+def _compile(settings, spec, path, errors):
+
+    fields = []
+    values = []
+    for key, types in spec.items():
+        key_path = f"{path}.{key}" if path else key
+        if isinstance(types, dict):
+            section = settings.get(key) if isinstance(settings, dict) else None
+            if not isinstance(section, dict):
+                errors.append(f"'{key_path}' is missing or not a section")
+                continue
+
+            value = _compile(section, types, key_path, errors)
+        else:
+            value = settings.get(key) if isinstance(settings, dict) else None
+            if value is None:
+                if isinstance(types, Default):
+                    value = types.value
+                else:
+                    errors.append(f"'{key_path}' is missing")
+                    continue
+            else:
+                value, error = _check_value(value, types.types if isinstance(types, Default) else types, key_path)
+                if error is not None:
+                    errors.append(error)
+                    continue
+
+        fields.append(attribute_name(key))
+        values.append(value)
+
+    if errors:
+        return None
+
+    name = attribute_name(path.split(".")[-1]) if path else "settings"
+    return namedtuple(name, fields)(*values)
+
+def compile_settings(settings, spec):
+    """compile_settings
+
+    Resolve the keys of the settings that are read during the experiment into an immutable structure of namedtuples
+    (which have `__slots__ = ()`), so that draw-loops and event handlers read plain attributes instead of doing nested
+    dictionary lookups (and conversions) on every frame. Keys are validated against `spec` when the session is
+    created, so a missing or mistyped key fails at startup rather than halfway through a run.
+
+    Keys are converted to attribute names by `attribute_name`: lowercase, with spaces and other non-word characters
+    replaced by underscores (e.g., `settings['Task settings']['response interval']` becomes
+    `cfg.task_settings.response_interval`). Integers are accepted (and converted) where a float is expected, and
+    lists are stored as tuples.
+
+    Parameters
+    ----------
+    settings: dict
+        settings of the session (`session.settings`)
+    spec: dict
+        nested dictionary with the same sections as the settings, mapping each key onto its type, a tuple of allowed
+        types, or a `Default` for optional keys
+
+    Returns
+    ----------
+    namedtuple
+        one attribute per section in `spec`, each of which is a namedtuple with the validated values
+
+    Raises
+    ----------
+    ValueError
+        if keys are missing or have the wrong type; all problems are listed in the message
+
+    Example
+    ----------
+    >>> spec = {"design": {"stim_duration": float}, "Task_settings": {"response_interval": float}}
+    >>> cfg = compile_settings(session.settings, spec)
+    >>> cfg.design.stim_duration
+    2.0
+    >>> cfg.design.stim_duration = 3
+    AttributeError: can't set attribute
+    """
+
+    errors = []
+    cfg = _compile(settings, spec, "", errors)
+    if errors:
+        raise ValueError("Invalid settings:\n\t"+"\n\t".join(errors))
+
+    return cfg
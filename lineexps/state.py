@@ -0,0 +1,158 @@
+"""
+Track the state of PsychoPy stimuli, so that unchanged values are not pushed to a stimulus on every frame.
+
+Calls like `setPos`, `setOri` and `setColor` are not free: PsychoPy converts the value, flags the vertices/colors as
+needing an update, and logs the change. In a draw loop, the same value is often set again on every frame (e.g., the
+position of a bar within a TR). `StimState` wraps a stimulus, remembers the last value of each attribute, and only
+calls the setter when the value differs. Suppressed calls are counted per trial by an `UpdateCounter`.
+"""
+import numpy as np
+import pandas as pd
+
+def _freeze(value):
+    """ Hashable/comparable representation of a stimulus value """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+
+    try:
+        return tuple(np.ravel(value).tolist())
+    except (TypeError, ValueError):
+        return value
+
+class UpdateCounter(object):
+
+    def __init__(self):
+        """UpdateCounter
+
+        Count the number of pushed and suppressed attribute updates per trial. The session calls `start_trial` before
+        each trial is run; all `StimState`-objects sharing this counter then count towards that trial.
+
+        Example
+        ----------
+        >>> counter = UpdateCounter()
+        >>> counter.start_trial(1)
+        >>> fixation = StimState(fixation, counter=counter)
+        >>> counter.to_dataframe()
+        """
+
+        self.trial_nr   = None
+        self.counts     = {}
+
+    def start_trial(self, trial_nr):
+        self.trial_nr = trial_nr
+        if trial_nr not in self.counts:
+            self.counts[trial_nr] = [0,0]
+
+    def count(self, suppressed):
+        if self.trial_nr not in self.counts:
+            self.counts[self.trial_nr] = [0,0]
+        self.counts[self.trial_nr][int(suppressed)] += 1
+
+    def to_dataframe(self):
+        """ Dataframe with the number of pushed/suppressed updates per trial """
+        df = pd.DataFrame(
+            [[trial_nr]+counts for trial_nr, counts in self.counts.items()],
+            columns=["trial_nr", "pushed", "suppressed"])
+
+        return df.set_index("trial_nr")
+
+    def summary(self):
+        df = self.to_dataframe()
+        total = df.values.sum()
+        if total == 0:
+            return "Stimulus updates: none"
+
+        return f"Stimulus updates: {df['suppressed'].sum()}/{total} suppressed ({round(df['suppressed'].sum()/total*100,2)}%)"
+
+    def write(self, fname):
+        """ Write the counts per trial to a tsv-file """
+        self.to_dataframe().to_csv(fname, sep="\t")
+
+class StimState(object):
+
+    __slots__ = ("stim", "state", "counter")
+
+    def __init__(self, stim, counter=None):
+        """StimState
+
+        Wrapper around a stimulus that only calls `setPos`, `setOri`, `setColor`, `setSize` and `setContrast` if the
+        value differs from the one that was set last. Anything else (e.g., `draw`, or reading attributes) is passed on
+        to the stimulus. Assigning an attribute directly (e.g., `state.pos = [0,0]`) is forwarded as well, and resets
+        the tracked value so the next setter call is always pushed.
+
+        Parameters
+        ----------
+        stim: object
+            stimulus with `set<Attribute>`-methods (PsychoPy stimulus or one of the stimulus classes in this repo)
+        counter: UpdateCounter, optional
+            counter to register pushed/suppressed calls in. If None, a new counter is created
+
+        Example
+        ----------
+        >>> checkerboard = StimState(GratingStim(win, tex=tex), counter=session.stim_updates)
+        >>> checkerboard.setPos([0,0]) # pushed
+        True
+        >>> checkerboard.setPos([0,0]) # suppressed
+        False
+        """
+
+        object.__setattr__(self, "stim", stim)
+        object.__setattr__(self, "state", {})
+        object.__setattr__(self, "counter", counter if counter is not None else UpdateCounter())
+
+    def set(self, name, value):
+        """set
+
+        Call `stim.set<name>(value)` if `value` differs from the last value that was set.
+
+        Parameters
+        ----------
+        name: str
+            name of the setter without `set` (e.g., 'Pos')
+        value: object
+            new value
+
+        Returns
+        ----------
+        bool
+            True if the value was pushed to the stimulus, False if the call was suppressed
+        """
+
+        frozen = _freeze(value)
+        if name in self.state and self.state[name] == frozen:
+            self.counter.count(True)
+            return False
+
+        getattr(self.stim, f"set{name}")(value)
+        self.state[name] = frozen
+        self.counter.count(False)
+        return True
+
+    def setPos(self, pos):
+        return self.set("Pos", pos)
+
+    def setOri(self, ori):
+        return self.set("Ori", ori)
+
+    def setColor(self, color):
+        return self.set("Color", color)
+
+    def setSize(self, size):
+        return self.set("Size", size)
+
+    def setContrast(self, contrast):
+        return self.set("Contrast", contrast)
+
+    def invalidate(self):
+        """ Forget all tracked values; use after changing the stimulus outside of the wrapper """
+        self.state.clear()
+
+    def draw(self, *args, **kwargs):
+        self.stim.draw(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.stim, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.stim, name, value)
+        self.state.clear()
@@ -0,0 +1,100 @@
+"""
+Reuse PsychoPy text stimuli instead of creating them over and over.
+
+Creating a `TextStim` lays out the text and renders the glyphs, which is one of the slowest things PsychoPy does.
+Delimiter trials used to create a new `TextStim` on every frame, and instruction trials create one per trial even if
+the text is the same as in the previous one. `TextPool` keeps the stimuli it created, keyed on the text and its
+layout (height, wrapWidth, pos and any other keyword arguments), and hands out the existing stimulus if the same text
+is requested again. The number of stimuli is bounded; the least recently used one is dropped when the pool is full.
+"""
+from collections import OrderedDict
+from lineexps.state import _freeze
+
+class TextPool(object):
+
+    def __init__(self, win, capacity=64, stim_class=None):
+        """TextPool
+
+        Parameters
+        ----------
+        win: psychopy.visual.Window
+            window to create the stimuli in
+        capacity: int, optional
+            maximum number of stimuli to keep, default = 64
+        stim_class: class, optional
+            class to create the stimuli with. Defaults to `psychopy.visual.TextStim`
+
+        Example
+        ----------
+        >>> self.text_pool = TextPool(self.win)     # in Session.__init__
+        >>> text = self.session.text_pool.get("Press any button to continue.", height=0.5, wrapWidth=150)
+        >>> text.draw()
+        """
+
+        if stim_class is None:
+            from psychopy.visual import TextStim
+            stim_class = TextStim
+
+        self.win        = win
+        self.capacity   = int(capacity)
+        self.stim_class = stim_class
+        self.stims      = OrderedDict()
+        self.hits       = 0
+        self.misses     = 0
+
+    @staticmethod
+    def key(text, height=None, wrapWidth=None, pos=(0.0,0.0), **kwargs):
+        """ Key of a text stimulus; stimuli with the same key look identical """
+        key = (text, _freeze(height), _freeze(wrapWidth), _freeze(pos), tuple(sorted((k, _freeze(v)) for k, v in kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            key = repr(key)
+
+        return key
+
+    def get(self, text, height=None, wrapWidth=None, pos=(0.0,0.0), **kwargs):
+        """get
+
+        Return the stimulus for `text` with this layout, creating it if it is not in the pool yet. The returned
+        stimulus is shared, so it should not be changed (use a different `pos`, `height`, etc. instead).
+
+        Parameters
+        ----------
+        text: str
+            text to display
+        height: float, optional
+            letter height, passed on to the stimulus
+        wrapWidth: float, optional
+            width at which the text wraps, passed on to the stimulus
+        pos: tuple, optional
+            position of the text, default = (0,0)
+        kwargs: dict, optional
+            other arguments for the stimulus (e.g., `units`, `color`)
+
+        Returns
+        ----------
+        psychopy.visual.TextStim
+            stimulus with the requested text and layout
+        """
+
+        key = self.key(text, height=height, wrapWidth=wrapWidth, pos=pos, **kwargs)
+        stim = self.stims.get(key)
+        if stim is not None:
+            self.stims.move_to_end(key)
+            self.hits += 1
+            return stim
+
+        self.misses += 1
+        stim = self.stim_class(self.win, text, height=height, wrapWidth=wrapWidth, pos=pos, **kwargs)
+        self.stims[key] = stim
+        if len(self.stims) > self.capacity:
+            self.stims.popitem(last=False)
+
+        return stim
+
+    def __len__(self):
+        return len(self.stims)
+
+    def clear(self):
+        self.stims.clear()
@@ -0,0 +1,473 @@
+"""
+Checkerboard bar textures for the line-scanning pRF experiments (`lineprf`, `lineprf2`).
+
+Building a 2048x2048 checkerboard with meshgrid/sin/sign takes a few hundred ms per texture and is repeated for
+every bar width each time a session starts. The textures only depend on the bar width in texture pixels, the
+number of squares in the bar and the texture size, so they can be computed once and memory-mapped from disk on
+subsequent runs. The cache lives in `~/.cache/lineexps/textures` (see `lineexps.default_cache_dir`).
+
+Textures only contain -1, 0 and 1, so they are stored as int8 (4 MB rather than 32 MB per 2048x2048 texture).
+PsychoPy converts them to float32 when they are uploaded to the GPU. Negated or flipped versions of a texture should
+be created as views (`np.fliplr`, `np.flipud`) or by drawing with `color=-1`, rather than as copies.
+
+Cached textures are returned as plain `numpy.ndarray` views of the memory map. PsychoPy only accepts arrays whose type
+is exactly `numpy.ndarray` (`type(tex) == numpy.ndarray`); an `np.memmap` (or a slice/flip of one) is compared with
+strings instead, which fails.
+
+Pre-warm the cache for one or more experiments before a scan session with:
+
+>>> python -m lineexps.textures lineprf lineprf2
+
+Entries are keyed on the actual window size of the session (`session.win.size`). Pre-warming happens without a window,
+so it uses the `window: size` of the settings. A fullscreen window takes the resolution of the screen instead; if that
+differs, pass it with `--size` (e.g., `--size 2560x1440`), or the session builds the textures at startup.
+"""
+import getopt
+import hashlib
+import json
+import numpy as np
+import os
+import sys
+from lineexps import default_cache_dir, repo_dir
+from lineexps.settings import load_settings
+opj = os.path.join
+
+# bump when the texture recipe changes so stale entries are not picked up
+CACHE_VERSION = 2
+
+# exptools2's default window size, used if a settings file does not specify one
+DEFAULT_WIN_SIZE = [1920, 1080]
+
+def deg2pix(degrees, monitor_width, monitor_distance, size_pix):
+    """deg2pix
+
+    Convert degrees of visual angle to pixels without a `psychopy.monitors.Monitor` object. Uses the same small-angle
+    approximation as `psychopy.tools.monitorunittools.deg2pix`, so the results are identical to what the session
+    computes with its monitor.
+
+    Parameters
+    ----------
+    degrees: float
+        size in degrees of visual angle
+    monitor_width: float
+        width of the monitor in cm
+    monitor_distance: float
+        distance between participant and monitor in cm
+    size_pix: list, tuple
+        size of the monitor in pixels (width, height)
+
+    Returns
+    ----------
+    float
+        size in pixels
+    """
+
+    cm = np.array(degrees) * monitor_distance * 0.017455
+    return cm * size_pix[0] / float(monitor_width)
+
+def make_bar_textures(bar_width_in_pixels, squares_in_bar, tex_nr_pix=2048, phase_shift=np.pi, end_pad=0):
+    """make_bar_textures
+
+    Construct the checkerboard textures of a bar. Everything outside of the bar is set to 0 (background).
+
+    Parameters
+    ----------
+    bar_width_in_pixels: float
+        width of the bar in texture pixels (i.e., scaled to `tex_nr_pix`)
+    squares_in_bar: int
+        number of checkerboard squares across the width of the bar
+    tex_nr_pix: int, optional
+        size of the (square) texture, default = 2048
+    phase_shift: float, optional
+        shift of the squares in the flickering phase, default = np.pi
+    end_pad: int, optional
+        extra pixels added to the end of the bar, default = 0
+
+    Returns
+    ----------
+    numpy.ndarray
+        int8-array of shape (3, tex_nr_pix, tex_nr_pix) containing the base texture, phase 1 and phase 2
+    """
+
+    #construct basic space for textures
+    bar_width_in_radians    = np.pi*squares_in_bar
+    bar_pixels_per_radian   = bar_width_in_radians/bar_width_in_pixels
+    pixels_ls               = np.linspace((-tex_nr_pix/2)*bar_pixels_per_radian,(tex_nr_pix/2)*bar_pixels_per_radian,tex_nr_pix)
+    tex_x, tex_y            = np.meshgrid(pixels_ls, pixels_ls)
+
+    # making sure that also the single-square bar is centered in the middle
+    if squares_in_bar==1:
+        tex_x = tex_x-np.pi/2
+
+    textures = np.empty((3,tex_nr_pix,tex_nr_pix), dtype=np.int8)
+    textures[0] = np.sign(np.sin(tex_x) * np.sin(tex_y))
+    textures[1] = np.sign(np.sin(tex_x) * np.sin(tex_y+np.sign(np.sin(tex_x))*phase_shift))
+    textures[2] = np.sign(np.sign(np.abs(tex_x)) * np.sin(tex_y+np.pi/2))
+
+    bar_start_idx   = int(np.round(tex_nr_pix/2-bar_width_in_pixels/2))
+    bar_end_idx     = int(bar_start_idx+bar_width_in_pixels)+end_pad
+
+    textures[:,:,:bar_start_idx]    = 0
+    textures[:,:,bar_end_idx:]      = 0
+
+    return textures
+
+class TextureCache(object):
+
+    def __init__(self, cache_dir=None, verbose=False):
+        """TextureCache
+
+        Persistent cache of bar textures. Entries are stored as `.npy`-files with a `.json`-sidecar describing the
+        parameters, and are loaded memory-mapped (read-only) so that only the pages that are uploaded to the GPU are
+        read from disk. They are returned as `numpy.ndarray` views of the memory map, which can be passed to
+        `GratingStim(tex=...)` directly.
+
+        Parameters
+        ----------
+        cache_dir: str, optional
+            directory to store the textures in. Defaults to `default_cache_dir("textures")`
+        verbose: bool, optional
+            print whether textures were loaded or created
+
+        Example
+        ----------
+        >>> cache = TextureCache()
+        >>> tex = cache.get_bar_textures(24.3, 1, geometry=TextureCache.geometry_from_session(session))
+        >>> tex.shape
+        (3, 2048, 2048)
+        """
+
+        if cache_dir is None:
+            cache_dir = default_cache_dir("textures")
+        else:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self.cache_dir  = cache_dir
+        self.verbose    = verbose
+        self.hits       = 0
+        self.misses     = 0
+
+    @staticmethod
+    def geometry_from_session(session):
+        """ Monitor/window geometry of a session; stored alongside the textures """
+        return {
+            "win_size": [int(i) for i in session.win.size],
+            "monitor_width": float(session.monitor.getWidth()),
+            "monitor_distance": float(session.monitor.getDistance())}
+
+    def key(self, **params):
+        """ Hash of the (json-serialized) texture parameters """
+        params["version"] = CACHE_VERSION
+        txt = json.dumps(params, sort_keys=True)
+        return hashlib.sha1(txt.encode("utf8")).hexdigest()
+
+    def get_bar_textures(self, bar_width_in_pixels, squares_in_bar, tex_nr_pix=2048, geometry=None, phase_shift=np.pi, end_pad=0):
+        """get_bar_textures
+
+        Return the textures of `make_bar_textures`, either from disk or by creating (and storing) them.
+
+        Parameters
+        ----------
+        bar_width_in_pixels: float
+            width of the bar in texture pixels
+        squares_in_bar: int
+            number of checkerboard squares across the bar
+        tex_nr_pix: int, optional
+            size of the texture, default = 2048
+        geometry: dict, optional
+            monitor/window geometry (see `geometry_from_session`). Included in the key so that textures created for
+            different setups are kept apart
+        phase_shift: float, optional
+            see `make_bar_textures`
+        end_pad: int, optional
+            see `make_bar_textures`
+
+        Returns
+        ----------
+        numpy.ndarray
+            read-only int8-array of shape (3, tex_nr_pix, tex_nr_pix), backed by the memory-mapped file
+        """
+
+        params = {
+            "bar_width_in_pixels": round(float(bar_width_in_pixels), 6),
+            "squares_in_bar": float(squares_in_bar),
+            "tex_nr_pix": int(tex_nr_pix),
+            "phase_shift": round(float(phase_shift), 6),
+            "end_pad": int(end_pad),
+            "geometry": geometry}
+
+        key = self.key(**params)
+        fname = opj(self.cache_dir, f"{key}.npy")
+
+        if os.path.exists(fname):
+            try:
+                textures = self._load(fname)
+                if textures.shape == (3,tex_nr_pix,tex_nr_pix) and textures.dtype == np.int8:
+                    self.hits += 1
+                    if self.verbose:
+                        print(f"Loaded bar textures from {fname}")
+                    return textures
+            except (ValueError, OSError):
+                # truncated/corrupt entry; fall through and rebuild
+                pass
+
+        textures = make_bar_textures(
+            params["bar_width_in_pixels"],
+            squares_in_bar,
+            tex_nr_pix=tex_nr_pix,
+            phase_shift=phase_shift,
+            end_pad=end_pad)
+
+        self.misses += 1
+        self._write(fname, textures, params)
+        if self.verbose:
+            print(f"Wrote bar textures to {fname}")
+
+        return self._load(fname)
+
+    @staticmethod
+    def _load(fname):
+        """ Memory-mapped entry as a plain ndarray; slices and flips of a `np.memmap` are memmaps too, which PsychoPy rejects """
+        return np.load(fname, mmap_mode='r').view(np.ndarray)
+
+    def _write(self, fname, textures, params):
+        """ Write atomically, so that concurrent sessions never see half-written files """
+
+        tmp = f"{fname}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, textures)
+        os.replace(tmp, fname)
+
+        with open(fname.replace(".npy", ".json"), "w") as f:
+            json.dump(params, f, indent=4)
+
+def texture_nbytes(textures):
+    """texture_nbytes
+
+    Number of bytes held by a collection of texture arrays. Views (flipped/sliced versions of another array) share
+    their memory with the array they were created from, so each underlying buffer is only counted once.
+
+    Parameters
+    ----------
+    textures: list
+        list of numpy arrays
+
+    Returns
+    ----------
+    int
+        number of bytes
+
+    Example
+    ----------
+    >>> tex = np.zeros((2048,2048), dtype=np.int8)
+    >>> texture_nbytes([tex, np.fliplr(tex), -tex])
+    8388608
+    """
+
+    buffers = {}
+    for tex in textures:
+        base = tex
+        while isinstance(base.base, np.ndarray):
+            base = base.base
+        buffers[id(base)] = base.nbytes
+
+    return int(sum(buffers.values()))
+
+def process_memory():
+    """process_memory
+
+    Resident (RSS) and peak memory of the current process in bytes. Uses `psutil` if available, and falls back to
+    `resource` (peak only) otherwise. Values that cannot be determined are None.
+
+    Returns
+    ----------
+    tuple
+        (rss, peak)
+    """
+
+    rss, peak = None, None
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        rss = info.rss
+        # peak working set is only reported on Windows
+        peak = getattr(info, "peak_wset", None)
+    except ImportError:
+        pass
+
+    if peak is None:
+        try:
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # kilobytes on linux, bytes on macOS
+            if sys.platform != "darwin":
+                peak *= 1024
+        except ImportError:
+            pass
+
+    return rss, peak
+
+def memory_report(name, textures):
+    """memory_report
+
+    One-line summary of the memory taken by the textures of a stimulus, together with the memory of the process.
+
+    Parameters
+    ----------
+    name: str
+        name of the stimulus
+    textures: list
+        list of numpy arrays used by the stimulus
+
+    Returns
+    ----------
+    str
+        summary, e.g. "BarStim (0.625 deg): 12.0 MB in 3 textures (int8) | RSS = 350.2 MB, peak = 402.6 MB"
+    """
+
+    mb = lambda x: "n/a" if x is None else f"{x/1024**2:.1f} MB"
+    rss, peak = process_memory()
+    dtypes = ",".join(sorted(set(str(tex.dtype) for tex in textures)))
+    return f"{name}: {mb(texture_nbytes(textures))} in {len(textures)} textures ({dtypes}) | RSS = {mb(rss)}, peak = {mb(peak)}"
+
+def bar_widths_from_settings(settings):
+    """bar_widths_from_settings
+
+    List the (bar width in degrees, squares in bar)-pairs an experiment will create, based on its settings. Supports
+    the `lineprf` layout (`bar_width_deg` + `thick bar as scalar of thin bar`) and the `lineprf2` layout (lists of
+    `bar_widths` and `squares_in_bar`).
+
+    Parameters
+    ----------
+    settings: dict
+        settings as returned by `lineexps.settings.load_settings`
+
+    Returns
+    ----------
+    list
+        list of (bar_width_deg, squares_in_bar)-tuples
+    """
+
+    stims = settings['stimuli']
+    if isinstance(stims.get('bar_widths'), list):
+        return list(zip(stims['bar_widths'], stims['squares_in_bar']))
+
+    widths = [(stims['bar_width_deg'], stims['squares_in_bar'])]
+    scalar = stims.get('thick bar as scalar of thin bar')
+    if scalar:
+        widths.append((stims['bar_width_deg']*scalar, stims['squares_in_bar']*scalar))
+
+    return widths
+
+def prewarm(settings_file, cache=None, tex_nr_pix=2048, win_size=None, verbose=True):
+    """prewarm
+
+    Create all bar textures an experiment will need, without opening a window. The textures do not depend on the
+    subject (the pRF location only shifts the bar on the screen), so one call per settings file is enough. The
+    session looks them up with the size of its actual window, so `win_size` has to match that (see the module
+    docstring).
+
+    Parameters
+    ----------
+    settings_file: str
+        yml-file of the experiment
+    cache: TextureCache, optional
+        cache to fill; defaults to the default cache
+    tex_nr_pix: int, optional
+        size of the texture, default = 2048
+    win_size: list, tuple, optional
+        size of the window (width, height) in pixels. Defaults to `window: size` in the settings, or
+        `DEFAULT_WIN_SIZE`; a fullscreen window has the resolution of the screen instead
+    verbose: bool, optional
+        print progress
+
+    Returns
+    ----------
+    TextureCache
+        the cache that was filled
+    """
+
+    if cache is None:
+        cache = TextureCache(verbose=verbose)
+
+    settings = load_settings(settings_file)
+    if win_size is None:
+        win_size = settings.get('window', {}).get('size', DEFAULT_WIN_SIZE)
+    geometry = {
+        "win_size": [int(i) for i in win_size],
+        "monitor_width": float(settings['monitor']['width']),
+        "monitor_distance": float(settings['monitor']['distance'])}
+
+    for bar_width_deg, squares_in_bar in bar_widths_from_settings(settings):
+        bar_width = deg2pix(bar_width_deg, geometry["monitor_width"], geometry["monitor_distance"], geometry["win_size"])
+        bar_width_in_pixels = bar_width*tex_nr_pix/geometry["win_size"][1]
+
+        if verbose:
+            print(f"{settings_file}: bar of {bar_width_deg} deg ({squares_in_bar} squares)")
+
+        cache.get_bar_textures(
+            bar_width_in_pixels,
+            squares_in_bar,
+            tex_nr_pix=tex_nr_pix,
+            geometry=geometry)
+
+    return cache
+
+def main(argv):
+
+    """textures.py
+
+    Pre-warm the on-disk texture cache for one or more experiments. For each experiment folder, the `settings.yml`
+    and `simulate.yml` files (if present) are read and all bar textures are created. Textures are keyed on the size of
+    the window; use `--size` if a fullscreen window gets a different resolution than `window: size` in the settings.
+
+    Parameters
+    ----------
+    <exp>                   experiment folder(s) (e.g., 'lineprf'), relative to the repository or absolute
+    -c|--cache <dir>        cache directory [default = ~/.cache/lineexps/textures, or $LINEEXPS_CACHE_DIR/textures]
+    -s|--size <WxH>         window size in pixels, e.g. 2560x1440 [default = `window: size` in the settings]
+    -q|--help               bring up this help text
+
+    Example
+    ----------
+    >>> python -m lineexps.textures lineprf lineprf2
+    >>> python -m lineexps.textures --cache /scratch/textures lineprf
+    >>> python -m lineexps.textures --size 2560x1440 lineprf
+    """
+
+    cache_dir = None
+    win_size  = None
+
+    try:
+        opts, args = getopt.gnu_getopt(argv,"qc:s:",["help", "cache=", "size="])
+    except getopt.GetoptError:
+        print("ERROR while handling arguments.. Did you specify an 'illegal' argument..?")
+        print(main.__doc__)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ('-q', '--help'):
+            print(main.__doc__)
+            sys.exit()
+        elif opt in ("-c", "--cache"):
+            cache_dir = arg
+        elif opt in ("-s", "--size"):
+            win_size = [int(i) for i in arg.lower().split("x")]
+
+    if len(args) == 0:
+        args = ["lineprf", "lineprf2"]
+
+    cache = TextureCache(cache_dir=cache_dir, verbose=True)
+    for exp in args:
+        if not os.path.isabs(exp) and not os.path.isdir(exp):
+            exp = opj(repo_dir, exp)
+
+        for fn in ["settings.yml", "simulate.yml"]:
+            settings_file = opj(exp, fn)
+            if os.path.exists(settings_file):
+                prewarm(settings_file, cache=cache, win_size=win_size)
+
+    print(f"Done: {cache.misses} textures created, {cache.hits} already cached in {cache.cache_dir}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,108 @@
+"""
+Trials that are created when they are needed, instead of all at once before the run.
+
+Sessions with many short trials (`lineprf`: ~1040 trials per repetition of the design, `wbprf`: one per TR) used to
+create every Trial object in `create_trials`. Each of them carries its own parameters, phase durations and names, so
+startup time and memory grow with the number of repetitions. `LazyTrials` behaves like the list in `session.trials`
+(`len`, indexing, iteration). Only the trials before and after the repeated part (instructions, dummy, outro) are
+created up front. The others are made by `make_trial(index)` from a table the session has already computed (e.g., the
+compiled design of `lineexps.designs`):
+
+- when the session asks for a trial: through `TrialPrefetcher.prepare` (called by exptools2 during the
+  `load_next_during_phase` phase of the previous trial), or at the boundary when iterating
+- trials more than `keep` positions behind the newest one are released
+"""
+
+class LazyTrials(object):
+
+    def __init__(self, make_trial, n_trials, head=None, tail=None, first_trial_nr=0, keep=1):
+        """LazyTrials
+
+        Parameters
+        ----------
+        make_trial: callable
+            creates the trial at `index` (0 <= index < n_trials) of the lazy part; called again if a released trial is
+            requested, so it should only depend on the index
+        n_trials: int
+            number of trials in the lazy part
+        head: list, optional
+            trials before the lazy part (e.g., instructions and dummy trial)
+        tail: list, optional
+            trials after the lazy part (e.g., outro)
+        first_trial_nr: int, optional
+            `trial_nr` of the first trial of the lazy part; numbers are consecutive. Default = 0
+        keep: int, optional
+            number of created trials that are kept before the newest one, default = 1 (the running trial)
+
+        Example
+        ----------
+        >>> self.trials = LazyTrials(self.make_trial, self.n_trials, head=[instruction_trial, dummy_trial], tail=[outro_trial], first_trial_nr=2)
+        >>> for trial in self.trials:
+        >>>     trial.run()
+        """
+
+        self.make_trial     = make_trial
+        self.n_trials       = n_trials
+        self.head           = list(head or [])
+        self.tail           = list(tail or [])
+        self.first_trial_nr = first_trial_nr
+        self.keep           = keep
+        self.created        = {}
+        self.n_created      = 0
+        self.max_alive      = 0
+
+    def __len__(self):
+        return len(self.head)+self.n_trials+len(self.tail)
+
+    def __iter__(self):
+        for ix in range(len(self)):
+            yield self[ix]
+
+    def __getitem__(self, ix):
+        if isinstance(ix, slice):
+            return [self[i] for i in range(*ix.indices(len(self)))]
+
+        if ix < 0:
+            ix += len(self)
+
+        if not 0 <= ix < len(self):
+            raise IndexError(f"Trial index {ix} out of range for {len(self)} trials")
+
+        if ix < len(self.head):
+            return self.head[ix]
+
+        ix -= len(self.head)
+        if ix >= self.n_trials:
+            return self.tail[ix-self.n_trials]
+
+        return self._get(ix)
+
+    def _get(self, ix):
+        trial = self.created.get(ix)
+        if trial is None:
+            trial = self.make_trial(ix)
+            self.created[ix] = trial
+            self.n_created += 1
+
+        # release trials that are done
+        for old in [i for i in self.created if i < ix-self.keep]:
+            del self.created[old]
+
+        self.max_alive = max(self.max_alive, len(self.created))
+        return trial
+
+    def find(self, trial_nr):
+        """ Trial with number `trial_nr` (created if it belongs to the lazy part), or None """
+        for trial in self.head+self.tail:
+            if trial.trial_nr == trial_nr:
+                return trial
+
+        ix = trial_nr-self.first_trial_nr
+        if 0 <= ix < self.n_trials:
+            return self._get(ix)
+
+        return None
+
+    def summary(self):
+        """ One-line summary of the number of trials that were created and kept alive """
+        return f"Lazy trials: {self.n_created} created for {self.n_trials} trials, at most {self.max_alive} alive at once"
@@ -2,11 +2,19 @@ import sys
 import getopt
 from datetime import datetime
 import os
-from psychopy import logging
-from session import pRFSession
 opj = os.path.join
 opd = os.path.dirname
 
+# make the shared `lineexps` package importable when running from the experiment folder
+sys.path.insert(0, opd(opd(os.path.abspath(__file__))))
+
+# `--render` needs an X-display; without a monitor, run it under xvfb-run
+from lineexps.render import Renderer, require_display
+require_display(sys.argv)
+
+from psychopy import logging
+from session import pRFSession
+
 def main(argv):
 
     """main.py
@@ -21,7 +29,9 @@ def main(argv):
     -h|--hemi <hemi>        hemi to target (e.g., 'L', or 'R') [default = 'L']
     -e|--eye                turn on eyetracker
     -p|--png                make screenshots (only do this adhoc; costs too much memory to do it *during* the experiment)
+                            the design matrix can also be computed without a run: `python -m lineexps.rasterize lineprf`
     -t|--sim                use `simulate.yml`-settings, rather than `settings.yml`
+    --render <file>         render the first frame of every trial phase to a .npy/.h5-file (virtual time; use xvfb-run without a monitor, see lineexps.render)
     -q|--help               bring up this help text
 
     Example
@@ -36,6 +46,7 @@ def main(argv):
     run         = 0
     hemi        = "L"
     eyetracker  = False
+    render_file = None
     screenshots = False
     simulate    = False
     delim       = False
@@ -43,7 +54,7 @@ def main(argv):
     #---------------------------------------------------------------------------------------------------
     # parse arguments
     try:
-        opts = getopt.getopt(argv,"eptdqs:n:r:h:",["sub=", "ses=", "run=", "hemi=", "eye", "png", "sim", "help", "delim"])[0]
+        opts = getopt.getopt(argv,"eptdqs:n:r:h:",["sub=", "ses=", "run=", "hemi=", "eye", "png", "sim", "help", "delim", "render="])[0]
     except getopt.GetoptError:
         print("ERROR while handling arguments.. Did you specify an 'illegal' argument..?")
         print(main.__doc__)
@@ -62,6 +73,8 @@ def main(argv):
             run = arg            
         elif opt in ("-h", "--hemi"):
             hemi = arg           
+        elif opt == "--render":
+            render_file = arg
         elif opt in ("-e", "--eye"):
             eyetracker = True
         elif opt in ("-p", "--png"):
@@ -72,6 +85,10 @@ def main(argv):
             delim = True            
             
 
+    # nobody is looking at a rendered session
+    if render_file is not None:
+        eyetracker = False
+
     print(f"Subject: \t{subject}")
     print(f"Session: \t{session}")
     print(f"Run ID: \t{run}")
@@ -141,6 +158,9 @@ def main(argv):
     # session_object.create_trials()
     logging.warn(f'Writing results to: {opj(session_object.output_dir, session_object.output_str)}')
 
+    if render_file is not None:
+        Renderer(session_object, render_file)
+
     # run
     session_object.run()
     session_object.close()
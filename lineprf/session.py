@@ -8,9 +8,26 @@ import scipy.stats as ss
 from stimuli import BarStim, pRFCue, DelimiterLines
 import sys
 import json
+from lineexps.designs import CONDITIONS, DesignCache, bar_design_params
+from lineexps.flicker import FlickerSchedule
+from lineexps.frames import FrameRecorder
+from lineexps.prefetch import TrialPrefetcher
+from lineexps.settings import Default, compile_settings
+from lineexps.text import TextPool
+from lineexps.textures import TextureCache
+from lineexps.trials import LazyTrials
 from trial import pRFTrial, InstructionTrial, DummyWaiterTrial, OutroTrial, ScreenDelimiterTrial
 
 opj = os.path.join
+
+# settings that are read while trials are running
+SETTINGS_SPEC = {
+    "design": {
+        "stim_duration": float},
+    "stimuli": {
+        "frequency": float,
+        "lock_flicker_to_frames": Default(bool, False)}}
+
 class pRFSession(PylinkEyetrackerSession):
     def __init__(self, output_str, output_dir, settings_file, eyetracker_on=True, params_file=None, hemi="L", screenshots=False, delimit_screen=False):
         """ Initializes pRFSession.
@@ -58,6 +75,24 @@ class pRFSession(PylinkEyetrackerSession):
         # this thing initializes exptool2.core.session
         super().__init__(output_str, output_dir=output_dir, settings_file=settings_file, eyetracker_on=eyetracker_on)  # initialize parent class!
 
+        # record flip times to detect dropped frames
+        self.frames = FrameRecorder(self)
+
+        # settings read during trials; validated here, so a missing/mistyped key fails before the run starts
+        self.cfg = compile_settings(self.settings, SETTINGS_SPEC)
+
+        # text stimuli of instruction/delimiter trials are created once and reused
+        self.text_pool = TextPool(self.win)
+
+        # per-trial setup runs during the previous trial, so that trial boundaries only swap stimuli
+        self.prefetch = TrialPrefetcher(self, enabled=self.settings['design'].get('prefetch_next_trial', True))
+
+        # contrast reversals of the flickering stimuli; optionally locked to frame boundaries
+        self.flicker = FlickerSchedule(
+            self.cfg.stimuli.frequency,
+            refresh_rate=getattr(self, 'actual_framerate', None),
+            lock_to_frames=self.cfg.stimuli.lock_flicker_to_frames)
+
         # set default color of fixation dot to red 
         self.start_color = 0
         
@@ -95,6 +130,12 @@ class pRFSession(PylinkEyetrackerSession):
         # plot the tiny pRF as marker/cue
         self.cue = pRFCue(self)
 
+        # on-disk cache of bar textures
+        self.texture_cache = TextureCache()
+
+        # on-disk cache of compiled designs
+        self.design_cache = DesignCache()
+
         # thin bar
         self.bar_width_deg_thin = self.settings['stimuli'].get('bar_width_deg')
         self.thin_bar_stim   = BarStim(session=self,
@@ -138,93 +179,32 @@ class pRFSession(PylinkEyetrackerSession):
                                         colorSpace="hex")
 
     def create_design(self):
-        """ Creates design (ideally before running your session!) """
-
-        ## baseline trials
-        self.baseline = np.full(int(self.settings['design'].get('start_duration')//self.duration), -1)
-
-        ## contains two bar passes (vertical/horizontal)
-        # self.two_bar_pass_design = np.array([np.arange(0,len(self.vertical_locations)) for i in ['vertical', 'horizontal']]).flatten().astype(int)
-        self.two_bar_pass_design = np.r_[np.arange(0,len(self.vertical_locations)), 
-                                         np.full(int(self.inter_sweep_blank//self.duration), -1), 
-                                         np.arange(0,len(self.vertical_locations))].flatten()
-
-        ## define rest period for 2*bar pass
-        self.rest = np.full(int(self.settings['design'].get('inter_sweep_blank')//self.duration), -1)
-
-        ## contains two bar passes, rest period, for thin/thick bars
-        self.block_design = np.r_[self.two_bar_pass_design, 
-                                  self.rest,
-                                  self.two_bar_pass_design].astype(int)
-
-        ## contains two bar passes, rest period, and reverse (1 iter = 640)
-        self.part_design = np.r_[self.block_design,
-                                 self.rest,
-                                 self.block_design[::-1],
-                                 self.rest].astype(int)
-
-        # track design iterations
-        self.iter_design = np.r_[[np.full_like(self.part_design,i+1) for i in range(self.stim_repetitions)]].flatten().astype(int)
-
-        ## contains 'block_design' x times
-        self.full_design = np.r_[[self.part_design for i in range(self.stim_repetitions)]].flatten().astype(int)
-        self.full_design = np.concatenate((self.baseline, self.full_design))
+        """ Compiles the design (ideally before running your session!); one record per trial, see `lineexps.designs` """
+
+        # bar widths in pixels; thick bars take smaller steps, so both cover the same part of the screen
+        self.bar_widths_pix = [tools.monitorunittools.deg2pix(i, self.monitor) for i in [self.bar_width_deg_thin, self.bar_width_deg_thick]]
+        self.design = self.design_cache.get_bar_design(
+            bar_widths_pix=self.bar_widths_pix,
+            center_pix=[self.x_loc_pix, self.y_loc_pix],
+            **bar_design_params(self.settings))
+
+        # per-trial arrays as used before the design was compiled
+        self.full_design    = self.design["step"]
+        self.thin_thick     = self.design["bar_type"]
+        self.oris_full      = self.design["condition"]
+        self.iter_design    = self.design["iteration"]
         print(f'full design has shape {self.full_design.shape}; running {self.stim_repetitions} iteration(s) of experiment')
 
-        # keep track of thin/thick bars
-        self.thin   = list(np.zeros_like(self.two_bar_pass_design))
-        self.thick  = list(np.ones_like(self.two_bar_pass_design))
-        
-        # matches "part_design"
-        self.bar_rest = np.full(len(self.rest), 2)
-        self.thin_thick = np.r_[self.thin,              # first sweep is thin bars
-                                self.bar_rest,          # then rest
-                                self.thick,             # second sweep is thick bars
-                                self.bar_rest,          # then rest
-                                self.thin,              # third sweep is thin bars reversed
-                                self.bar_rest,          # then rest 
-                                self.thick,             # final sweep is thick bars reversed
-                                self.bar_rest].flatten().astype(int)
-        
-        # matches "full_design"
-        self.baseline_bartype_idc = self.baseline*-2
-        self.thin_thick = np.r_[[self.thin_thick for i in range(self.stim_repetitions)]].flatten().astype(int)
-        self.thin_thick = np.concatenate((self.baseline_bartype_idc, self.thin_thick))
-
-        # keep track of orientations (horizontal/vertical); matches "two_bar_pass_design"
-        self.oris = np.r_[np.zeros(len(self.vertical_locations)),
-                          np.full(int(self.inter_sweep_blank/self.duration), 2), 
-                          np.ones(len(self.vertical_locations))]
-
-        # matches "block_design"
-        self.oris_block = np.r_[self.oris,
-                                np.full(len(self.rest),2),
-                                self.oris].flatten().astype(int)
-        
-        # matches "part_design"
-        self.oris_part = np.r_[self.oris_block,
-                               self.rest,
-                               self.oris_block,
-                               self.rest].astype(int)                          
-        
-        # matches "full_design"
-        self.oris_full = np.r_[[self.oris_part for i in range(self.stim_repetitions)]].flatten().astype(int)
-        self.oris_full = np.concatenate((self.baseline, self.oris_full))
-        
         # set n_trials
-        self.n_trials = len(self.oris_full)
+        self.n_trials = len(self.design)
         print(f'n_trials has shape {self.n_trials}')
 
     def create_trials(self):
         """ Creates trials (ideally before running your session!) """
 
-        # fixation changes:
+        # fixation changes; spread evenly over the run by the design
         self.p_change           = self.settings['design'].get('fix_change_prob')
-        self.change_fixation    = np.zeros_like(self.full_design)
-        self.n_switch           = len(self.full_design) * self.p_change
-        self.interval           = int(len(self.change_fixation)/self.n_switch)
-        self.change_fixation[::self.interval] = 1
-        self.change_fixation.astype(bool)
+        self.change_fixation    = self.design["fix_change"].astype(int)
 
         # timing
         self.total_experiment_time = self.n_trials*self.duration + self.outro_trial_time
@@ -269,67 +249,13 @@ class pRFSession(PylinkEyetrackerSession):
         else:
             self.trials = [instruction_trial, dummy_trial]
 
-        # keep track of orientation we're traversing through (horizontal or verticals)
-        self.idx_horizontal_locations    = 0
-        self.idx_vertical_locations      = 0
-
-        # loop through trials
-        for i in range(self.n_trials):
-
-            # get which step we're at for horizontal/vertical steps
-            cond = ['horizontal', 'vertical', 'blank'][self.oris_full[i]]
-            if cond != "blank":
-                if cond == "vertical":
-                    self.pos_step = self.vertical_locations[self.full_design[i]]
-                    self.idx_vertical_locations += 1
-                    self.set_orientation = 0 # vertical bar is default
-                elif cond == "horizontal":
-                    self.pos_step = self.horizontal_locations[self.full_design[i]]
-                    self.idx_horizontal_locations += 1
-                    self.set_orientation = 90 # degrees from vertical bar
-
-                # divide by two to make thick bar travers the plane in the same manner as thin bar
-                thick = ['thin', 'thick', 'rest'][self.thin_thick[i]]
-                if thick == "thick":
-                    self.pos_step /= self.thick_bar_scalar
-                    self.bar_width_degrees = self.bar_width_deg_thick
-                    self.set_stimulus = self.thick_bar_stim
-                elif thick == 'thin':
-                    self.bar_width_degrees = self.bar_width_deg_thin
-                    self.set_stimulus = self.thin_bar_stim
-
-                # convert bar widths to pixels
-                self.bar_width_pixels = tools.monitorunittools.deg2pix(self.bar_width_degrees, self.monitor)
-
-                # define start position
-                self.start_pos = [self.x_loc_pix, self.y_loc_pix]      
-
-                # set new position somewhere in grid
-                if cond == "horizontal":
-                    self.new_position = self.start_pos[1]+(self.bar_width_pixels*self.pos_step)
-                    self.set_position = [self.start_pos[0],self.new_position]
-                else:
-                    self.new_position = self.start_pos[0]+(self.bar_width_pixels*self.pos_step)
-                    self.set_position = [self.new_position,self.start_pos[1]]
-            else:
-                self.set_position       = 0
-                self.set_orientation    = 0
-                self.set_stimulus       = None
-
-            # append trial
-            self.trials.append(pRFTrial(session=self,
-                                        trial_nr=(dummy_id+1)+i,
-                                        phase_durations=[self.duration],
-                                        phase_names=['stim'],
-                                        parameters={'condition': cond,
-                                                    'fix_color_changetime': self.change_fixation[i]},
-                                        timing='seconds',
-                                        position=self.set_position,
-                                        orientation=self.set_orientation,
-                                        stimulus=self.set_stimulus,
-                                        verbose=False))
-
-        self.trials.append(outro_trial)
+        # trials of the design; with `lazy_trials`, each trial is created while the previous one runs and released
+        # when it's done, instead of all of them before the run
+        self.first_trial_nr = dummy_id+1
+        if self.settings['design'].get('lazy_trials', False):
+            self.trials = LazyTrials(self.make_trial, self.n_trials, head=self.trials, tail=[outro_trial], first_trial_nr=self.first_trial_nr)
+        else:
+            self.trials += [self.make_trial(i) for i in range(self.n_trials)]+[outro_trial]
   
         # the fraction of [x_rad,y_rad] controls the size of aperture. Default is [1,1] (whole screen, like in Marco's experiments)
         y_rad = self.settings['stimuli'].get('fraction_aperture_size') 
@@ -350,6 +276,22 @@ class pRFSession(PylinkEyetrackerSession):
                                      size=mask_size,
                                      color=[0, 0, 0])
 
+    def make_trial(self, i):
+        """ pRFTrial for trial `i` of the design; the bar of the trial is looked up in the design by `pRFTrial.prepare` """
+        return pRFTrial(session=self,
+                        trial_nr=self.first_trial_nr+i,
+                        phase_durations=[self.duration],
+                        phase_names=['stim'],
+                        parameters={'condition': CONDITIONS[self.design["condition"][i]],
+                                    'fix_color_changetime': self.change_fixation[i]},
+                        timing='seconds',
+                        design_index=i,
+                        verbose=False)
+
+    def create_trial(self, trial_nr=None):
+        """ Called by exptools2 during `load_next_during_phase` of the previous trial """
+        self.prefetch.prepare(trial_nr)
+
     def run(self):
         """ Runs experiment. """
 
@@ -360,6 +302,7 @@ class pRFSession(PylinkEyetrackerSession):
         self.start_experiment()
 
         for trial in self.trials:
+            self.current_trial = trial
             trial.run()
 
         # write pixels-to-remove to json file
@@ -369,3 +312,12 @@ class pRFSession(PylinkEyetrackerSession):
         f.close()        
             
         self.close()
+
+    def close(self):
+        """ Write the recorded flip times (and dropped frames per trial) and trial boundary times before closing the session """
+        self.frames.save(opj(self.output_dir, self.output_str+'_frames.npz'))
+        print(self.prefetch.summary())
+        if isinstance(self.trials, LazyTrials):
+            print(self.trials.summary())
+        self.prefetch.write(opj(self.output_dir, self.output_str+'_desc-prefetch.tsv'))
+        super().close()
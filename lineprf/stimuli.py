@@ -1,6 +1,7 @@
 import numpy as np
 from psychopy.visual import Circle, GratingStim, Line
 from psychopy import tools
+from lineexps.textures import memory_report
 
 class DelimiterLines(object):
 
@@ -50,34 +51,17 @@ class BarStim(object):
         self.bar_width_in_pixels    = tools.monitorunittools.deg2pix(self.bar_width_deg, self.session.monitor)*self.tex_nr_pix/self.session.win.size[1]
         self.bar_width              = tools.monitorunittools.deg2pix(self.bar_width_deg, self.session.monitor)
         
-        #construct basic space for textures
-        bar_width_in_radians        = np.pi*self.squares_in_bar
-        bar_pixels_per_radian       = bar_width_in_radians/self.bar_width_in_pixels
-        pixels_ls                   = np.linspace((-self.tex_nr_pix/2)*bar_pixels_per_radian,(self.tex_nr_pix/2)*bar_pixels_per_radian,self.tex_nr_pix)
-        tex_x, tex_y                = np.meshgrid(pixels_ls, pixels_ls)
-        
-        #construct textues, alsoand making sure that also the single-square bar is centered in the middle
-        if self.squares_in_bar==1:
-            self.sqr_tex            = np.sign(np.sin(tex_x-np.pi/2) * np.sin(tex_y))
-            self.sqr_tex_phase_1    = np.sign(np.sin(tex_x-np.pi/2) * np.sin(tex_y+np.sign(np.sin(tex_x-np.pi/2))*np.pi))
-            self.sqr_tex_phase_2    = np.sign(np.sign(np.abs(tex_x-np.pi/2)) * np.sin(tex_y+np.pi/2))
-        else:                
-            self.sqr_tex            = np.sign(np.sin(tex_x) * np.sin(tex_y))   
-            self.sqr_tex_phase_1    = np.sign(np.sin(tex_x) * np.sin(tex_y+np.sign(np.sin(tex_x))*np.pi))
-            self.sqr_tex_phase_2    = np.sign(np.sign(np.abs(tex_x)) * np.sin(tex_y+np.pi/2))
-            
-        
-        bar_start_idx   = int(np.round(self.tex_nr_pix/2-self.bar_width_in_pixels/2))
-        bar_end_idx     = int(bar_start_idx+self.bar_width_in_pixels)
-
-        self.sqr_tex[:,:bar_start_idx]  = 0       
-        self.sqr_tex[:,bar_end_idx:]    = 0
-
-        self.sqr_tex_phase_1[:,:bar_start_idx]  = 0                   
-        self.sqr_tex_phase_1[:,bar_end_idx:]    = 0
+        # checkerboards are read from the on-disk cache (memory-mapped); created once per bar width/geometry. They come
+        # back as plain ndarray views (PsychoPy rejects np.memmap) with values -1, 0 and 1, the range GratingStim expects
+        self.textures               = self.session.texture_cache.get_bar_textures(
+            self.bar_width_in_pixels,
+            self.squares_in_bar,
+            tex_nr_pix=self.tex_nr_pix,
+            geometry=self.session.texture_cache.geometry_from_session(self.session))
 
-        self.sqr_tex_phase_2[:,:bar_start_idx]  = 0                
-        self.sqr_tex_phase_2[:,bar_end_idx:]    = 0       
+        self.sqr_tex                = self.textures[0]
+        self.sqr_tex_phase_1        = self.textures[1]
+        self.sqr_tex_phase_2        = self.textures[2]
 
         ### 
         mask = np.ones((self.n_mask_pixels))
@@ -93,4 +77,11 @@ class BarStim(object):
                                       tex=self.sqr_tex_phase_1,
                                       units='pix',
                                       color=-1,
-                                      size=[self.session.win.size[1], self.session.win.size[1]])
\ No newline at end of file
+                                      size=[self.session.win.size[1], self.session.win.size[1]])
+
+        # both phases use the same (int8) texture; stimulus_2 is negated with color=-1 instead of a copy
+        print(self.memory_report())
+
+    def memory_report(self):
+        """ Memory taken by the textures of this bar, together with the memory of the process """
+        return memory_report(f"BarStim ({self.bar_width_deg} deg)", [self.sqr_tex, self.sqr_tex_phase_1, self.sqr_tex_phase_2])
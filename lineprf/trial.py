@@ -1,13 +1,12 @@
 import numpy as np
 from exptools2.core import Trial
-from psychopy.visual import TextStim
 import os
 opj = os.path.join
 
 
 class pRFTrial(Trial):
 
-    def __init__(self, session, trial_nr, phase_durations, phase_names, parameters, timing, position, orientation, stimulus, verbose=True):
+    def __init__(self, session, trial_nr, phase_durations, phase_names, parameters, timing, design_index, verbose=True):
         """ Initializes a pRFTrial object.
 
         Parameters
@@ -27,34 +26,43 @@ class pRFTrial(Trial):
             The "units" of the phase durations. Default is 'seconds', where we
             assume the phase-durations are in seconds. The other option is
             'frames', where the phase-"duration" refers to the number of frames.
-        position: tuple, optional
-            Tuple denoting the new location of the bar. If [ix,0], the y-component remains the same, which means the bar sweeps from L>R. If [0,ix], it means the x-component remains the same. The bar sweeps Up>Down (vice versa)
-        orientation: int, optional
-            The default bar is horizontal; if '0' is specified, the bar is horizontal, if '90', we have a vertical bar.
-        stimulus: pRFStim-object, optional
-            Specify a thin/thick bar. Defined in `session.use_stimulus`
+        design_index: int
+            Record of `session.design` (see `lineexps.designs`) with the position, orientation and bar type (thin/thick)
+            of this trial. These are looked up in `prepare()`, during the previous trial
         verbose : bool
             Whether to print extra output (mostly timing info)
         """
         
         # this thing initializes exptools2.core.trial. Most stuff is required for logging
-        super().__init__(session, trial_nr, phase_durations, phase_names, parameters, timing, load_next_during_phase=None, verbose=verbose)
+        super().__init__(session, trial_nr, phase_durations, phase_names, parameters, timing, load_next_during_phase=session.prefetch.phase, verbose=verbose)
 
         # these we actually need here
         self.parameters     = parameters
         self.frame_count    = 0
-        self.position       = position
-        self.orientation    = orientation
-        self.stimulus       = stimulus
-        
-    def run(self):
+        self.design_index   = design_index
+        self.position       = None
+        self.orientation    = None
+        self.stimulus       = None
+
+    def prepare(self):
+        # runs during the previous trial (see lineexps.prefetch)
+        if self.parameters['condition'] != 'blank':
+            rec = self.session.design[self.design_index]
+            self.position       = [rec["pos_x"], rec["pos_y"]]
+            self.orientation    = float(rec["orientation"])
+            self.stimulus       = [self.session.thin_bar_stim, self.session.thick_bar_stim][rec["bar_type"]]
 
+    def activate(self):
+        # the bar is shared between trials, so it is moved at the boundary (see lineexps.prefetch)
         if self.parameters['condition'] != 'blank':
             self.stimulus.stimulus_1.setOri(self.orientation)
             self.stimulus.stimulus_1.setPos(self.position)
             self.stimulus.stimulus_2.setOri(self.orientation)
             self.stimulus.stimulus_2.setPos(self.position)
 
+    def run(self):
+        self.session.prefetch.enter(self)
+
         # calls exptools2/core/trial.py
         super().run()
 
@@ -63,8 +71,9 @@ class pRFTrial(Trial):
         self.frame_count += 1
         if self.parameters['condition'] != 'blank':
 
-            phase = np.fmod(self.session.settings['design'].get('stim_duration')+self.session.timer.getTime(), 1.0/self.session.frequency) * self.session.frequency
-            if phase < 0.5:
+            # contrast-reversal state (0 = first, 1 = second half of the cycle)
+            phase = self.session.flicker(self.session.duration+self.session.timer.getTime())
+            if phase == 0:
                 self.stimulus.stimulus_1.draw()
             else:
                 self.stimulus.stimulus_2.draw()                
@@ -146,11 +155,11 @@ Use your right PINKY (or 'r') to continue to the experiment"""
             self.session.delim.line1.start = self.start_pos 
             self.session.delim.line1.end = (self.start_pos[0],self.session.win.size[1])     
 
-        self.text = TextStim(self.session.win, 
-                             txt, 
-                             height=self.txt_height, 
-                             wrapWidth=self.txt_width, 
-                             **kwargs)
+        self.text = self.session.text_pool.get(
+            txt, 
+            height=self.txt_height, 
+            wrapWidth=self.txt_width, 
+            **kwargs)
         self.session.delim.draw()
         self.text.draw()
 
@@ -212,7 +221,7 @@ class InstructionTrial(Trial):
         if txt is None:
             txt = '''Press any button to continue.'''
 
-        self.text = TextStim(self.session.win, txt, height=txt_height, wrapWidth=txt_width, **kwargs)
+        self.text = self.session.text_pool.get(txt, height=txt_height, wrapWidth=txt_width, **kwargs)
         self.keys = keys
 
     def draw(self):
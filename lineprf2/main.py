@@ -2,11 +2,19 @@ import sys
 import getopt
 from datetime import datetime
 import os
-from psychopy import logging
-from session import pRFSession
 opj = os.path.join
 opd = os.path.dirname
 
+# make the shared `lineexps` package importable when running from the experiment folder
+sys.path.insert(0, opd(opd(os.path.abspath(__file__))))
+
+# `--render` needs an X-display; without a monitor, run it under xvfb-run
+from lineexps.render import Renderer, require_display
+require_display(sys.argv)
+
+from psychopy import logging
+from session import pRFSession
+
 def main(argv):
 
     """
@@ -27,6 +35,8 @@ Parameters
 -p|--png            make screenshots (only do this adhoc; costs too much memory to do it *during* 
                     the experiment)
 -t|--sim            use `simulate.yml`-settings, rather than `settings.yml`
+--render <file>     render the first frame of every trial phase to a .npy/.h5-file, in virtual time;
+                    use xvfb-run without a monitor (see `lineexps.render`)
 -q|--help           bring up this help text
 -d|--delim          Have the participant delineate the FOV; saves out a json-file with pixels to be 
                     removed from the design matrix (info will also be saved to the yml-file). Gene-
@@ -48,6 +58,7 @@ Examples
     run         = 0
     hemi        = "L"
     eyetracker  = False
+    render_file = None
     screenshots = False
     simulate    = False
     delim       = False
@@ -55,7 +66,7 @@ Examples
     #---------------------------------------------------------------------------------------------------
     # parse arguments
     try:
-        opts = getopt.getopt(argv,"heptqs:n:r:",["sub=", "ses=", "run=", "hemi=", "eye", "png", "sim", "help", "delim", "lh", "rh"])[0]
+        opts = getopt.getopt(argv,"heptqs:n:r:",["sub=", "ses=", "run=", "hemi=", "eye", "png", "sim", "help", "delim", "lh", "rh", "render="])[0]
     except getopt.GetoptError:
         print("ERROR while handling arguments.. Did you specify an 'illegal' argument..?")
         print(main.__doc__)
@@ -72,6 +83,8 @@ Examples
             session = arg            
         elif opt in ("-r", "--run"):
             run = arg          
+        elif opt == "--render":
+            render_file = arg
         elif opt in ("-e", "--eye"):
             eyetracker = True
         elif opt in ("-p", "--png"):
@@ -85,6 +98,10 @@ Examples
         elif opt in ("rh"):
             hemi = "R"            
 
+    # nobody is looking at a rendered session
+    if render_file is not None:
+        eyetracker = False
+
     print(f"Subject: \t{subject}")
     print(f"Session: \t{session}")
     print(f"Run ID: \t{run}")
@@ -158,6 +175,9 @@ Examples
     # not really a warning, but still..
     logging.warn(f'Writing results to: {opj(session_object.output_dir, session_object.output_str)}')
 
+    if render_file is not None:
+        Renderer(session_object, render_file)
+
     # run
     session_object.run()
 
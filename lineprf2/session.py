@@ -12,6 +12,13 @@ from stimuli import (
 import sys
 import json
 import random
+from lineexps.fixation import FixationSchedule
+from lineexps.flicker import FlickerSchedule
+from lineexps.frames import FrameRecorder
+from lineexps.prefetch import TrialPrefetcher
+from lineexps.settings import Default, compile_settings
+from lineexps.text import TextPool
+from lineexps.textures import TextureCache
 from trial import (
     pRFTrial, 
     InstructionTrial, 
@@ -21,6 +28,15 @@ from trial import (
 import yaml
 
 opj = os.path.join
+
+# settings that are read while trials are running
+SETTINGS_SPEC = {
+    "design": {
+        "stim_duration": float},
+    "stimuli": {
+        "frequency": float,
+        "lock_flicker_to_frames": Default(bool, False)}}
+
 class pRFSession(PylinkEyetrackerSession):
     def __init__(self, output_str, output_dir, settings_file, eyetracker_on=True, params_file=None, hemi="L", screenshots=False, delimit_screen=False):
         """ Initializes pRFSession.
@@ -69,6 +85,25 @@ class pRFSession(PylinkEyetrackerSession):
         # this thing initializes exptool2.core.session
         super().__init__(output_str, output_dir=output_dir, settings_file=settings_file, eyetracker_on=eyetracker_on)  # initialize parent class!
 
+        # record flip times to detect dropped frames
+        self.frames = FrameRecorder(self)
+
+        # settings read during trials; validated here, so a missing/mistyped key fails before the run starts
+        self.cfg = compile_settings(self.settings, SETTINGS_SPEC)
+
+        # text stimuli of instruction/delimiter trials are created once and reused
+        self.text_pool = TextPool(self.win)
+
+        # position, orientation and bar of the pRF trials are computed in `create_trials`, so there is nothing to
+        # prepare during the previous trial; only the time spent moving the bar at the boundary is recorded
+        self.prefetch = TrialPrefetcher(self, enabled=False)
+
+        # contrast reversals of the flickering stimuli; optionally locked to frame boundaries
+        self.flicker = FlickerSchedule(
+            self.cfg.stimuli.frequency,
+            refresh_rate=getattr(self, 'actual_framerate', None),
+            lock_to_frames=self.cfg.stimuli.lock_flicker_to_frames)
+
         # set default color of fixation dot to red 
         self.start_color = 0
         
@@ -117,7 +152,8 @@ class pRFSession(PylinkEyetrackerSession):
         # plot the tiny pRF as marker/cue
         self.cue = pRFCue(self)
 
-        # bar stimuli
+        # bar stimuli; textures are read from the on-disk cache
+        self.texture_cache = TextureCache()
         self.bar_widths = self.settings['stimuli'].get('bar_widths')
         self.squares_in_bar = self.settings['stimuli'].get('squares_in_bar')
         for ii in range(len(self.bar_widths)):
@@ -317,23 +353,11 @@ class pRFSession(PylinkEyetrackerSession):
         self.dot_switch_color_times = np.arange(3, self.total_time*1.5, float(self.settings['Task_settings']['color_switch_interval']))
         self.dot_switch_color_times += (2*np.random.rand(len(self.dot_switch_color_times))-1)
 
-        # needed to keep track of which dot to print
-        self.current_dot_time=0
-        self.next_dot_time=1
+        # colour of the fixation dot at any time; disk_1 before the first switch, then alternating
+        self.fixation_schedule = FixationSchedule(self.dot_switch_color_times, states=[self.fixation_disk_1, self.fixation_disk_0])
 
     def change_fixation(self):
-        present_time = self.clock.getTime()
-        if self.next_dot_time<len(self.dot_switch_color_times):
-            if present_time<self.dot_switch_color_times[self.current_dot_time]:                
-                self.fixation_disk_1.draw()
-                self.dot_switch_color_times[self.current_dot_time]
-            else:
-                if present_time<self.dot_switch_color_times[self.next_dot_time]:
-                    self.fixation_disk_0.draw()
-                    self.dot_switch_color_times[self.next_dot_time]
-                else:
-                    self.current_dot_time+=2
-                    self.next_dot_time+=2
+        self.fixation_schedule(self.clock.getTime()).draw()
 
     def run(self):
         """ Runs experiment. """
@@ -344,6 +368,7 @@ class pRFSession(PylinkEyetrackerSession):
 
         self.start_experiment()
         for trial in self.trials:
+            self.current_trial = trial
             trial.run()
 
         # # write pixels-to-remove from design matrix to json file
@@ -379,3 +404,11 @@ class pRFSession(PylinkEyetrackerSession):
             yaml.dump(self.settings, f_out, indent=4, default_flow_style=False)
             
         self.close()
+
+    def close(self):
+        """ Write the recorded flip times (and dropped frames per trial), fixation switches and trial boundary times before closing the session """
+        self.frames.save(opj(self.output_dir, self.output_str+'_frames.npz'))
+        print(self.prefetch.summary())
+        self.prefetch.write(opj(self.output_dir, self.output_str+'_desc-prefetch.tsv'))
+        self.fixation_schedule.save(opj(self.output_dir, self.output_str+'_desc-fixationswitches.tsv'))
+        super().close()
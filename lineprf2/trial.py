@@ -1,7 +1,6 @@
 import numpy as np
 from exptools2.core import Trial
 from psychopy.core import getTime
-from psychopy.visual import TextStim
 import os
 from math import isclose
 opj = os.path.join
@@ -47,7 +46,7 @@ class pRFTrial(Trial):
             phase_names, 
             parameters, 
             timing, 
-            load_next_during_phase=None, 
+            load_next_during_phase=session.prefetch.phase, 
             verbose=verbose)
 
         # these we actually need here
@@ -57,11 +56,14 @@ class pRFTrial(Trial):
         self.orientation    = orientation
         self.stimulus       = stimulus
 
-    def run(self):
+    def activate(self):
         # update position/orientation. Needs to be done here apparently. When it's not in run() the stimulus doesn't move
         for st in self.stimulus.stimulus_1,self.stimulus.stimulus_2:
             st.setOri(self.orientation)
             st.setPos(self.position)
+
+    def run(self):
+        self.session.prefetch.enter(self)
         super().run()
 
     def draw(self):
@@ -70,8 +72,8 @@ class pRFTrial(Trial):
         self.frame_count += 1
 
         # flicker through stimuli at certain frequency
-        phase = np.fmod(self.session.duration+self.session.timer.getTime(), 1.0/self.session.frequency) * self.session.frequency
-        if phase < 0.5:
+        phase = self.session.flicker(self.session.duration+self.session.timer.getTime())
+        if phase == 0:
             self.stimulus.stimulus_1.draw()
         else:
             self.stimulus.stimulus_2.draw()                
@@ -201,8 +203,7 @@ Use your right PINKY (or 'r') to continue to the experiment"""
             self.session.delim.line1.start = self.start_pos 
             self.session.delim.line1.end = (self.start_pos[0],self.session.win.size[1])     
 
-        self.text = TextStim(
-            self.session.win, 
+        self.text = self.session.text_pool.get(
             txt, 
             height=self.txt_height, 
             wrapWidth=self.txt_width, 
@@ -279,8 +280,7 @@ class InstructionTrial(Trial):
         if txt is None:
             txt = '''Press any button to continue.'''
 
-        self.text = TextStim(
-            self.session.win, 
+        self.text = self.session.text_pool.get(
             txt, 
             height=txt_height, 
             wrapWidth=txt_width, 
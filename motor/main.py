@@ -1,16 +1,26 @@
 import argparse
 from datetime import datetime
 import os
-from psychopy import logging
-from session import MotorSession
+import sys
 opj = os.path.join
 opd = os.path.dirname
 
+# make the shared `lineexps` package importable when running from the experiment folder
+sys.path.insert(0, opd(opd(os.path.abspath(__file__))))
+
+# `--render` needs an X-display; without a monitor, run it under xvfb-run
+from lineexps.render import Renderer, require_display
+require_display(sys.argv)
+
+from psychopy import logging
+from session import MotorSession
+
 # parse arguments
 parser = argparse.ArgumentParser()
 parser.add_argument('subject', default=None, nargs='?')
 parser.add_argument('session', default=None, nargs='?')
 parser.add_argument('run', default=None, nargs='?')
+parser.add_argument('--render', default=None, help="render the first frame of every trial phase to a .npy/.h5-file (virtual time; use xvfb-run without a monitor, see lineexps.render)")
 
 cmd_args = parser.parse_args()
 subject, session, run = cmd_args.subject, cmd_args.session, cmd_args.run
@@ -40,5 +50,8 @@ if os.path.exists(output_dir):
 session_object = MotorSession(output_str=output_str, output_dir=output_dir, settings_file=settings_fn)
 
 logging.warn(f'Writing results to: {opj(session_object.output_dir, session_object.output_str)}')
+if cmd_args.render is not None:
+    Renderer(session_object, cmd_args.render)
+
 session_object.run()
 session_object.close()
@@ -5,10 +5,25 @@ from psychopy import tools, logging
 import scipy.stats as ss
 from stimuli import FixationCross, MotorStim, MotorMovie
 from trial import MotorTrial, InstructionTrial, DummyWaiterTrial, OutroTrial
+from lineexps.assets import AssetStore
+from lineexps.frames import FrameRecorder
+from lineexps.itis import iterative_itis
+from lineexps.prefetch import TrialPrefetcher
+from lineexps.settings import compile_settings
+from lineexps.state import StimState, UpdateCounter
+from lineexps.text import TextPool
 import os
 opj = os.path.join
 opd = os.path.dirname
 
+
+# settings that are read while trials are running
+SETTINGS_SPEC = {
+    "design": {
+        "cue_time": float},
+    "stimuli": {
+        "cue_color": (list, str)}}
+
 class MotorSession(Session):
     def __init__(self, output_str, output_dir, settings_file):
         """ Initializes StroopSession object.
@@ -31,6 +46,18 @@ class MotorSession(Session):
         """
         super().__init__(output_str, output_dir=output_dir, settings_file=settings_file)  # initialize parent class!
 
+        # record flip times to detect dropped frames
+        self.frames = FrameRecorder(self)
+
+        # settings read during trials; validated here, so a missing/mistyped key fails before the run starts
+        self.cfg = compile_settings(self.settings, SETTINGS_SPEC)
+
+        # text stimuli of instruction/delimiter trials are created once and reused
+        self.text_pool = TextPool(self.win)
+
+        # per-trial setup runs during the previous trial, so that trial boundaries only swap stimuli
+        self.prefetch = TrialPrefetcher(self, enabled=self.settings['design'].get('prefetch_next_trial', True))
+
         self.duration           = self.settings['design'].get('stim_duration')
         self.n_trials           = self.settings['design'].get('n_trials')
         self.outro_trial_time   = self.settings['design'].get('end_duration')
@@ -44,14 +71,20 @@ class MotorSession(Session):
         self.lh_movie           = "lhand.mp4"
         self.rh_movie           = "rhand.mp4"
         
-        # make list of movie files
-        self.movie_files = [self.bilateral_movie, self.lh_movie, self.rh_movie]
+        # make list of movie files; verified copies from the asset store, independent of the working directory
+        self.assets = AssetStore()
+        self.movie_files = [self.assets.resolve_settings(self.settings, movie, opd(os.path.abspath(settings_file))) for movie in [self.bilateral_movie, self.lh_movie, self.rh_movie]]
+
+        # keeps track of (suppressed) stimulus updates per trial
+        self.stim_updates = UpdateCounter()
 
-        # define crossing fixation lines
-        self.fixation = FixationCross(
-            win=self.win, 
-            lineWidth=self.fixation_width, 
-            color=self.fixation_color)
+        # define crossing fixation lines; color is only pushed when it changes
+        self.fixation = StimState(
+            FixationCross(
+                win=self.win, 
+                lineWidth=self.fixation_width, 
+                color=self.fixation_color),
+            counter=self.stim_updates)
 
         # define button options
         self.button_options = self.settings['various'].get('buttons')
@@ -111,43 +144,28 @@ class MotorSession(Session):
                     verbose=True))
         self.trials.append(outro_trial)
 
+    def create_trial(self, trial_nr=None):
+        """ Called by exptools2 during `load_next_during_phase` of the previous trial """
+        self.prefetch.prepare(trial_nr)
+
     def run(self):
         """ Runs experiment. """
         self.create_trials()  # create them *before* running!
         self.start_experiment()
         for trial in self.trials:
+            self.current_trial = trial
+            self.stim_updates.start_trial(trial.trial_nr)
             trial.run()
 
+        # number of pushed/suppressed stimulus updates per trial
+        print(self.stim_updates.summary())
+        self.stim_updates.write(opj(self.output_dir, self.output_str+'_desc-stimupdates.tsv'))
+
         self.close()
 
-# iti function based on negative exponential
-def _return_itis(mean_duration, minimal_duration, maximal_duration, n_trials):
-    itis = np.random.exponential(scale=mean_duration-minimal_duration, size=n_trials)
-    itis += minimal_duration
-    itis[itis>maximal_duration] = maximal_duration
-    return itis
-
-def iterative_itis(mean_duration=6, minimal_duration=3, maximal_duration=18, n_trials=None, leeway=0, verbose=False):
-    
-    nits = 0
-    itis = _return_itis(
-        mean_duration=mean_duration,
-        minimal_duration=minimal_duration,
-        maximal_duration=maximal_duration,
-        n_trials=n_trials)
-
-    total_iti_duration = n_trials * mean_duration
-    min_iti_duration = total_iti_duration - leeway
-    max_iti_duration = total_iti_duration + leeway
-    while (itis.sum() < min_iti_duration) | (itis.sum() > max_iti_duration):
-        itis = _return_itis(
-            mean_duration=mean_duration,
-            minimal_duration=minimal_duration,
-            maximal_duration=maximal_duration,
-            n_trials=n_trials)
-        nits += 1
-
-    if verbose:
-        print(f'ITIs created with total ITI duration of {round(itis.sum(),2)}s after {nits} iterations')    
-
-    return itis
+    def close(self):
+        """ Write the recorded flip times (and dropped frames per trial) and trial boundary times before closing the session """
+        self.frames.save(opj(self.output_dir, self.output_str+'_frames.npz'))
+        print(self.prefetch.summary())
+        self.prefetch.write(opj(self.output_dir, self.output_str+'_desc-prefetch.tsv'))
+        super().close()
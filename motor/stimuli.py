@@ -1,5 +1,6 @@
 import numpy as np
-from psychopy.visual import TextStim, ShapeStim, RadialStim, MovieStim3
+from psychopy.visual import ShapeStim, RadialStim, MovieStim3
+from lineexps.movies import FrameCache, FrameMovie
 
 
 class FixationCross(object):
@@ -27,8 +28,7 @@ class MotorStim(object):
         self.session = session
 
     def draw(self, text=None, **kwargs):
-        self.text = TextStim(
-            self.session.win, 
+        self.text = self.session.text_pool.get(
             text, 
             height=0.4, 
             pos=(0,-4.5),
@@ -45,10 +45,18 @@ class MotorMovie():
         x,y = self.session.win.size
         new_size = [x*0.7, y*0.7]
 
-        # initialize movies
+        # initialize movies; either decoded once (cached on disk) and played from memory, or decoded live
+        cache_frames = self.session.settings['stimuli'].get('cache_movie_frames', True)
+        if cache_frames:
+            cache = FrameCache(verbose=True)
+
         self.movies = []
         for ix,ii in enumerate(self.session.movie_files):
-            mov = MovieStim3(self.session.win, filename=ii, loop=True, size=new_size)
+            if cache_frames:
+                frames, fps = cache.get_frames(ii, new_size)
+                mov = FrameMovie(self.session.win, frames, fps, size=new_size)
+            else:
+                mov = MovieStim3(self.session.win, filename=ii, loop=True, size=new_size)
             setattr(self, f"movie{ix+1}", mov)
 
             self.movies.append(mov)
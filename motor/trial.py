@@ -1,6 +1,5 @@
 import numpy as np
 from exptools2.core import Trial
-from psychopy.visual import TextStim
 
 class MotorTrial(Trial):
 
@@ -29,23 +28,32 @@ class MotorTrial(Trial):
             Whether to print extra output (mostly timing info)
         """
         super().__init__(session, trial_nr, phase_durations, phase_names,
-                         parameters, timing, load_next_during_phase=None, verbose=verbose)
+                         parameters, timing, load_next_during_phase=session.prefetch.phase, verbose=verbose)
         self.condition  = self.parameters['condition']
         self.session    = session
 
-    def run(self):
+    def prepare(self):
+        # runs during the ITI of the previous trial (see lineexps.prefetch)
         if self.condition == "bilateral":
             self.display_instructions = f"clench BOTH HANDS"
         else:
             self.display_instructions = f"clench {self.condition.upper()} HAND"
 
+        # show correct video
+        self.movie = {
+            "bilateral": self.session.motormovie.movie1,
+            "left": self.session.motormovie.movie2,
+            "right": self.session.motormovie.movie3}[self.condition]
+
+    def run(self):
+        self.session.prefetch.enter(self)
         super().run()
 
     def draw(self):
         if self.phase == 0:
             self.presentation_time = self.session.timer.getTime()
-            if self.presentation_time > -self.session.settings['design'].get('cue_time'):
-                self.session.fixation.setColor(self.session.settings['stimuli'].get('cue_color'))
+            if self.presentation_time > -self.session.cfg.design.cue_time:
+                self.session.fixation.setColor(self.session.cfg.stimuli.cue_color)
                         
         if self.phase == 1:  
 
@@ -56,12 +64,7 @@ class MotorTrial(Trial):
             # self.session.motorstim.draw(text=self.display_instructions)
 
             # show correct video
-            if self.condition == "bilateral":
-                self.session.motormovie.movie1.draw()
-            elif self.condition == "left":
-                self.session.motormovie.movie2.draw()
-            elif self.condition == "right":
-                self.session.motormovie.movie3.draw()                
+            self.movie.draw()
         else:
             self.session.fixation.draw()
 
@@ -83,7 +86,7 @@ class InstructionTrial(Trial):
         if txt is None:
             txt = '''Press any button to continue.'''
 
-        self.text = TextStim(self.session.win, txt, height=txt_height, wrapWidth=txt_width, **kwargs)
+        self.text = self.session.text_pool.get(txt, height=txt_height, wrapWidth=txt_width, **kwargs)
         self.keys = keys
 
     def draw(self):
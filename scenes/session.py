@@ -1,7 +1,5 @@
 import numpy as np
 import os
-import h5py
-import urllib
 from psychopy.visual import GratingStim
 from psychopy import logging
 from exptools2.core import PylinkEyetrackerSession
@@ -14,6 +12,27 @@ from trial import (
     OutroTrial
 )
 import random
+from lineexps.annotations import TrialAnnotations
+from lineexps.assets import AssetStore
+from lineexps.frames import FrameRecorder
+from lineexps.images import ImageTextureCache, LoadReport, dataset_shape, load_all_images, load_images, texture_report
+from lineexps.itis import iterative_itis
+from lineexps.settings import compile_settings
+from lineexps.state import StimState, UpdateCounter
+from lineexps.text import TextPool
+opj = os.path.join
+
+# colour of the image stimuli; negative targets reuse the texture of the image with inverted polarity
+POSITIVE = (1.0, 1.0, 1.0)
+NEGATIVE = (-1.0, -1.0, -1.0)
+
+
+# settings that are read while trials are running
+SETTINGS_SPEC = {
+    "design": {
+        "stim_duration": float},
+    "stimuli": {
+        "frequency": float}}
 
 class ScenesSession(PylinkEyetrackerSession):
     def __init__(self, output_str, output_dir, settings_file, eyetracker_on=False, condition='HC'):
@@ -30,6 +49,19 @@ class ScenesSession(PylinkEyetrackerSession):
             default settings file (in data/default_settings.yml)
         """
         super().__init__(output_str, output_dir=output_dir, settings_file=settings_file, eyetracker_on=eyetracker_on)  # initialize parent class!
+
+        # record flip times to detect dropped frames
+        self.frames = FrameRecorder(self)
+
+        # settings read during trials; validated here, so a missing/mistyped key fails before the run starts
+        self.cfg = compile_settings(self.settings, SETTINGS_SPEC)
+
+        # text stimuli of instruction/delimiter trials are created once and reused
+        self.text_pool = TextPool(self.win)
+
+        # polarity switches of the image stimuli are only pushed when they change
+        self.stim_updates = UpdateCounter()
+
         self.n_trials = self.settings['design'].get('n_trials')
         self.duration = self.settings['design'].get('stim_duration')
         self.frequency = self.settings['stimuli'].get('frequency')
@@ -37,11 +69,12 @@ class ScenesSession(PylinkEyetrackerSession):
         self.isi_file = self.settings['design'].get('isi_file')
         self.target_window_length = self.settings['design'].get('target_window_length')
 
-        # stimulus materials
-        self.stim_file_path = os.path.join(os.path.abspath('../data'), self.settings['stimuli'].get('bg_stim_h5file'))
-        if not os.path.isfile(self.stim_file_path):
-            print(f'Downloading stimulus file from figshare to {self.stim_file_path}')
-            urllib.request.urlretrieve(self.settings['stimuli'].get('bg_stim_url'), self.stim_file_path)
+        # stimulus materials; verified copy from the asset store (downloaded from figshare if needed, unless offline)
+        self.assets = AssetStore()
+        self.stim_file_path = self.assets.resolve_settings(
+            self.settings,
+            self.settings['stimuli'].get('bg_stim_h5file'),
+            os.path.dirname(os.path.abspath(settings_file)))
 
         self.fixation = FixationLines(
             win=self.win, 
@@ -62,74 +95,6 @@ class ScenesSession(PylinkEyetrackerSession):
         self.responses          = 0
         self.total_responses    = 0
 
-        # stimuli
-        h5stimfile = h5py.File(self.stim_file_path, 'r')
-        self.bg_images = (-1 + np.array(h5stimfile.get('stimuli')) / 128)*1
-        h5stimfile.close()
-
-        self.image_bg_stims = [
-            GratingStim(
-                win=self.win,
-                tex=bg_img,
-                units='pix', 
-                mask='raisedCos',
-                texRes=self.bg_images.shape[1],
-                colorSpace='rgb',
-                size=self.settings['stimuli'].get('stim_size_pixels'),
-                interpolate=True)
-            for bg_img in self.bg_images]
-
-        self.image_bg_stims_neg = [
-            GratingStim(
-                win=self.win,
-                tex=bg_img*-1,
-                units='pix', 
-                mask='raisedCos',
-                texRes=self.bg_images.shape[1],
-                colorSpace='rgb',
-                size=self.settings['stimuli'].get('stim_size_pixels'),
-                interpolate=True)
-            for bg_img in self.bg_images]
-
-        # make some examples for the instructions
-        self.example1 = GratingStim(
-            win=self.win,
-            tex=self.bg_images[random.choice(range(0,self.bg_images.shape[0]))],
-            units='pix', 
-            mask='raisedCos',
-            texRes=self.bg_images.shape[1],
-            colorSpace='rgb',
-            size=self.settings['stimuli'].get('stim_size_pixels')*0.6,
-            pos=[0-self.win.size[1]//2, 0],
-            interpolate=True)
-
-        self.example2 = GratingStim(
-            win=self.win,
-            tex=self.bg_images[random.choice(range(0,self.bg_images.shape[0]))]*-1,
-            units='pix', 
-            mask='raisedCos',
-            texRes=self.bg_images.shape[1],
-            colorSpace='rgb',
-            size=self.settings['stimuli'].get('stim_size_pixels')*0.6,
-            pos=[0+self.win.size[1]//2, 0],
-            interpolate=True)
-
-
-        # draw all the bg stimuli once, before they are used in the trials
-        for ibs in self.image_bg_stims:
-            ibs.draw()
-
-        intromask = GratingStim(
-            self.win, 
-            tex=np.ones((4,4)), 
-            contrast=1, 
-            color=(0.0, 0.0, 0.0), 
-            size=self.settings['stimuli'].get('stim_size_pixels'))
-
-        intromask.draw()
-        self.win.flip()
-        self.win.flip()
-
         # ITI stuff
         if self.isi_file == "None":
             itis = iterative_itis(
@@ -146,28 +111,6 @@ class ScenesSession(PylinkEyetrackerSession):
         self.total_experiment_time = itis.sum() + self.settings['design'].get('start_duration') + self.settings['design'].get('end_duration') + (self.n_trials*self.duration)
         print(f"Total experiment time: {round(self.total_experiment_time,2)}s")
         
-        instruction_trial = InstructionTrial(
-            session=self, 
-            trial_nr=0, 
-            phase_durations=[np.inf],
-            txt='Please keep fixating at the center.', 
-            keys=['space'])
-
-        dummy_trial = DummyWaiterTrial(
-            session=self, 
-            trial_nr=1, 
-            phase_durations=[np.inf, self.settings['design'].get('start_duration')],
-            txt='Waiting for experiment to start')
-
-        outro_trial = OutroTrial(
-            session=self, 
-            trial_nr=self.n_trials+2, 
-            phase_durations=[self.settings['design'].get('end_duration')],
-            keys=['q'],
-            txt='')        
-
-        self.trials = [instruction_trial, dummy_trial]
-
         # half of stimuli contains target
         self.contains_target = np.r_[np.ones(self.n_trials//2, dtype=int), np.zeros(self.n_trials//2, dtype=int)]
 
@@ -178,14 +121,16 @@ class ScenesSession(PylinkEyetrackerSession):
         self.missed_responses   = 0
         self.false_alarms       = 0
         self.total_responses    = 0
+
+        # decide which images each trial shows before reading any of them; only the shape of the dataset is needed
+        n_images, tex_res = dataset_shape(self.stim_file_path)[:2]
+        n_per_trial = int(np.ceil(self.frequency*self.duration))+1
+        trial_images = []
         for i in range(self.n_trials):
 
             # create list of random images based on frequency and stim duration
-            self.image_ids = random.sample(range(0, self.bg_images.shape[0]), k=int(np.ceil(self.settings['stimuli'].get('frequency')*self.duration))+1)
+            self.image_ids = random.sample(range(0, n_images), k=n_per_trial)
             
-            # select images
-            self.selected_imgs = [self.image_bg_stims[img] for img in self.image_ids]
-                
             # select index of target image
             if self.contains_target[i] == 1:
                 self.target_on = True
@@ -205,16 +150,96 @@ class ScenesSession(PylinkEyetrackerSession):
                     self.target_idc = self.target_idc[:-1]
                      
                 # pick two random negative images
-                self.negative_idx = random.sample(range(0, self.bg_images.shape[0]), k=self.target_window_length)
-                for ix,idx in enumerate(self.target_idc):
-                    self.selected_imgs[idx] = self.image_bg_stims_neg[self.negative_idx[ix]]
-
+                self.negative_idx = random.sample(range(0, n_images), k=self.target_window_length)
             else:
                 self.target_on = False
                 self.target_idx = None
                 self.target_idc = None
+                self.negative_idx = []
+
+            trial_images.append((self.image_ids, self.target_on, self.target_idx, self.target_idc, self.negative_idx))
+
+        # make some examples for the instructions
+        example_ids = [random.choice(range(0,n_images)), random.choice(range(0,n_images))]
+
+        # read only the images that are shown (or the full dataset, for comparison)
+        if self.settings['stimuli'].get('lazy_image_loading', True):
+            image_ids = set(example_ids).union(*[ids+neg for ids,_,_,_,neg in trial_images])
+            report = LoadReport("Lazy image loading")
+            self.images = load_images(self.stim_file_path, sorted(image_ids))
+        else:
+            report = LoadReport("Full image loading")
+            bg_images = load_all_images(self.stim_file_path)
+            self.images = dict(enumerate(bg_images))
+
+        # textures are uploaded during the ITI before they are shown, and dropped (least recently used first) beyond
+        # the budget; negative targets are drawn from the same texture with an inverted colour
+        budget_mb = self.settings['stimuli'].get('texture_budget_mb', 256)
+        self.image_cache = ImageTextureCache(
+            self.images,
+            lambda img: StimState(self.make_image_stim(img, tex_res), counter=self.stim_updates),
+            tex_res,
+            budget_mb=budget_mb)
+
+        self.example1 = self.make_image_stim(
+            self.images[example_ids[0]], 
+            tex_res,
+            size=self.settings['stimuli'].get('stim_size_pixels')*0.6,
+            pos=[0-self.win.size[1]//2, 0])
+
+        self.example2 = self.make_image_stim(
+            self.images[example_ids[1]], 
+            tex_res,
+            size=self.settings['stimuli'].get('stim_size_pixels')*0.6,
+            pos=[0+self.win.size[1]//2, 0],
+            color=NEGATIVE)
+
+        intromask = GratingStim(
+            self.win, 
+            tex=np.ones((4,4)), 
+            contrast=1, 
+            color=(0.0, 0.0, 0.0), 
+            size=self.settings['stimuli'].get('stim_size_pixels'))
+
+        intromask.draw()
+        self.win.flip()
+        self.win.flip()
+        print(report.done(len(self.images)) + f"; texture budget = {budget_mb}MB (all images: {texture_report(len(self.images)+2, tex_res)})")
+
+        # the instructions show the example images, so they are made after the images are loaded
+        instruction_trial = InstructionTrial(
+            session=self, 
+            trial_nr=0, 
+            phase_durations=[np.inf],
+            txt='Please keep fixating at the center.', 
+            keys=['space'])
+
+        dummy_trial = DummyWaiterTrial(
+            session=self, 
+            trial_nr=1, 
+            phase_durations=[np.inf, self.settings['design'].get('start_duration')],
+            txt='Waiting for experiment to start')
+
+        outro_trial = OutroTrial(
+            session=self, 
+            trial_nr=self.n_trials+2, 
+            phase_durations=[self.settings['design'].get('end_duration')],
+            keys=['q'],
+            txt='')        
+
+        self.trials = [instruction_trial, dummy_trial]
+
+        for i, (image_ids, target_on, target_idx, target_idc, negative_idx) in enumerate(trial_images):
 
-            print(f"Trial #{2+i}; {self.target_idc}")
+            # select images; in the target window, a different image is shown with inverted polarity
+            self.selected_imgs = list(image_ids)
+            polarities = [POSITIVE]*len(image_ids)
+            if target_on:
+                for ix,idx in enumerate(target_idc):
+                    self.selected_imgs[idx] = negative_idx[ix]
+                    polarities[idx] = NEGATIVE
+
+            print(f"Trial #{2+i}; {target_idc}")
 
             self.trials.append(ScenesTrial(
                 session=self,
@@ -223,15 +248,33 @@ class ScenesSession(PylinkEyetrackerSession):
                 phase_durations=[itis[i], self.settings['design'].get('stim_duration')],
                 parameters={
                     'condition': self.condition,
-                    'target': self.target_on,
+                    'target': target_on,
                     'target_onset': None,
-                    'target_idx': self.target_idx},
-                image_objects=self.selected_imgs,
+                    'target_idx': target_idx},
+                image_ids=self.selected_imgs,
+                polarities=polarities,
                 timing='seconds',
                 verbose=True))
                                              
         self.trials.append(outro_trial)
 
+        # target onsets and reaction times are stored per trial during the run, and added to the events log in close()
+        self.annotations = TrialAnnotations([trial.trial_nr for trial in self.trials if isinstance(trial, ScenesTrial)], ["target_onset", "rt"])
+
+    def make_image_stim(self, image, tex_res, size=None, pos=(0,0), color=POSITIVE):
+        """ Raised-cosine masked GratingStim of a background image """
+        return GratingStim(
+            win=self.win,
+            tex=image,
+            units='pix', 
+            mask='raisedCos',
+            texRes=tex_res,
+            colorSpace='rgb',
+            size=self.settings['stimuli'].get('stim_size_pixels') if size is None else size,
+            pos=pos,
+            color=color,
+            interpolate=True)
+
     def create_trial(self):
         pass
 
@@ -247,8 +290,17 @@ class ScenesSession(PylinkEyetrackerSession):
         if self.eyetracker_on:
             self.start_recording_eyetracker()
         for trial in self.trials:
+            self.current_trial = trial
+            self.stim_updates.start_trial(trial.trial_nr)
             trial.run()
 
+        # number of pushed/suppressed polarity updates per trial
+        print(self.stim_updates.summary())
+        self.stim_updates.write(opj(self.output_dir, self.output_str+'_desc-stimupdates.tsv'))
+
+        # draws served from uploaded textures vs. uploads on the frame itself
+        logging.warn(self.image_cache.summary())
+
         self.expected_responses = self.n_trials//2
         # logging.warn(f"Expected {self.expected_responses} responses, received {self.total_responses} ({self.correct_responses} correct; {self.missed_responses} missed)")
         # logging.warn(f"Accuracy = {round(self.correct_responses/self.expected_responses,2)*100}%")
@@ -283,34 +335,8 @@ class ScenesSession(PylinkEyetrackerSession):
         logging.warn(f" D':\t{round(self.dPrime,2)}\t(0=guessing;1=good;2=awesome)")
         self.close()
 
-# iti function based on negative exponential
-def _return_itis(mean_duration, minimal_duration, maximal_duration, n_trials):
-    itis = np.random.exponential(scale=mean_duration-minimal_duration, size=n_trials)
-    itis += minimal_duration
-    itis[itis>maximal_duration] = maximal_duration
-    return itis
-
-def iterative_itis(mean_duration=6, minimal_duration=3, maximal_duration=18, n_trials=None, leeway=0, verbose=False):
-    
-    nits = 0
-    itis = _return_itis(
-        mean_duration=mean_duration,
-        minimal_duration=minimal_duration,
-        maximal_duration=maximal_duration,
-        n_trials=n_trials)
-
-    total_iti_duration = n_trials * mean_duration
-    min_iti_duration = total_iti_duration - leeway
-    max_iti_duration = total_iti_duration + leeway
-    while (itis.sum() < min_iti_duration) | (itis.sum() > max_iti_duration):
-        itis = _return_itis(
-            mean_duration=mean_duration,
-            minimal_duration=minimal_duration,
-            maximal_duration=maximal_duration,
-            n_trials=n_trials)
-        nits += 1
-
-    if verbose:
-        print(f'ITIs created with total ITI duration of {round(itis.sum(),2)}s after {nits} iterations')    
-
-    return itis
+    def close(self):
+        """ Write the recorded flip times (and dropped frames per trial) and add target onsets/RTs to the events log before closing the session """
+        self.frames.save(opj(self.output_dir, self.output_str+'_frames.npz'))
+        self.annotations.merge(self.global_log)
+        super().close()
@@ -1,13 +1,12 @@
 import numpy as np
 from exptools2.core import Trial
-from psychopy.visual import TextStim
 from psychopy.core import getTime
 import math
 
 class ScenesTrial(Trial):
 
     def __init__(self, session, trial_nr, phase_durations, phase_names,
-                 parameters, timing, image_objects=None,
+                 parameters, timing, image_ids=None, polarities=None,
                  verbose=True):
         """ Initializes a StroopTrial object.
 
@@ -28,6 +27,11 @@ class ScenesTrial(Trial):
             The "units" of the phase durations. Default is 'seconds', where we
             assume the phase-durations are in seconds. The other option is
             'frames', where the phase-"duration" refers to the number of frames.
+        image_ids : list
+            Indices of the images to show, one per 1/frequency s; the stimuli are taken from `session.image_cache`,
+            which uploads them during the ITI
+        polarities : list, optional
+            Colour of each image ((1,1,1) is the image as is, (-1,-1,-1) inverted); default is all (1,1,1)
         verbose : bool
             Whether to print extra output (mostly timing info)
         """
@@ -48,7 +52,8 @@ class ScenesTrial(Trial):
         # https://stackoverflow.com/questions/70565925/how-to-disable-duplicated-items-in-random-choice
         # self.image_ids = random.sample(range(0, self.session.bg_images.shape[0]), k=int(np.ceil(self.session.settings['stimuli'].get('frequency')*self.session.duration)))
 
-        self.image_objects  = image_objects
+        self.image_ids      = image_ids
+        self.polarities     = polarities if polarities is not None else [(1.0, 1.0, 1.0)]*len(image_ids)
         self.start_time     = getTime()
         self.trial_nr       = trial_nr
         self.target_on      = parameters['target']
@@ -69,6 +74,10 @@ class ScenesTrial(Trial):
             self.frame_count += 1
             if self.frame_count == 1:
                 print(f"Target: {self.target_on}")
+                self.session.image_cache.prefetch(self.image_ids)
+
+            # upload the images of the coming stimulus phase, one per frame
+            self.session.image_cache.upload_next()
         elif self.phase == 1: 
             total_display_time = (getTime() - self.phase0_time)
             bg_display_frame = int(math.floor(total_display_time * self.session.frequency))
@@ -76,16 +85,19 @@ class ScenesTrial(Trial):
             if bg_display_frame != self.bg_display_frame:
                 self.bg_display_frame = bg_display_frame
             else:
-                # write onset of target to event file
+                # onset of target; added to the event file when the session closes
                 if self.target_on:
                     if bg_display_frame == self.target_idx:
                         self.target_onset = self.session.clock.getTime()
                         self.frame_count2 += 1
                         if self.frame_count2 == 1:
                             print(f"Trial ID: {self.trial_nr}")
-                        self.session.global_log.loc[self.session.global_log["trial_nr"] == self.trial_nr, "target_onset"] = self.target_onset # - self.session.exp_start
+                        self.session.annotations.set(self.trial_nr, "target_onset", self.target_onset)
 
-                self.image_objects[self.bg_display_frame].draw()
+                # images are shared between trials; the polarity is only pushed if it differs from the last draw
+                image = self.session.image_cache.get(self.image_ids[self.bg_display_frame])
+                image.setColor(self.polarities[self.bg_display_frame])
+                image.draw()
 
         self.session.fixation.draw()
         self.session.report_fixation.draw()
@@ -112,6 +124,8 @@ class ScenesTrial(Trial):
                         if r>self.target_onset:
                             RT = r-self.target_onset
                             self.session.correct_responses += 1
+                            if not self.session.annotations.is_set(self.trial_nr, "rt"):
+                                self.session.annotations.set(self.trial_nr, "rt", RT)
                             print(f"\tHIT (RT={round(RT,2)}s)")
                     else:
                         print("Response faster than onset of target")
@@ -137,8 +151,7 @@ class InstructionTrial(Trial):
         if txt is None:
             txt = '''Press any button to continue.'''
 
-        self.text = TextStim(
-            self.session.win, 
+        self.text = self.session.text_pool.get(
             txt,
             height=txt_height, 
             wrapWidth=txt_width, 
@@ -147,16 +160,14 @@ class InstructionTrial(Trial):
         self.keys = keys
 
         # make example textStim
-        self.text_example1 = TextStim(
-            self.session.win, 
+        self.text_example1 = self.session.text_pool.get(
             "Example of POSITIVE image",
             height=txt_height, wrapWidth=txt_width, 
             pos=(self.session.example1.pos[0], self.session.example1.pos[1]-self.session.example1.size[1]//2),
             units='pix', 
             **kwargs)
 
-        self.text_example2 = TextStim(
-            self.session.win, 
+        self.text_example2 = self.session.text_pool.get(
             "Example of NEGATIVE image",
             height=txt_height, wrapWidth=txt_width, 
             pos=(self.session.example2.pos[0], self.session.example2.pos[1]-self.session.example2.size[1]//2),
@@ -223,8 +234,7 @@ class OutroTrial(Trial):
         txt_width = self.session.settings['various'].get('text_width')
 
         txt = ''''''
-        self.text = TextStim(self.session.win, txt,
-                             height=txt_height, wrapWidth=txt_width, **kwargs)
+        self.text = self.session.text_pool.get(txt, height=txt_height, wrapWidth=txt_width, **kwargs)
 
         self.keys = keys
     
@@ -2,11 +2,19 @@ import sys
 import getopt
 from datetime import datetime
 import os
-from psychopy import logging
-from session import SizeResponseSession
 opj = os.path.join
 opd = os.path.dirname
 
+# make the shared `lineexps` package importable when running from the experiment folder
+sys.path.insert(0, opd(opd(os.path.abspath(__file__))))
+
+# `--render` needs an X-display; without a monitor, run it under xvfb-run
+from lineexps.render import Renderer, require_display
+require_display(sys.argv)
+
+from psychopy import logging
+from session import SizeResponseSession
+
 def main(argv):
 
     """main.py
@@ -24,6 +32,7 @@ def main(argv):
         -e|--eye                turn on eyetracker
         --fix_task              task on the stimulus ('contrast' for attention task [default], 'fix' for changing fixation dot)
         --fix                   set task on stimulus to 'fix'
+        --render <file>         render the first frame of every trial phase to a .npy/.h5-file (virtual time; use xvfb-run without a monitor, see lineexps.render)
         -q|--help               bring up this help text
 
     Example
@@ -39,6 +48,7 @@ def main(argv):
     task        = "SRFa"
     hemi        = "L"
     eyetracker  = False
+    render_file = None
     fix_task    = "contrast"
     demo        = False
     eye_flag    = ""
@@ -46,7 +56,7 @@ def main(argv):
     #---------------------------------------------------------------------------------------------------
     # parse arguments
     try:
-        opts = getopt.getopt(argv,"epdqs:n:r:h:t:",["sub=", "ses=", "run=", "hemi=", "eye", "task=", "fix_task=", "help", "demo","lh","rh","stim=","design=","annulus","larger","orig","checker","radial","left","right","fix"])[0]
+        opts = getopt.getopt(argv,"epdqs:n:r:h:t:",["sub=", "ses=", "run=", "hemi=", "eye", "task=", "fix_task=", "help", "demo","lh","rh","stim=","design=","annulus","larger","orig","checker","radial","left","right","fix", "render="])[0]
     except getopt.GetoptError:
         print("ERROR while handling arguments.. Did you specify an 'illegal' argument..?")
         print(main.__doc__)
@@ -70,6 +80,8 @@ def main(argv):
             hemi = "R"
         elif opt in ("--h", "--hemi"):
             hemi = arg
+        elif opt == "--render":
+            render_file = arg
         elif opt in ("-e", "--eye"):
             eyetracker = True
             eye_flag = "--eye"
@@ -83,6 +95,10 @@ def main(argv):
     if run == "demo":
         demo = True
 
+    # nobody is looking at a rendered session
+    if render_file is not None:
+        eyetracker = False
+
     print(f"Subject: \t{subject}")
     print(f"Session: \t{session}")
     print(f"Run ID: \t{run}")
@@ -119,6 +135,9 @@ def main(argv):
 
     session_object.create_trials()
     logging.warn(f'Writing results to: {opj(session_object.output_dir, session_object.output_str)}')
+    if render_file is not None:
+        Renderer(session_object, render_file)
+
     session_object.run()
     session_object.close()
 
@@ -6,10 +6,27 @@ from psychopy.visual import Circle
 import scipy.stats as ss
 from stimuli import FixationLines, SizeResponseStim, pRFCue, FixationCross
 from trial import SizeResponseTrial, InstructionTrial, DummyWaiterTrial, OutroTrial
+from lineexps.fixation import FixationSchedule
+from lineexps.flicker import FlickerSchedule
+from lineexps.frames import FrameRecorder
+from lineexps.itis import iterative_itis
+from lineexps.settings import Default, compile_settings
+from lineexps.state import UpdateCounter
+from lineexps.text import TextPool
 import os
 opj = os.path.join
 opd = os.path.dirname
 
+
+# settings that are read while trials are running
+SETTINGS_SPEC = {
+    "design": {
+        "stim_duration": float},
+    "stimuli": {
+        "frequency": float,
+        "contrasts": list,
+        "lock_flicker_to_frames": Default(bool, False)}}
+
 class SizeResponseSession(PylinkEyetrackerSession):
     def __init__(
         self, 
@@ -46,6 +63,21 @@ class SizeResponseSession(PylinkEyetrackerSession):
             output_dir=output_dir, 
             settings_file=settings_file, 
             eyetracker_on=eyetracker_on)  # initialize parent class!
+
+        # record flip times to detect dropped frames
+        self.frames = FrameRecorder(self)
+
+        # settings read during trials; validated here, so a missing/mistyped key fails before the run starts
+        self.cfg = compile_settings(self.settings, SETTINGS_SPEC)
+
+        # text stimuli of instruction/delimiter trials are created once and reused
+        self.text_pool = TextPool(self.win)
+
+        # contrast reversals of the flickering stimuli; optionally locked to frame boundaries
+        self.flicker = FlickerSchedule(
+            self.cfg.stimuli.frequency,
+            refresh_rate=getattr(self, 'actual_framerate', None),
+            lock_to_frames=self.cfg.stimuli.lock_flicker_to_frames)
         
         self.demo = demo
         self.task = task
@@ -97,6 +129,9 @@ class SizeResponseSession(PylinkEyetrackerSession):
             self.repetitions = 1
             self.custom_isi = True
 
+        # keeps track of (suppressed) stimulus updates per trial
+        self.stim_updates = UpdateCounter()
+
         # make activation stimulus
         self.ActStims = {}
         for ix,ss in enumerate(self.stim_sizes):
@@ -228,9 +263,11 @@ class SizeResponseSession(PylinkEyetrackerSession):
         self.dot_switch_color_times = np.arange(3, self.total_experiment_time*1.5, float(self.settings['Task_settings']['color_switch_interval']))
         self.dot_switch_color_times += (2*np.random.rand(len(self.dot_switch_color_times))-1)
 
-        # needed to keep track of which dot to print
-        self.current_dot_time = 0
-        self.next_dot_time = 1
+        # colour of the fixation dot at any time; disk_1 before the first switch, then alternating. The disks only
+        # exist for the fixation task
+        self.fixation_schedule = None
+        if self.fix_task == "fix":
+            self.fixation_schedule = FixationSchedule(self.dot_switch_color_times, states=[self.fixation_disk_1, self.fixation_disk_0])
 
         outro_trial = OutroTrial(
             session=self,
@@ -242,19 +279,8 @@ class SizeResponseSession(PylinkEyetrackerSession):
 
     def change_fixation(self):
 
-        if self.fix_task == "fix":
-            present_time = self.clock.getTime()
-            if self.next_dot_time<len(self.dot_switch_color_times):
-                if present_time<self.dot_switch_color_times[self.current_dot_time]:                
-                    self.fixation_disk_1.draw()
-                    self.dot_switch_color_times[self.current_dot_time]
-                else:
-                    if present_time<self.dot_switch_color_times[self.next_dot_time]:
-                        self.fixation_disk_0.draw()
-                        self.dot_switch_color_times[self.next_dot_time]
-                    else:
-                        self.current_dot_time+=2
-                        self.next_dot_time+=2 
+        if self.fixation_schedule is not None:
+            self.fixation_schedule(self.clock.getTime()).draw()
         else:
             self.fixation.draw()
 
@@ -291,41 +317,22 @@ class SizeResponseSession(PylinkEyetrackerSession):
         if self.eyetracker_on:
             self.start_recording_eyetracker()
         for trial in self.trials:
+            self.current_trial = trial
+            self.stim_updates.start_trial(trial.trial_nr)
             trial.run()
 
+        # number of pushed/suppressed stimulus updates per trial
+        print(self.stim_updates.summary())
+        self.stim_updates.write(opj(self.output_dir, self.output_str+'_desc-stimupdates.tsv'))
+
         correct = (self.hits/self.n_trials)*100
         logging.warn(f"Performance:\t{round(correct,2)}% ({self.hits}/{self.n_trials})")
 
         self.close()
 
-# iti function based on negative exponential
-def _return_itis(mean_duration, minimal_duration, maximal_duration, n_trials):
-    itis = np.random.exponential(scale=mean_duration-minimal_duration, size=n_trials)
-    itis += minimal_duration
-    itis[itis>maximal_duration] = maximal_duration
-    return itis
-
-def iterative_itis(mean_duration=6, minimal_duration=3, maximal_duration=18, n_trials=None, leeway=0, verbose=False):
-    
-    nits = 0
-    itis = _return_itis(
-        mean_duration=mean_duration,
-        minimal_duration=minimal_duration,
-        maximal_duration=maximal_duration,
-        n_trials=n_trials)
-
-    total_iti_duration = n_trials * mean_duration
-    min_iti_duration = total_iti_duration - leeway
-    max_iti_duration = total_iti_duration + leeway
-    while (itis.sum() < min_iti_duration) | (itis.sum() > max_iti_duration):
-        itis = _return_itis(
-            mean_duration=mean_duration,
-            minimal_duration=minimal_duration,
-            maximal_duration=maximal_duration,
-            n_trials=n_trials)
-        nits += 1
-
-    if verbose:
-        print(f'ITIs created with total ITI duration of {round(itis.sum(),2)}s after {nits} iterations')    
-
-    return itis    
+    def close(self):
+        """ Write the recorded flip times (and dropped frames per trial) and fixation switches before closing the session """
+        self.frames.save(opj(self.output_dir, self.output_str+'_frames.npz'))
+        if self.fixation_schedule is not None:
+            self.fixation_schedule.save(opj(self.output_dir, self.output_str+'_desc-fixationswitches.tsv'))
+        super().close()
@@ -5,6 +5,7 @@ from psychopy.visual import (
     RadialStim, 
     Circle,
     ShapeStim)
+from lineexps.state import StimState
 
 class FixationCross(object):
 
@@ -87,6 +88,7 @@ class SizeResponseStim(object):
         self.border_radius          = self.session.settings['stimuli'].get('border_radius')
         self.pacman_angle           = self.session.settings['stimuli'].get('pacman_angle')
         self.frequency              = self.session.settings['stimuli'].get('frequency')
+        self.stim_duration          = self.session.settings['design'].get('stim_duration')
 
         # construct gradient on the outside of stimuli; avoid hard borders > wonky stuff happens
         mask = np.ones((self.n_mask_pixels))
@@ -113,19 +115,24 @@ class SizeResponseStim(object):
             *args,
             **kwargs)                          
 
+        # only push color changes when the contrast actually changes
+        self.stimulus_1 = StimState(self.stimulus_1, counter=self.session.stim_updates)
+        self.stimulus_2 = StimState(self.stimulus_2, counter=self.session.stim_updates)
+
     def draw(self, contrast=None):
 
-        phase = np.fmod(self.session.settings['design'].get('stim_duration')+self.session.timer.getTime(), 1.0/self.frequency) * self.frequency
+        # contrast-reversal state (0 = first, 1 = second half of the cycle)
+        phase = self.session.flicker(self.stim_duration+self.session.timer.getTime())
 
         # contrast options contains 2 contrast types, low (0.6) and high (1)
-        contrast_options = self.session.settings['stimuli'].get('contrasts')
+        contrast_options = self.session.cfg.stimuli.contrasts
         if contrast == 'low':
             select_contrast = contrast_options[0]
         elif contrast == 'high':
             select_contrast = contrast_options[1]
             
         # update size and contrast
-        if phase < 0.5:
+        if phase == 0:
             self.stimulus_1.setColor(select_contrast)
             self.stimulus_1.draw()
         else:
@@ -9,10 +9,20 @@ from trial import (
     InstructionTrial, 
     DummyWaiterTrial, 
     OutroTrial)
+from lineexps.frames import FrameRecorder
+from lineexps.itis import iterative_itis
+from lineexps.settings import compile_settings
+from lineexps.text import TextPool
 import os
 import yaml
 opj = os.path.join
 
+
+# settings that are read while trials are running
+SETTINGS_SPEC = {
+    "design": {
+        "sync": bool}}
+
 class TwoSidedSession(PylinkEyetrackerSession):
     def __init__(self, output_str, output_dir, settings_file, eyetracker_on=False, condition='HC'):
         """ Initializes StroopSession object.
@@ -29,6 +39,16 @@ class TwoSidedSession(PylinkEyetrackerSession):
         """
 
         super().__init__(output_str, output_dir=output_dir, settings_file=settings_file, eyetracker_on=eyetracker_on)  # initialize parent class!
+
+        # record flip times to detect dropped frames
+        self.frames = FrameRecorder(self)
+
+        # settings read during trials; validated here, so a missing/mistyped key fails before the run starts
+        self.cfg = compile_settings(self.settings, SETTINGS_SPEC)
+
+        # text stimuli of instruction/delimiter trials are created once and reused
+        self.text_pool = TextPool(self.win)
+
         self.dyns = self.settings['design'].get('dyns')
         self.nsa = self.settings['design'].get('nsa')
         self.duration = self.settings['design'].get('stim_duration')
@@ -137,6 +157,7 @@ class TwoSidedSession(PylinkEyetrackerSession):
         if self.eyetracker_on:
             self.start_recording_eyetracker()
         for trial in self.trials:
+            self.current_trial = trial
             trial.run()
 
         self.add_settings = {"presentation_times": f"{[ii for ii in self.present_at]}"}
@@ -151,34 +172,7 @@ class TwoSidedSession(PylinkEyetrackerSession):
 
         self.close()
 
-# iti function based on negative exponential
-def _return_itis(mean_duration, minimal_duration, maximal_duration, n_trials):
-    itis = np.random.exponential(scale=mean_duration-minimal_duration, size=n_trials)
-    itis += minimal_duration
-    itis[itis>maximal_duration] = maximal_duration
-    return itis
-
-def iterative_itis(mean_duration=6, minimal_duration=3, maximal_duration=18, n_trials=None, leeway=0, verbose=False):
-    
-    nits = 0
-    itis = _return_itis(
-        mean_duration=mean_duration,
-        minimal_duration=minimal_duration,
-        maximal_duration=maximal_duration,
-        n_trials=n_trials)
-
-    total_iti_duration = n_trials * mean_duration
-    min_iti_duration = total_iti_duration - leeway
-    max_iti_duration = total_iti_duration + leeway
-    while (itis.sum() < min_iti_duration) | (itis.sum() > max_iti_duration):
-        itis = _return_itis(
-            mean_duration=mean_duration,
-            minimal_duration=minimal_duration,
-            maximal_duration=maximal_duration,
-            n_trials=n_trials)
-        nits += 1
-
-    if verbose:
-        print(f'ITIs created with total ITI duration of {round(itis.sum(),2)}s after {nits} iterations')    
-
-    return itis    
\ No newline at end of file
+    def close(self):
+        """ Write the recorded flip times (and dropped frames per trial) before closing the session """
+        self.frames.save(opj(self.output_dir, self.output_str+'_frames.npz'))
+        super().close()
@@ -1,6 +1,5 @@
 import numpy as np
 from exptools2.core import Trial
-from psychopy.visual import TextStim
 from stimuli import FixationLines
 
 class TwoSidedTrial(Trial):
@@ -80,7 +79,7 @@ class TwoSidedTrial(Trial):
             for key, t in events:
                 if key == self.session.mri_trigger:
                     #marco edit. the second bit is a hack to avoid double-counting of the first t when simulating a scanner
-                    if self.session.settings['design']['sync'] == True and t>0.1:                       
+                    if self.session.cfg.design.sync and t>0.1:                       
                         self.exit_phase=True
                              
 
@@ -98,8 +97,7 @@ class InstructionTrial(Trial):
         if txt is None:
             txt = '''Press any button to continue.'''
 
-        self.text = TextStim(self.session.win, txt,
-                             height=txt_height, wrapWidth=txt_width, **kwargs)
+        self.text = self.session.text_pool.get(txt, height=txt_height, wrapWidth=txt_width, **kwargs)
 
         self.keys = keys
 
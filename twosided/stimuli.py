@@ -38,6 +38,7 @@ class HemiFieldStim(object):
         self.pacman_angle = pacman_angle
         self.n_mask_pixels = n_mask_pixels
         self.frequency = frequency
+        self.stim_duration = self.session.settings['design'].get('stim_duration')
 
         mask = np.ones((n_mask_pixels))
         mask[-int(border_radius*n_mask_pixels):] = (np.cos(np.linspace(0,np.pi,int(border_radius*n_mask_pixels)))+1)/2
@@ -70,9 +71,10 @@ class HemiFieldStim(object):
 
         rotationRate = 0.1  # revs per sec
         t = 0
-        phase = np.fmod(self.session.settings['design'].get('stim_duration')+self.session.timer.getTime(), 1.0/self.frequency) * self.frequency
+        # contrast-reversal state (0 = first, 1 = second half of the cycle)
+        phase = self.session.flicker(self.stim_duration+self.session.timer.getTime())
         
-        if phase < 0.5:         
+        if phase == 0:         
             self.stimulus_1.draw()
         else:         
             self.stimulus_2.draw()
@@ -15,6 +15,14 @@ from datetime import datetime
 from psychopy import logging
 from itertools import product
 import yaml
+
+# make the shared `lineexps` package importable when running from the experiment folder
+sys.path.insert(0, op.dirname(op.dirname(op.abspath(__file__))))
+
+# `--render` needs an X-display; without a monitor, run it under xvfb-run
+from lineexps.render import Renderer, require_display
+require_display(sys.argv)
+
 from session import PRFSession
 
 add_prf = True
@@ -29,6 +37,7 @@ parser.add_argument('subject', default=None, nargs='?')
 parser.add_argument('run', default=None, nargs='?')
 parser.add_argument('hemi', default='L', nargs='?')
 parser.add_argument('eyelink', default=False, nargs='?')
+parser.add_argument('--render', default=None, help="render the first frame of every trial phase to a .npy/.h5-file (virtual time; use xvfb-run without a monitor, see lineexps.render)")
 
 cmd_args = parser.parse_args()
 subject, run, hemi, eyelink = cmd_args.subject, cmd_args.run, cmd_args.hemi, cmd_args.eyelink
@@ -45,7 +54,7 @@ elif run == '0':
 
 logging.warn(f"Targeting following hemisphere: {hemi}")
 
-if eyelink:
+if eyelink and cmd_args.render is None:
     eyetracker_on = True
     logging.warn("Using eyetracker")
 else:
@@ -71,6 +80,9 @@ session_object = PRFSession(output_str=output_str,
                             params_file=params_file,
                             hemi=hemi)
 
+if cmd_args.render is not None:
+    Renderer(session_object, cmd_args.render)
+
 session_object.run()
 
 session_object.create_trials()
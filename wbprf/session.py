@@ -15,18 +15,44 @@ from psychopy import tools
 from exptools2.core.session import Session
 from trial import PRFTrial
 from stim import PRFStim, ApertureStim
+from lineexps.fixation import FixationSchedule
+from lineexps.frames import FrameRecorder
+from lineexps.prefetch import TrialPrefetcher
+from lineexps.scoring import score_fixation_task
+from lineexps.settings import compile_settings
+from lineexps.state import UpdateCounter
+from lineexps.textures import TextureCache
+from lineexps.trials import LazyTrials
 import pandas as pd
 
 opj = os.path.join
 
 
 
+
+# settings that are read while trials are running
+SETTINGS_SPEC = {
+    "mri": {
+        "topup_scan": bool},
+    "PRF stimulus settings": {
+        "Scanner sync": bool,
+        "Screenshot": bool,
+        "Bar step length": float},
+    "Task settings": {
+        "response interval": float}}
+
 class PRFSession(Session):
 
     def __init__(self, output_str, output_dir, settings_file, params_file=None, hemi="L"):
 
         
         super().__init__(output_str=output_str, output_dir=output_dir, settings_file=settings_file)
+
+        # record flip times to detect dropped frames
+        self.frames = FrameRecorder(self)
+
+        # settings read during trials; validated here, so a missing/mistyped key fails before the run starts
+        self.cfg = compile_settings(self.settings, SETTINGS_SPEC)
         
         #if we are scanning, here I set the mri_trigger manually to the 't'. together with the change in trial.py, this ensures syncing
         if self.settings['mri']['topup_scan']==True:
@@ -64,7 +90,12 @@ class PRFSession(Session):
 
     def create_stimuli(self):
         
-        #generate PRF stimulus
+        #generate PRF stimulus; checkerboards are read from the on-disk texture cache
+        self.texture_cache = TextureCache()
+        self.stim_updates = UpdateCounter()
+
+        #with 'Lazy trials', the next trial is created during the current one (exptools2's load_next_during_phase)
+        self.prefetch = TrialPrefetcher(self, enabled=self.settings['PRF stimulus settings'].get('Lazy trials', False), trials="trial_list")
         self.prf_stim = PRFStim(session=self, 
                         squares_in_bar=self.settings['PRF stimulus settings']['Squares in bar'], 
                         bar_width_deg=self.settings['PRF stimulus settings']['Bar width in degrees'],
@@ -153,10 +184,8 @@ class PRFSession(Session):
         """creates trials by setting up prf stimulus sequence"""
         self.trial_list=[]
         
-        #simple tools to check subject responses online
-        self.correct_responses = 0
-        self.total_responses = 0
-        self.dot_count = 0
+        #times of subject responses; scored against the dot color changes after the run
+        self.response_times = []
         
         bar_orientations = np.array(self.settings['PRF stimulus settings']['Bar orientations'])
         #create as many trials as TRs. 5 extra TRs at beginning + bar passes + blanks
@@ -196,17 +225,11 @@ class PRFSession(Session):
         #random bar direction at each step. could also make this time-based
         self.bar_direction_at_TR = np.round(np.random.rand(self.trial_number))
         
-        #trial list
-        for i in range(self.trial_number):
-                
-            self.trial_list.append(PRFTrial(session=self,
-                                            trial_nr=i,
-                                               
-                           bar_orientation=self.bar_orientation_at_TR[i],
-                           bar_position_in_ori=self.bar_pos_in_ori[i],
-                           bar_direction=self.bar_direction_at_TR[i]
-                           #,tracker=self.tracker
-                           ))
+        #trial list; with 'Lazy trials', each trial is created during the previous one and released when it's done
+        if self.settings['PRF stimulus settings'].get('Lazy trials', False):
+            self.trial_list = LazyTrials(self.make_trial, self.trial_number)
+        else:
+            self.trial_list = [self.make_trial(i) for i in range(self.trial_number)]
 
 
         #times for dot color change. continue the task into the topup
@@ -221,14 +244,27 @@ class PRFSession(Session):
         self.dot_switch_color_times += (2*np.random.rand(len(self.dot_switch_color_times))-1)
         
         
-        #needed to keep track of which dot to print
-        self.current_dot_time=0
-        self.next_dot_time=1
+        #colour of the fixation dot at any time; disk_1 before the first switch, then alternating
+        self.fixation_schedule = FixationSchedule(self.dot_switch_color_times, states=[self.fixation_disk_1, self.fixation_disk_0])
 
         #only for testing purposes
         np.save(opj(self.output_dir, self.output_str+'_DotSwitchColorTimes.npy'), self.dot_switch_color_times)
         print(self.win.size)
 
+    def make_trial(self, i):
+        """trial for TR `i`, from the bar orientation/position/direction at that TR"""
+        return PRFTrial(session=self,
+                        trial_nr=i,
+                        bar_orientation=self.bar_orientation_at_TR[i],
+                        bar_position_in_ori=self.bar_pos_in_ori[i],
+                        bar_direction=self.bar_direction_at_TR[i]
+                        #,tracker=self.tracker
+                        )
+
+    def create_trial(self, trial_nr=None):
+        """called by exptools2 during `load_next_during_phase` of the previous trial"""
+        self.prefetch.prepare(trial_nr)
+
     def draw_stimulus(self):
         #this timing is only used for the motion of checkerboards inside the bar. it does not have any effect on the actual bar motion
         present_time = self.clock.getTime()
@@ -245,16 +281,8 @@ class PRFSession(Session):
                                bar_direction=self.current_trial.bar_direction)
             
             
-        #hacky way to draw the correct dot color. could be improved
-        if self.next_dot_time<len(self.dot_switch_color_times):
-            if present_time<self.dot_switch_color_times[self.current_dot_time]:                
-                self.fixation_disk_1.draw()
-            else:
-                if present_time<self.dot_switch_color_times[self.next_dot_time]:
-                    self.fixation_disk_0.draw()
-                else:
-                    self.current_dot_time+=2
-                    self.next_dot_time+=2
+        #draw the dot in the colour of the current interval of the fixation task
+        self.fixation_schedule(present_time).draw()
                     
         #self.fixation_circle.draw()
 
@@ -270,14 +298,16 @@ class PRFSession(Session):
         for trial_idx in range(len(self.trial_list)):
             self.current_trial = self.trial_list[trial_idx]
             self.current_trial_start_time = self.clock.getTime()
+            self.stim_updates.start_trial(self.current_trial.trial_nr)
             self.current_trial.run()
         
-        print(f"Expected number of responses: {len(self.dot_switch_color_times)}")
-        print(f"Total subject responses: {self.total_responses}")
-        print(f"Correct responses (within {self.settings['Task settings']['response interval']}s of dot color change): {self.correct_responses}")
-        np.save(opj(self.output_dir, self.output_str+'_simple_response_data.npy'), {"Expected number of responses":len(self.dot_switch_color_times),
-        														                      "Total subject responses":self.total_responses,
-        														                      f"Correct responses (within {self.settings['Task settings']['response interval']}s of dot color change)":self.correct_responses})
+        #number of pushed/suppressed position/orientation updates per trial
+        print(self.stim_updates.summary())
+        if isinstance(self.trial_list, LazyTrials):
+            print(self.trial_list.summary())
+        self.stim_updates.write(opj(self.output_dir, self.output_str+'_desc-stimupdates.tsv'))
+        
+        self.save_response_data()
         
         #print('Percentage of correctly answered trials: %.2f%%'%(100*self.correct_responses/len(self.dot_switch_color_times)))
         
@@ -287,5 +317,29 @@ class PRFSession(Session):
             
         self.close()
 
+    def save_response_data(self):
+        """score responses against the dot color changes and save the results"""
+        score = score_fixation_task(
+            self.fixation_schedule,
+            self.response_times,
+            self.cfg.task_settings.response_interval,
+            fname=opj(self.output_dir, self.output_str+'_desc-fixationtask.tsv'))
+
+        print(f"Expected number of responses: {int(score['n_switches'])}")
+        print(f"Total subject responses: {int(score['n_responses'])}")
+        print(f"Correct responses (within {self.cfg.task_settings.response_interval}s of dot color change): {int(score['hits'])}")
+        print(f"False alarms: {int(score['false_alarms'])}, median RT: {round(score['rt_median'],3)}s")
+        np.save(opj(self.output_dir, self.output_str+'_simple_response_data.npy'), {"Expected number of responses":int(score['n_switches']),
+                                                                                  "Total subject responses":int(score['n_responses']),
+                                                                                  f"Correct responses (within {self.cfg.task_settings.response_interval}s of dot color change)":int(score['hits'])})
+
+    def close(self):
+        """ Write the recorded flip times (and dropped frames per trial), fixation switches and trial boundary times before closing the session """
+        self.frames.save(opj(self.output_dir, self.output_str+'_frames.npz'))
+        print(self.prefetch.summary())
+        self.prefetch.write(opj(self.output_dir, self.output_str+'_desc-prefetch.tsv'))
+        self.fixation_schedule.save(opj(self.output_dir, self.output_str+'_desc-fixationswitches.tsv'))
+        super().close()
+
         
 
@@ -8,6 +8,9 @@ Created on Mon Feb 25 14:07:02 2019
 import numpy as np
 from psychopy import visual
 from psychopy import tools
+from lineexps.flicker import PhaseSelector
+from lineexps.state import StimState
+from lineexps.textures import memory_report
 
 class ApertureStim(object):   
 
@@ -48,94 +51,46 @@ class PRFStim(object):
         #calculate the bar width in pixels, with respect to the texture
         self.bar_width_in_pixels = tools.monitorunittools.deg2pix(bar_width_deg, self.session.monitor)*self.tex_nr_pix/self.session.win.size[1]
         
-        
-        #construct basic space for textures
-        bar_width_in_radians = np.pi*self.squares_in_bar
-        bar_pixels_per_radian = bar_width_in_radians/self.bar_width_in_pixels
-        pixels_ls = np.linspace((-self.tex_nr_pix/2)*bar_pixels_per_radian,(self.tex_nr_pix/2)*bar_pixels_per_radian,self.tex_nr_pix)
-
-        tex_x, tex_y = np.meshgrid(pixels_ls, pixels_ls)
-        
-        #construct textues, alsoand making sure that also the single-square bar is centered in the middle
-        if squares_in_bar==1:
-            self.sqr_tex = np.sign(np.sin(tex_x-np.pi/2) * np.sin(tex_y))
-            self.sqr_tex_phase_1 = np.sign(np.sin(tex_x-np.pi/2) * np.sin(tex_y+np.sign(np.sin(tex_x-np.pi/2))*np.pi/4))
-            self.sqr_tex_phase_2 = np.sign(np.sign(np.abs(tex_x-np.pi/2)) * np.sin(tex_y+np.pi/2))
-        else:                
-            self.sqr_tex = np.sign(np.sin(tex_x) * np.sin(tex_y))   
-            self.sqr_tex_phase_1 = np.sign(np.sin(tex_x) * np.sin(tex_y+np.sign(np.sin(tex_x))*np.pi/4))
-            self.sqr_tex_phase_2 = np.sign(np.sign(np.abs(tex_x)) * np.sin(tex_y+np.pi/2))
-            
-        
-        bar_start_idx=int(np.round(self.tex_nr_pix/2-self.bar_width_in_pixels/2))
-        bar_end_idx=int(bar_start_idx+self.bar_width_in_pixels)+1
-
-        self.sqr_tex[:,:bar_start_idx] = 0       
-        self.sqr_tex[:,bar_end_idx:] = 0
-
-        self.sqr_tex_phase_1[:,:bar_start_idx] = 0                   
-        self.sqr_tex_phase_1[:,bar_end_idx:] = 0
-
-        self.sqr_tex_phase_2[:,:bar_start_idx] = 0                
-        self.sqr_tex_phase_2[:,bar_end_idx:] = 0
-        
-        
-        #construct stimuli with psychopy and textures in different position/phases
-        self.checkerboard_1 = visual.GratingStim(self.session.win,
-                                                 tex=self.sqr_tex,
-                                                 units='pix',
-                                                 size=[self.session.win.size[1],self.session.win.size[1]])
-        self.checkerboard_2 = visual.GratingStim(self.session.win,
-                                                 tex=self.sqr_tex_phase_1,                                               
-                                                 units='pix',
-                                                 size=[self.session.win.size[1],self.session.win.size[1]])
-        self.checkerboard_3 = visual.GratingStim(self.session.win,
-                                                 tex=self.sqr_tex_phase_2,                                                
-                                                 units='pix',
-                                                 size=[self.session.win.size[1],self.session.win.size[1]])
-        
-        
-        
-        #for reasons of symmetry, some stimuli (4 and 8 in the order) are generated differently  if the bar has only one square
-        if self.squares_in_bar!=1:                
-            self.checkerboard_4 = visual.GratingStim(self.session.win,
-                                                     tex=np.fliplr(self.sqr_tex_phase_1),
-                                                     units='pix',
-                                                     size=[self.session.win.size[1],self.session.win.size[1]])
-            self.checkerboard_8 = visual.GratingStim(self.session.win,
-                                                     tex=-np.fliplr(self.sqr_tex_phase_1),
-                                                     units='pix',
-                                                     size=[self.session.win.size[1],self.session.win.size[1]])
-                
-        else:         
-            self.checkerboard_4 = visual.GratingStim(self.session.win, 
-                                                     tex=np.flipud(self.sqr_tex_phase_1),
-                                                     units='pix',
-                                                     size=[self.session.win.size[1],self.session.win.size[1]])
-            
-            self.checkerboard_8 = visual.GratingStim(self.session.win,
-                                                     tex=-np.flipud(self.sqr_tex_phase_1),
-                                                     units='pix',
-                                                     size=[self.session.win.size[1],self.session.win.size[1]])
-        
-        #all other textures are the same
-        self.checkerboard_5 = visual.GratingStim(self.session.win,
-                                                 tex=-self.sqr_tex,
-                                                 units='pix',
-                                                 size=[self.session.win.size[1],self.session.win.size[1]])
-            
-        self.checkerboard_6 = visual.GratingStim(self.session.win,
-                                                 tex=-self.sqr_tex_phase_1,
-                                                 units='pix',
-                                                 size=[self.session.win.size[1],self.session.win.size[1]])
-            
-        self.checkerboard_7 = visual.GratingStim(self.session.win,
-                                                 tex=-self.sqr_tex_phase_2,
-                                                 units='pix',
-                                                 size=[self.session.win.size[1],self.session.win.size[1]])
-
-            
-
+        #textures are stored as int8 in the on-disk cache; the phase is shifted by pi/4 and the bar is 1 pixel wider.
+        #they come back as plain ndarray views (PsychoPy rejects np.memmap) with values -1, 0 and 1, the range GratingStim
+        #expects after its conversion to float32. the flipped textures below are ndarray views as well
+        self.textures = self.session.texture_cache.get_bar_textures(self.bar_width_in_pixels,
+                                                                    self.squares_in_bar,
+                                                                    tex_nr_pix=self.tex_nr_pix,
+                                                                    geometry=self.session.texture_cache.geometry_from_session(self.session),
+                                                                    phase_shift=np.pi/4,
+                                                                    end_pad=1)
+
+        self.sqr_tex = self.textures[0]
+        self.sqr_tex_phase_1 = self.textures[1]
+        self.sqr_tex_phase_2 = self.textures[2]
+
+        #for reasons of symmetry, texture 4 (and 8) is flipped differently if the bar has only one square
+        if self.squares_in_bar!=1:
+            self.sqr_tex_phase_1_flip = np.fliplr(self.sqr_tex_phase_1)
+        else:
+            self.sqr_tex_phase_1_flip = np.flipud(self.sqr_tex_phase_1)
+
+        #construct stimuli with psychopy and textures in different position/phases. Stimuli 5-8 are the negatives of
+        #1-4; instead of negated copies of the textures, they share the arrays and are drawn with color=-1
+        textures = [self.sqr_tex, self.sqr_tex_phase_1, self.sqr_tex_phase_2, self.sqr_tex_phase_1_flip]
+        for ix, tex in enumerate(textures*2):
+            setattr(self, f"checkerboard_{ix+1}", visual.GratingStim(self.session.win,
+                                                                     tex=tex,
+                                                                     units='pix',
+                                                                     color=[1,-1][ix//4],
+                                                                     size=[self.session.win.size[1],self.session.win.size[1]]))
+
+        #the octant of the flicker cycle (0-7) selects checkerboard_1..8 (reversed for the other bar direction). position
+        #and orientation are only pushed when they change (i.e., once per TR rather than on every frame)
+        self.checkerboards = [StimState(getattr(self, f"checkerboard_{ix+1}"), counter=self.session.stim_updates) for ix in range(8)]
+        self.phase_selector = PhaseSelector(self.flicker_frequency, refresh_rate=getattr(self.session, "actual_framerate", None))
+
+        print(self.memory_report())
+
+    def memory_report(self):
+        """ Memory taken by the textures of this stimulus, together with the memory of the process """
+        return memory_report("PRFStim", [self.sqr_tex, self.sqr_tex_phase_1, self.sqr_tex_phase_2, self.sqr_tex_phase_1_flip])
         
     #this is the function that actually draws the stimulus. the sequence of different textures gives the illusion of motion.
     def draw(self, time, pos_in_ori, orientation,  bar_direction):
@@ -143,79 +98,10 @@ class PRFStim(object):
         #calculate position of the bar in relation to its orientation
         x_pos, y_pos = np.cos((2.0*np.pi)*-orientation/360.0)*pos_in_ori, np.sin((2.0*np.pi)*-orientation/360.0)*pos_in_ori
         
-        #convert current time to sine/cosine to decide which texture to draw
-        sin = np.sin(2*np.pi*time*self.flicker_frequency)
-        cos = np.cos(2*np.pi*time*self.flicker_frequency)
-
-        #set position, orientation, texture, and draw bar. bar moving up or down simply has reversed order of presentation
-        if bar_direction==0:
-            if sin > 0 and cos > 0 and cos > sin:
-                self.checkerboard_1.setPos([x_pos, y_pos])
-                self.checkerboard_1.setOri(orientation)
-                self.checkerboard_1.draw()
-            elif sin > 0 and cos > 0 and cos < sin:
-                self.checkerboard_2.setPos([x_pos, y_pos])
-                self.checkerboard_2.setOri(orientation)
-                self.checkerboard_2.draw()
-            elif sin > 0 and cos < 0 and np.abs(cos) < sin:
-                self.checkerboard_3.setPos([x_pos, y_pos])
-                self.checkerboard_3.setOri(orientation)
-                self.checkerboard_3.draw()
-            elif sin > 0 and cos < 0 and np.abs(cos) > sin:
-                self.checkerboard_4.setPos([x_pos, y_pos])
-                self.checkerboard_4.setOri(orientation)
-                self.checkerboard_4.draw()
-            elif sin < 0 and cos < 0 and cos < sin:
-                self.checkerboard_5.setPos([x_pos, y_pos])
-                self.checkerboard_5.setOri(orientation)
-                self.checkerboard_5.draw()
-            elif sin < 0 and cos < 0 and cos > sin:
-                self.checkerboard_6.setPos([x_pos, y_pos])
-                self.checkerboard_6.setOri(orientation)
-                self.checkerboard_6.draw()
-            elif sin < 0 and cos > 0 and cos < np.abs(sin):
-                self.checkerboard_7.setPos([x_pos, y_pos])
-                self.checkerboard_7.setOri(orientation)
-                self.checkerboard_7.draw()
-            else:
-                self.checkerboard_8.setPos([x_pos, y_pos])
-                self.checkerboard_8.setOri(orientation)
-                self.checkerboard_8.draw()
-        else:
-            if sin > 0 and cos > 0 and cos > sin:
-                self.checkerboard_8.setPos([x_pos, y_pos])
-                self.checkerboard_8.setOri(orientation)
-                self.checkerboard_8.draw()
-            elif sin > 0 and cos > 0 and cos < sin:
-                self.checkerboard_7.setPos([x_pos, y_pos])
-                self.checkerboard_7.setOri(orientation)
-                self.checkerboard_7.draw()
-            elif sin > 0 and cos < 0 and np.abs(cos) < sin:
-                self.checkerboard_6.setPos([x_pos, y_pos])
-                self.checkerboard_6.setOri(orientation)
-                self.checkerboard_6.draw()
-            elif sin > 0 and cos < 0 and np.abs(cos) > sin:
-                self.checkerboard_5.setPos([x_pos, y_pos])
-                self.checkerboard_5.setOri(orientation)
-                self.checkerboard_5.draw()
-            elif sin < 0 and cos < 0 and cos < sin:
-                self.checkerboard_4.setPos([x_pos, y_pos])
-                self.checkerboard_4.setOri(orientation)
-                self.checkerboard_4.draw()
-            elif sin < 0 and cos < 0 and cos > sin:
-                self.checkerboard_3.setPos([x_pos, y_pos])
-                self.checkerboard_3.setOri(orientation)
-                self.checkerboard_3.draw()
-            elif sin < 0 and cos > 0 and cos < np.abs(sin):
-                self.checkerboard_2.setPos([x_pos, y_pos])
-                self.checkerboard_2.setOri(orientation)
-                self.checkerboard_2.draw()
-            else:
-                self.checkerboard_1.setPos([x_pos, y_pos])
-                self.checkerboard_1.setOri(orientation)
-                self.checkerboard_1.draw()            
-            
-
-
-
+        #look up which texture to draw at the current time. bar moving up or down simply uses the reversed table
+        checkerboard = self.checkerboards[self.phase_selector(time, bar_direction)]
 
+        #set position, orientation, texture, and draw bar
+        checkerboard.setPos([x_pos, y_pos])
+        checkerboard.setOri(orientation)
+        checkerboard.draw()
@@ -8,7 +8,6 @@ Created on Mon Feb 25 14:06:36 2019
 
 from exptools2.core.trial import Trial
 from psychopy import event
-import numpy as np
 import os
 
 opj = os.path.join
@@ -27,24 +26,30 @@ class PRFTrial(Trial):
         self.session=session
 
         #here we decide how to go from each trial (bar position) to the next.    
-        if self.session.settings['PRF stimulus settings']['Scanner sync']==True:
+        if self.session.cfg.prf_stimulus_settings.scanner_sync:
             #dummy value: if scanning or simulating a scanner, everything is synced to the output 't' of the scanner
             phase_durations = [100]
         else:
             #if not synced to a real or simulated scanner, take the bar pass step as length
-            phase_durations = [self.session.settings['PRF stimulus settings']['Bar step length']] 
+            phase_durations = [self.session.cfg.prf_stimulus_settings.bar_step_length] 
             
         #add topup time to last trial
-        if self.session.settings['mri']['topup_scan']==True:
+        if self.session.cfg.mri.topup_scan:
             if self.ID == self.session.trial_number-1:
                 phase_durations=[self.session.topup_scan_duration]
             
 
         super().__init__(session, trial_nr,
             phase_durations, verbose=False,
+            load_next_during_phase=session.prefetch.phase,
             *args,
             **kwargs)
 
+    def run(self):
+        #with 'Lazy trials', this trial was created while the previous one ran (see lineexps.prefetch)
+        self.session.prefetch.enter(self)
+        super().run()
+
     
     def draw(self, *args, **kwargs):
         # draw bar stimulus and circular (raised cosine) aperture from Session class
@@ -59,11 +64,9 @@ class PRFTrial(Trial):
         if events:
             if 'q' in [ev[0] for ev in events]:  # specific key in settings?
 
-                np.save(opj(self.session.output_dir, self.session.output_str+'_simple_response_data.npy'), {"Expected number of responses":len(self.session.dot_switch_color_times),
-                                                                                  "Total subject responses":self.session.total_responses,
-                                                                                  f"Correct responses (within {self.session.settings['Task settings']['response interval']}s of dot color change)":self.session.correct_responses})
+                self.session.save_response_data()
            
-                if self.session.settings['PRF stimulus settings']['Screenshot']==True:
+                if self.session.cfg.prf_stimulus_settings.screenshot:
                     self.session.win.saveMovieFrames(opj(self.session.screen_dir, self.session.output_str+'_Screenshot.png'))
                      
                 self.session.close()
@@ -74,25 +77,16 @@ class PRFTrial(Trial):
                 if key == self.session.mri_trigger:
                     event_type = 'pulse'
                     #marco edit. the second bit is a hack to avoid double-counting of the first t when simulating a scanner
-                    if self.session.settings['PRF stimulus settings']['Scanner sync']==True and t>0.1:                       
+                    if self.session.cfg.prf_stimulus_settings.scanner_sync and t>0.1:                       
                         self.exit_phase=True
                         #ideally, for speed, would want  getMovieFrame to be called right after the first winflip. 
                         #but this would have to be dun from inside trial.run()
-                        if self.session.settings['PRF stimulus settings']['Screenshot']==True:
+                        if self.session.cfg.prf_stimulus_settings.screenshot:
                             self.session.win.getMovieFrame()
                 else:
                     event_type = 'response'
-                    self.session.total_responses += 1
-                     
-                    #tracking percentage of correct responses per session
-                    if self.session.dot_count < len(self.session.dot_switch_color_times): 
-                        if t > self.session.dot_switch_color_times[self.session.dot_count] and \
-                            t < self.session.dot_switch_color_times[self.session.dot_count] + float(self.session.settings['Task settings']['response interval']):
-                            self.session.correct_responses +=1 
-                            # print(f'number correct responses: {self.session.correct_responses}') #testing
-                             
-
-
+                    #scored after the run
+                    self.session.response_times.append(t)
  
                 idx = self.session.global_log.shape[0]
                 self.session.global_log.loc[idx, 'trial_nr'] = self.trial_nr
@@ -111,11 +105,5 @@ class PRFTrial(Trial):
                 if key != self.session.mri_trigger:
                     self.last_resp = key
                     self.last_resp_onset = t
-        
-        #update counter
-        if self.session.dot_count < len(self.session.dot_switch_color_times): 
-            if self.session.clock.getTime() > self.session.dot_switch_color_times[self.session.dot_count] + \
-                float(self.session.settings['Task settings']['response interval'])+0.1: #to give time to respond
-                self.session.dot_count += 1   
-                # print(f'dot count: {self.session.dot_count}') #testing
+
     